@@ -0,0 +1,67 @@
+# Optional asyncio runtime: inputs, timers, state notifications, MQTT and commands on one event loop
+import asyncio
+import logging
+import TimerManager
+import mqtt
+from Clock import get_clock, in_loop_thread
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_THREADS = 'threads'
+RUNTIME_ASYNCIO = 'asyncio'
+
+
+def install(loop=None):
+    """Switch the process-wide services to the asyncio variants and return the loop.
+
+    Call before anything creates Timers or starts MQTT: new Timers become
+    loop.call_later() callbacks (TimerManager.LoopScheduler) and MQTT is sent
+    and received from loop callbacks (mqtt.AsyncPublishQueue, AsyncMqttLink).
+    State notifications (PaketBoxState.LoopNotifier) and checkpoint writes
+    (Checkpoint.LoopCheckpointWriter) are set up per box by the caller.
+    """
+    if loop is None:
+        loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    TimerManager.use_loop(loop)
+    mqtt.use_loop(loop)
+    logger.info("asyncio-Betrieb: Eingänge, Timer, Zustandsmeldungen und MQTT laufen in einem Event-Loop.")
+    return loop
+
+
+async def drive(engine, report=None, report_interval=None):
+    """Control loop of the asyncio runtime; replaces the wait()/sample() loop of the threaded mode.
+
+    Edges (from the GPIO library's callback thread) and InputEngine.post()
+    wake the loop through an asyncio.Event; posted work such as MQTT commands
+    runs before each sample. report() is called every report_interval seconds.
+    """
+    loop = asyncio.get_running_loop()
+    woken = asyncio.Event()
+
+    def wake():
+        if in_loop_thread(loop):
+            woken.set()
+        else:
+            loop.call_soon_threadsafe(woken.set)
+
+    engine.wake = wake
+    clock = get_clock()
+    report_interval = report_interval or Config.SAMPLE_STATS_INTERVAL
+    next_report = clock.now() + report_interval
+    while True:
+        engine.update_rate()
+        timeout = engine.timeout()
+        if report is not None:
+            timeout = min(timeout, max(0.0, next_report - clock.now()))
+        try:
+            await asyncio.wait_for(woken.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        woken.clear()
+        engine.run_posted()
+        engine.sample()
+        if report is not None and clock.now() >= next_report:
+            report()
+            next_report += report_interval
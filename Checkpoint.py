@@ -0,0 +1,254 @@
+# Crash-safe checkpoint of one box: state, running timers and output register
+import os
+import json
+import time
+import threading
+import logging
+from PaketBoxState import DoorState, MotorState, ANY_ERROR, unpack
+from TimerManager import Timer
+from Clock import in_loop_thread
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+# Outputs restored from a checkpoint: lights and door lock. The motor relays stay
+# off, running motors are restarted by PaketBoxController.resume_timer().
+_RESTORED_OUTPUTS = range(4, 8)
+
+
+class CheckpointWriter:
+    """Writes dirty checkpoints on one thread, at most once per interval.
+
+    Changes within interval seconds are batched into one write per checkpoint,
+    so a delivery cycle costs a handful of writes instead of one per transition.
+    One writer can serve many Checkpointers (fleet mode).
+    """
+    def __init__(self, interval=None):
+        self.interval = interval if interval is not None else Config.CHECKPOINT_INTERVAL
+        self._dirty = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def mark(self, checkpointer):
+        with self._cond:
+            self._dirty.add(checkpointer)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="CheckpointWriter", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+            time.sleep(self.interval)  # weitere Änderungen sammeln
+            with self._cond:
+                batch, self._dirty = self._dirty, set()
+            for checkpointer in batch:
+                checkpointer.flush()
+
+
+class LoopCheckpointWriter:
+    """CheckpointWriter for the asyncio runtime: writes from a loop.call_later() callback.
+
+    Same batching as CheckpointWriter without a thread; the write (with its
+    fsync) runs on the loop at most once per interval.
+    """
+    def __init__(self, loop, interval=None):
+        self.loop = loop
+        self.interval = interval if interval is not None else Config.CHECKPOINT_INTERVAL
+        self._dirty = set()
+        self._scheduled = False
+
+    def mark(self, checkpointer):
+        if in_loop_thread(self.loop):
+            self._mark(checkpointer)
+        else:
+            self.loop.call_soon_threadsafe(self._mark, checkpointer)
+
+    def _mark(self, checkpointer):
+        self._dirty.add(checkpointer)
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_later(self.interval, self._write)
+
+    def _write(self):
+        self._scheduled = False
+        batch, self._dirty = self._dirty, set()
+        for checkpointer in batch:
+            checkpointer.flush()
+
+
+class _OutputRegister:
+    """Wraps a GPIO backend and keeps the last level written to each output"""
+    def __init__(self, gpio, pins, on_change):
+        self._gpio = gpio
+        self._on_change = on_change
+        self.levels = {pin: gpio.input(pin) for pin in pins}
+
+    def output(self, pin, state):
+        self._gpio.output(pin, state)
+        if pin in self.levels and self.levels[pin] != state:
+            self.levels[pin] = state
+            self._on_change()
+
+    def __getattr__(self, name):
+        return getattr(self._gpio, name)
+
+
+class Checkpointer:
+    """Saves the restart-relevant state of a PaketBoxController to path.
+
+    A checkpoint holds the packed PaketBoxState, the remaining time of every
+    scheduled TimerManager timer and the output register, as compact JSON.
+    After attach() every state transition, timer change and output write marks
+    the checkpoint dirty; the CheckpointWriter batches the writes. Each write
+    goes to a temporary file that is fsynced and then renamed over path, so a
+    crash leaves either the old or the new checkpoint, never a torn one.
+
+    On startup restore() reconciles the checkpoint with the live inputs and
+    resumes the timers, so the box continues where it stopped instead of
+    running a full ResetDoors() cycle.
+    """
+    def __init__(self, controller, path, writer=None):
+        self.controller = controller
+        self.path = path
+        self.writer = writer if writer is not None else CheckpointWriter()
+        self._lock = threading.Lock()
+        self._register = None
+
+    def attach(self):
+        """Track the controller from now on and write a first checkpoint"""
+        controller = self.controller
+        self._register = controller.gpio = _OutputRegister(controller.gpio, controller.outputs, self.mark_dirty)
+        controller.state.subscribe(self._state_changed)
+        controller.timer_manager.on_change = self.mark_dirty
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        self.writer.mark(self)
+
+    def _state_changed(self, change):
+        self.mark_dirty()
+
+    def capture(self):
+        """Checkpoint of the current state as a dict"""
+        controller = self.controller
+        timers = {}
+        for timer_id, timer in list(controller.timer_manager.active_timers.items()):
+            if timer is not None and timer.state == Timer.SCHEDULED:
+                timers[timer_id] = round(max(0.0, timer.deadline - timer.scheduler.clock.now()), 3)
+        if self._register is not None:
+            outputs = [self._register.levels[pin] for pin in controller.outputs]
+        else:
+            outputs = [controller.gpio.input(pin) for pin in controller.outputs]
+        return {
+            'v': CHECKPOINT_VERSION,
+            'wall': round(time.time(), 3),
+            'state': int(controller.state.snapshot()),
+            'outputs': outputs,
+            'timers': timers,
+        }
+
+    def flush(self):
+        """Write the checkpoint now. Returns False if writing failed."""
+        data = json.dumps(self.capture(), separators=(',', ':'))
+        tmp = self.path + '.tmp'
+        with self._lock:
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                self._sync_directory()
+                return True
+            except OSError as e:
+                self.controller.logger.error(f"Checkpoint {self.path} konnte nicht geschrieben werden: {e}")
+                return False
+
+    def _sync_directory(self):
+        """Make the rename durable (not available on Windows)"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def load(self):
+        """The saved checkpoint as a dict, None if there is none or it is unusable"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('v') != CHECKPOINT_VERSION:
+                raise ValueError(f"Version {data.get('v')}")
+            snapshot = unpack(data['state'])
+            str(snapshot)  # ungültige Feldwerte lösen hier IndexError aus
+            return data
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+            self.controller.logger.warning(f"Checkpoint {self.path} unbrauchbar: {e}")
+            return None
+
+    def restore(self):
+        """Continue from the saved checkpoint. Call after initialize_door_states().
+
+        Returns True if the checkpoint matched the live inputs and was applied;
+        False means the caller should fall back to ResetDoors().
+        """
+        controller = self.controller
+        log = controller.logger
+        data = self.load()
+        if data is None:
+            return False
+        saved = unpack(data['state'])
+        if saved & ANY_ERROR:
+            log.info("Checkpoint im Fehlerzustand - vollständiger Reset.")
+            return False
+
+        gpio = controller.gpio
+        doors = {}
+        for field, motor, closed_input, open_input in (('left_door', saved.left_motor, 0, 1),
+                                                       ('right_door', saved.right_motor, 2, 3)):
+            if gpio.input(controller.inputs[closed_input]) == gpio.LOW:
+                live = DoorState.CLOSED
+            elif gpio.input(controller.inputs[open_input]) == gpio.LOW:
+                live = DoorState.OPEN
+            else:
+                live = None  # Klappe zwischen den Endlagen
+            running = motor in (MotorState.OPENING, MotorState.CLOSING)
+            if live is None:
+                if not running:
+                    log.info(f"Checkpoint passt nicht: {field} zwischen den Endlagen ohne laufenden Motor.")
+                    return False
+                live = getattr(saved, field)
+            elif live != getattr(saved, field) and not running:
+                log.info(f"Checkpoint passt nicht: {field} ist {live.name}, gespeichert {getattr(saved, field).name}.")
+                return False
+            doors[field] = live
+
+        downtime = max(0.0, time.time() - data['wall'])
+        controller.state.transition(left_door=doors['left_door'], right_door=doors['right_door'],
+                                    paket_tuer=saved.paket_tuer,
+                                    left_motor=saved.left_motor, right_motor=saved.right_motor)
+        outputs = data['outputs']
+        for index in _RESTORED_OUTPUTS:
+            if index < len(outputs) and index < len(controller.outputs):
+                gpio.output(controller.outputs[index], outputs[index])
+        for timer_id, remaining in data['timers'].items():
+            controller.resume_timer(timer_id, remaining, downtime)
+        log.info(f"Zustand aus Checkpoint übernommen ({downtime:.1f} s Ausfall, "
+                 f"{len(data['timers'])} Timer): {controller.state}")
+
+        # Pakettür während des Ausfalls geöffnet oder geschlossen: Flanke nachholen
+        saved_level = gpio.HIGH if saved.paket_tuer == DoorState.OPEN else gpio.LOW
+        live_level = gpio.input(controller.inputs[4])
+        if live_level != saved_level:
+            controller.pinChanged(4, saved_level, live_level)
+        return True
@@ -0,0 +1,113 @@
+# Time source for timers, input sampling and the main loop
+import time
+import asyncio
+
+
+class MonotonicClock:
+    """Real time based on time.monotonic()"""
+    virtual = False
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        """Wait for a threading.Event, at most timeout seconds"""
+        return event.wait(timeout)
+
+
+class VirtualClock:
+    """Simulated time that jumps straight to the next timer deadline.
+
+    TimerSchedulers created with a VirtualClock do not start a worker thread;
+    their timers run synchronously whenever the clock is advanced past their
+    deadline. This lets a full motor cycle (65 s + checks) or the 900 s door
+    watchdog run in milliseconds.
+    """
+    virtual = True
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._schedulers = []
+
+    def now(self):
+        return self._now
+
+    def attach(self, scheduler):
+        """Called by TimerScheduler so the clock can run its due timers"""
+        self._schedulers.append(scheduler)
+
+    def next_deadline(self):
+        deadlines = [d for d in (s.next_deadline() for s in self._schedulers) if d is not None]
+        return min(deadlines) if deadlines else None
+
+    def _step(self, target, event=None):
+        """Run timers due up to target; stop early once event is set"""
+        while event is None or not event.is_set():
+            deadline = self.next_deadline()
+            if deadline is None or deadline > target:
+                break
+            self._now = max(self._now, deadline)
+            for scheduler in list(self._schedulers):
+                scheduler.run_due()
+        if event is not None and event.is_set():
+            return True
+        self._now = max(self._now, target)
+        return False
+
+    def advance(self, seconds):
+        """Move time forward by seconds, running every timer that becomes due"""
+        self._step(self._now + seconds)
+
+    def run_until_idle(self, limit=None):
+        """Run timers until none are left or limit seconds of virtual time have passed.
+
+        Returns the virtual time that elapsed.
+        """
+        start = self._now
+        target = start + limit if limit is not None else float('inf')
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > target:
+                break
+            self._step(deadline)
+        return self._now - start
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def wait(self, event, timeout=None):
+        """Advance until event is set (by a timer) or timeout has elapsed"""
+        if event.is_set():
+            return True
+        if timeout is None:
+            deadline = self.next_deadline()
+            if deadline is None:
+                return False
+            return self._step(deadline, event)
+        return self._step(self._now + timeout, event)
+
+
+def in_loop_thread(loop):
+    """True if called from the thread running the asyncio loop (asyncio runtime)"""
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+_clock = MonotonicClock()
+
+
+def get_clock():
+    """The process-wide clock"""
+    return _clock
+
+
+def set_clock(clock):
+    """Replace the process-wide clock, returns the previous one"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
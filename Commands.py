@@ -0,0 +1,121 @@
+# Remote commands over MQTT: validated on the network thread, executed on the control thread
+import json
+import logging
+import mqtt
+from mqtt import Event
+from Clock import get_clock
+from LatencyMonitor import STAGE_HANDLER
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Command name -> PaketBoxController method (called without arguments)
+COMMANDS = {
+    'reset_error': 'ResetErrorState',
+    'reset_doors': 'ResetDoors',
+    'open_flaps': 'Klappen_oeffnen',
+    'emergency_stop': 'notHaltMotoren',
+    'light_on': 'setLigthtPaketboxOn',
+    'light_off': 'setLigthtPaketboxOff',
+    'bin_light_on': 'lichtMueltonneOn',
+    'bin_light_off': 'lichtMueltonneOff',
+    'history': 'verlauf_ausgeben',
+}
+
+MAX_ID_LENGTH = 64
+
+
+def parse(payload):
+    """(request id, command) from a payload; raises ValueError with a short error code.
+
+    A payload is either {"id": <str|int, optional>, "cmd": <name>} or just the
+    command name, e.g. from a dashboard button.
+    """
+    if len(payload) > Config.MQTT_COMMAND_MAX_BYTES:
+        raise ValueError('too_long')
+    try:
+        text = payload.decode('utf-8').strip() if isinstance(payload, bytes) else payload.strip()
+    except UnicodeDecodeError:
+        raise ValueError('invalid_encoding') from None
+    if text.startswith('{'):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            raise ValueError('invalid_json') from None
+        request_id, command = data.get('id'), data.get('cmd')
+        if request_id is not None and (not isinstance(request_id, (str, int)) or isinstance(request_id, bool)
+                                       or len(str(request_id)) > MAX_ID_LENGTH):
+            raise ValueError('invalid_id')
+        if not isinstance(command, str):
+            raise ValueError('invalid_command')
+    else:
+        request_id, command = None, text
+    if command not in COMMANDS:
+        raise ValueError('unknown_command')
+    return request_id, command
+
+
+class CommandDispatcher:
+    """Receives commands for one box and runs them on its control thread.
+
+    handle() is the MQTT message handler. It only validates the payload,
+    timestamps it and hands the command to post (InputEngine.post), so a slow
+    handler such as ResetDoors() never runs on the network thread. Every
+    command is acknowledged on Event.COMMAND_ACK:
+
+        {"id":..,"cmd":..,"ok":true,"ms":{"dispatch":..,"handler":..,"output":..}}
+
+    with the milliseconds from reception to the start on the control thread,
+    to the handler call and to the last relay switched (if any), taken from a
+    LatencyMonitor trace like the one of an input edge. The same latencies go
+    into the hourly latency report as event cmd_<name>. Rejected commands are
+    acknowledged with "ok":false and an "error" code.
+    """
+    def __init__(self, controller, post, clock=None):
+        self.controller = controller
+        self.post = post
+        self.clock = clock or get_clock()
+        self.topic = mqtt.box_topic(Config.MQTT_TOPIC_COMMAND, getattr(controller.publisher, 'prefix', None))
+
+    def subscribe(self):
+        mqtt.on_message(self.topic, self.handle)
+
+    def handle(self, payload):
+        received = self.clock.now()
+        try:
+            request_id, command = parse(payload)
+        except ValueError as e:
+            self.controller.logger.warning(f"Befehl abgelehnt ({e}): {payload[:64]!r}")
+            self._ack(None, None, error=str(e))
+            return
+        if not self.post(lambda: self.execute(request_id, command, received)):
+            self.controller.logger.warning(f"Befehl {command} abgelehnt: Steuer-Thread ausgelastet.")
+            self._ack(request_id, command, error='busy')
+
+    def execute(self, request_id, command, received):
+        """Run one command on the control thread and acknowledge it"""
+        controller = self.controller
+        latency = controller.latency
+        controller.logger.info(f"MQTT-Befehl: {command}")
+        latency.begin(f"cmd_{command}", received)
+        error = None
+        try:
+            latency.mark(STAGE_HANDLER)
+            getattr(controller, COMMANDS[command])()
+        except Exception as e:
+            controller.logger.error(f"Befehl {command} fehlgeschlagen: {e}")
+            error = 'failed'
+        finally:
+            stages = latency.end()
+        self._ack(request_id, command, error, stages)
+
+    def _ack(self, request_id, command, error=None, stages=None):
+        publisher = self.controller.publisher
+        if not publisher:
+            return
+        ack = {'id': request_id, 'cmd': command, 'ok': error is None}
+        if error is not None:
+            ack['error'] = error
+        if stages:
+            ack['ms'] = {stage: round(ms, 2) for stage, ms in stages.items()}
+        publisher.publish(Event.COMMAND_ACK, json.dumps(ack, separators=(',', ':')))
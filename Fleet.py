@@ -0,0 +1,239 @@
+# Fleet mode: several Paketboxes driven from one process
+import time
+import json
+import signal
+import logging
+from typing import NamedTuple
+from config import Config
+from Clock import get_clock
+from InputEngine import InputEngine, debounce_windows
+from PaketBoxState import PaketBoxState, StateNotifier, LoopNotifier
+from PaketBoxController import PaketBoxController
+from LatencyMonitor import latency_monitor, InstrumentedGPIO
+from TimerManager import TimerScheduler
+from Checkpoint import Checkpointer, CheckpointWriter, LoopCheckpointWriter
+import AsyncRuntime
+import mqtt
+
+logger = logging.getLogger(__name__)
+
+# Pin ids of boxes on I/O expanders: box k uses EXPANDER_PIN_BASE + k * EXPANDER_PINS_PER_BOX,
+# inputs from offset 0, outputs from offset 16
+EXPANDER_PIN_BASE = 1000
+EXPANDER_PINS_PER_BOX = 32
+
+
+class BoxConfig(NamedTuple):
+    name: str
+    inputs: list        # pin ids in the order of Config.INPUTS
+    outputs: list       # pin ids in the order of Config.OUTPUTS
+    topic_prefix: str   # MQTT topics of the box: <topic_prefix>/paketbox, ...
+
+
+def load_boxes(path):
+    """Read the box list of a fleet from a JSON file (Config.FLEET_FILE)"""
+    with open(path, encoding='utf-8') as f:
+        return [BoxConfig(box['name'], list(box['inputs']), list(box['outputs']),
+                          box.get('topic_prefix', f"home/paketbox/{box['name']}"))
+                for box in json.load(f)]
+
+
+def expander_boxes(count):
+    """Pin maps for count boxes with the default wiring on I/O expanders"""
+    boxes = []
+    for k in range(count):
+        base = EXPANDER_PIN_BASE + k * EXPANDER_PINS_PER_BOX
+        boxes.append(BoxConfig(f"box{k}", [base + i for i in range(len(Config.INPUTS))],
+                               [base + 16 + i for i in range(len(Config.OUTPUTS))], f"home/paketbox/box{k}"))
+    return boxes
+
+
+class GpioRouter:
+    """RPi.GPIO API over several backends; every pin call goes to the backend owning the pin"""
+    def __init__(self, backends):
+        """backends: list of (gpio, pins)"""
+        self.backends = [gpio for gpio, _ in backends]
+        self._by_pin = {pin: gpio for gpio, pins in backends for pin in pins}
+        first = self.backends[0]
+        for name in ('BCM', 'OUT', 'IN', 'HIGH', 'LOW', 'RISING', 'FALLING', 'BOTH'):
+            setattr(self, name, getattr(first, name))
+
+    def setmode(self, mode):
+        for gpio in self.backends:
+            gpio.setmode(mode)
+
+    def setup(self, pin, mode):
+        self._by_pin[pin].setup(pin, mode)
+
+    def input(self, pin):
+        return self._by_pin[pin].input(pin)
+
+    def output(self, pin, state):
+        self._by_pin[pin].output(pin, state)
+
+    def add_event_detect(self, pin, edge, callback=None):
+        self._by_pin[pin].add_event_detect(pin, edge, callback=callback)
+
+    def cleanup(self):
+        for gpio in self.backends:
+            gpio.cleanup()
+
+
+def simulated_gpio(boxes, clock=None, **options):
+    """One SimulatedGPIO per box behind a GpioRouter, all on one TimerScheduler"""
+    from GpioSimulator import SimulatedGPIO
+    scheduler = TimerScheduler(clock or get_clock())
+    sims = [SimulatedGPIO(clock=clock, inputs=box.inputs, outputs=box.outputs, scheduler=scheduler, **options)
+            for box in boxes]
+    return GpioRouter([(sim, box.inputs + box.outputs) for sim, box in zip(sims, boxes)])
+
+
+class Fleet:
+    """Several boxes in one process.
+
+    Each box is a PaketBoxController with its own PaketBoxState, TimerManager,
+    history, pin map and MQTT topic prefix. Shared by all boxes: one InputEngine
+    (one sampling loop over the pins of all boxes), the process-wide
+    TimerScheduler, one StateNotifier thread and one MQTT connection. Between
+    two full reads the sampler only reads the pins of boxes that are busy or
+    saw an edge, so idle boxes cost almost nothing.
+    """
+    def __init__(self, gpio, boxes, publisher_factory=mqtt.Publisher, mode=None, clock=None, latency=None,
+                 notifier=None):
+        self.gpio = gpio
+        self.notifier = notifier if notifier is not None else StateNotifier()
+        self.boxes = []
+        # Input number of the shared engine -> (pinChanged of the box, input number within the box)
+        self._route = []
+        self._masks = []  # (box, bit mask of its inputs in the shared engine)
+        pins = []
+        windows = []
+        for box in boxes:
+            controller = PaketBoxController(gpio, state=PaketBoxState(self.notifier),
+                                            publisher=publisher_factory(box.topic_prefix) if publisher_factory else None,
+                                            latency=latency, inputs=box.inputs, outputs=box.outputs, name=box.name)
+            self._masks.append((controller, ((1 << len(box.inputs)) - 1) << len(pins)))
+            self._route.extend((controller.pinChanged, i) for i in range(len(box.inputs)))
+            pins.extend(box.inputs)
+            windows.extend(debounce_windows(len(box.inputs)))
+            self.boxes.append(controller)
+        self.engine = InputEngine(gpio, pins, self.pinChanged, mode=mode, windows=windows, busy=self.busy,
+                                  clock=clock, latency=latency, active_pins=self.active_pins)
+
+    def pinChanged(self, index, oldState, newState):
+        dispatch, local = self._route[index]
+        dispatch(local, oldState, newState)
+
+    def busy(self):
+        """Fast sampling while any box has a motor running or its courier door open"""
+        for box in self.boxes:
+            if box.sampling_busy():
+                return True
+        return False
+
+    def active_pins(self):
+        """Inputs of the busy boxes, read on every sample"""
+        mask = 0
+        for box, bits in self._masks:
+            if box.sampling_busy():
+                mask |= bits
+        return mask
+
+    def start(self):
+        """Read the initial door states of all boxes and start sampling"""
+        levels = []
+        for box in self.boxes:
+            levels.extend(box.initialize_door_states())
+        self.engine.start(levels)
+
+    def run_once(self, limit=None):
+        """One main loop step: wait for an edge, posted work or the sampling timeout, then sample"""
+        self.engine.wait(limit)
+        self.engine.run_posted()
+        return self.engine.sample()
+
+    def verlauf_ausgeben(self, signum=None, frame=None):
+        """SIGUSR1, on the control thread: transition history of every box to the log and MQTT."""
+        for box in self.boxes:
+            box.verlauf_ausgeben()
+
+
+def main(gpio):
+    """Main loop of the fleet mode (Config.FLEET_FILE or Config.FLEET_SIM_BOXES)"""
+    if Config.FLEET_FILE:
+        boxes = load_boxes(Config.FLEET_FILE)
+    else:
+        boxes = expander_boxes(Config.FLEET_SIM_BOXES)
+    if Config.FLEET_SIM_BOXES:
+        gpio = simulated_gpio(boxes)
+    # Jedes GPIO.output() wird für die Flanke-bis-Relais-Latenz erfasst
+    gpio = InstrumentedGPIO(gpio, latency_monitor)
+    loop = None
+    if Config.RUNTIME == AsyncRuntime.RUNTIME_ASYNCIO:
+        loop = AsyncRuntime.install()  # vor allem, was Timer, Zustandsmeldungen oder MQTT startet
+    fleet = Fleet(gpio, boxes, latency=latency_monitor, notifier=LoopNotifier(loop) if loop else None)
+    checkpointers = []
+    if Config.CHECKPOINT_FILE:
+        writer = LoopCheckpointWriter(loop) if loop else CheckpointWriter()  # ein Schreiber für alle Boxen
+        checkpointers = [Checkpointer(box, f"{Config.CHECKPOINT_FILE}.{box.name}", writer) for box in fleet.boxes]
+    try:
+        gpio.setmode(gpio.BCM)
+        for box in boxes:
+            for pin in box.inputs:
+                gpio.setup(pin, gpio.IN)
+            for output in box.outputs:
+                gpio.setup(output, gpio.OUT)
+                gpio.output(output, gpio.HIGH)
+
+        mqtt.start_mqtt()  # eine Verbindung für alle Boxen
+        for box in fleet.boxes:
+            box.publisher.publish(mqtt.Event.STATUS, f"{time.strftime('%Y-%m-%d %H:%M:%S')} Paketbox bereit.")
+            box.subscribe_error_reports()
+            box.subscribe_state_reports()
+            box.subscribe_commands(fleet.engine.post)  # ein Steuer-Thread für die Befehle aller Boxen
+        if hasattr(signal, 'SIGUSR1'):
+            if loop:
+                loop.add_signal_handler(signal.SIGUSR1, fleet.verlauf_ausgeben)
+            else:
+                # Der Handler unterbricht den Hauptloop, evtl. mitten in einem Lock: nur übergeben
+                signal.signal(signal.SIGUSR1,
+                              lambda signum, frame: fleet.engine.post(fleet.verlauf_ausgeben, wake=False))
+        fleet.start()
+
+        logger.info(f"Flotte mit {len(fleet.boxes)} Boxen gestartet. Strg+C zum Beenden drücken.")
+        for k, box in enumerate(fleet.boxes):
+            if not checkpointers or not checkpointers[k].restore():
+                box.ResetDoors()
+        for checkpointer in checkpointers:
+            checkpointer.attach()
+
+        def report_stats():
+            fleet.engine.stats.log_report()
+            fleet.engine.stats.reset()
+            latency_monitor.log_report()
+            logger.info(f"MQTT-Sende-Queue: {mqtt.queue_stats()}")
+            logger.info(f"MQTT-Verbindung: {mqtt.connection_stats()}")
+            mqtt.publish_latency(latency_monitor.to_json())
+
+        if loop:
+            loop.run_until_complete(AsyncRuntime.drive(fleet.engine, report_stats))  # endet nur mit Strg+C
+        else:
+            clock = get_clock()
+            next_stats_report = clock.now() + Config.SAMPLE_STATS_INTERVAL
+            while True:
+                fleet.run_once()
+                if clock.now() >= next_stats_report:
+                    report_stats()
+                    next_stats_report += Config.SAMPLE_STATS_INTERVAL
+
+    except KeyboardInterrupt:
+        logger.info("Beendet mit Strg+C")
+    except Exception as e:
+        logger.error(f"[Flotte] Fehler: {e}")
+    finally:
+        for checkpointer in checkpointers:
+            checkpointer.flush()
+        gpio.cleanup()
+        logger.info("GPIO aufgeräumt.")
+        mqtt.stop_mqtt()
+        logger.info("MQTT gestoppt.")
@@ -0,0 +1,212 @@
+# Discrete-event simulation of the Paketbox hardware behind the GPIO API
+import threading
+import logging
+from config import Config
+from TimerManager import Timer, TimerScheduler
+from Clock import get_clock
+
+logger = logging.getLogger(__name__)
+
+
+class Flap:
+    """One emptying flap, driven by a close and an open relay (active LOW).
+
+    position 0.0 = geschlossen/oben, 1.0 = offen/unten. The end switches are
+    LOW while the flap sits in the respective end position.
+    """
+    def __init__(self, sim, name, closed_input, open_input, close_output, open_output):
+        self.sim = sim
+        self.name = name
+        self.closed_input = closed_input
+        self.open_input = open_input
+        self.close_output = close_output
+        self.open_output = open_output
+        self.position = 0.0
+        self.direction = 0
+        self.since = 0.0
+        self.stalled = False
+        self._arrival = None
+
+    def position_at(self, now):
+        if self.direction == 0:
+            return self.position
+        moved = (now - self.since) / self.sim.travel_time
+        return min(1.0, max(0.0, self.position + self.direction * moved))
+
+    def update_drive(self):
+        """Re-evaluate the relays after an output change"""
+        now = self.sim.clock.now()
+        self.position = self.position_at(now)
+        self.since = now
+        if self._arrival is not None:
+            self._arrival.cancel()
+            self._arrival = None
+
+        closing = self.sim.outputs.get(self.close_output) == self.sim.LOW
+        opening = self.sim.outputs.get(self.open_output) == self.sim.LOW
+        direction = (1 if opening else 0) - (1 if closing else 0)
+        if self.stalled:
+            direction = 0
+        self.direction = direction
+        if direction == 0:
+            return
+
+        target = 1.0 if direction > 0 else 0.0
+        if self.position == target:
+            return
+        # Leaving an end position releases its switch
+        self.sim.set_input(self.closed_input, self.sim.HIGH)
+        self.sim.set_input(self.open_input, self.sim.HIGH)
+        remaining = abs(target - self.position) * self.sim.travel_time
+        self._arrival = Timer(remaining, self._arrive, scheduler=self.sim.scheduler)
+        self._arrival.start()
+
+    def _arrive(self):
+        with self.sim._lock:
+            self._arrival = None
+            self.position = 1.0 if self.direction > 0 else 0.0
+            self.since = self.sim.clock.now()
+            self.direction = 0
+        if self.position >= 1.0:
+            self.sim.set_input(self.open_input, self.sim.LOW)
+        else:
+            self.sim.set_input(self.closed_input, self.sim.LOW)
+
+
+class SimulatedGPIO:
+    """GPIO replacement that models the box physically.
+
+    Driving OUTPUTS[0..3] moves the flaps over travel_time seconds and flips
+    the end switches on INPUTS[0..3]. The courier door (INPUTS[4]) can only
+    be opened while the lock relay OUTPUTS[7] is not LOW. Faults can be
+    injected: stall_motor(), stick_input() and contact bounce. All events run
+    on a TimerScheduler (pass scheduler to share one between several simulated
+    boxes), so on a VirtualClock the simulation is instantaneous.
+    """
+    BCM = 'BCM'
+    OUT = 'OUT'
+    IN = 'IN'
+    HIGH = 1
+    LOW = 0
+    RISING = 'RISING'
+    FALLING = 'FALLING'
+    BOTH = 'BOTH'
+
+    def __init__(self, clock=None, travel_time=None, bounce_count=0, bounce_period=0.002,
+                 inputs=None, outputs=None, scheduler=None):
+        self.clock = clock or get_clock()
+        self.scheduler = scheduler or TimerScheduler(self.clock)
+        self.travel_time = travel_time if travel_time is not None else Config.SIM_FLAP_TRAVEL_TIME
+        self.bounce_count = bounce_count
+        self.bounce_period = bounce_period
+        self.input_pins = list(inputs if inputs is not None else Config.INPUTS)
+        self.output_pins = list(outputs if outputs is not None else Config.OUTPUTS)
+        self._lock = threading.RLock()
+        self.levels = {pin: self.HIGH for pin in self.input_pins}
+        self.outputs = {pin: self.HIGH for pin in self.output_pins}
+        self.stuck = {}
+        self.callbacks = {}
+        # Flaps start closed: closed switch LOW, open switch HIGH
+        for index in (0, 2):
+            self.levels[self.input_pins[index]] = self.LOW
+        # Contacts 4..10 start inactive (door closed, no button pressed)
+        for index in range(4, len(self.input_pins)):
+            self.levels[self.input_pins[index]] = self.LOW
+        self.flaps = [
+            Flap(self, 'links', self.input_pins[0], self.input_pins[1], self.output_pins[0], self.output_pins[1]),
+            Flap(self, 'rechts', self.input_pins[2], self.input_pins[3], self.output_pins[2], self.output_pins[3]),
+        ]
+
+    # region GPIO API
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, mode):
+        pass
+
+    def output(self, pin, state):
+        with self._lock:
+            if self.outputs.get(pin) == state:
+                return
+            self.outputs[pin] = state
+            for flap in self.flaps:
+                if pin in (flap.close_output, flap.open_output):
+                    flap.update_drive()
+
+    def input(self, pin):
+        if pin in self.stuck:
+            return self.stuck[pin]
+        if pin in self.levels:
+            return self.levels[pin]
+        return self.outputs.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self):
+        self.callbacks.clear()
+    # endregion
+
+    # region Physical events
+    def set_input(self, pin, level, bounce=True):
+        """Change the physical level of an input pin (with contact bounce if configured)"""
+        with self._lock:
+            if self.levels.get(pin) == level:
+                return
+            self.levels[pin] = level
+        self._notify(pin)
+        if bounce and self.bounce_count:
+            opposite = self.LOW if level == self.HIGH else self.HIGH
+            for k in range(1, 2 * self.bounce_count + 1):
+                bounced = opposite if k % 2 else level
+                Timer(k * self.bounce_period, self._bounce, args=[pin, bounced],
+                      scheduler=self.scheduler).start()
+
+    def _bounce(self, pin, bounced):
+        with self._lock:
+            self.levels[pin] = bounced
+        self._notify(pin)
+
+    def _notify(self, pin):
+        callback = self.callbacks.get(pin)
+        if callback is not None and pin not in self.stuck:
+            callback(pin)
+
+    def set_contact(self, index, active):
+        """Set contact INPUTS[index] (4..10) active (HIGH) or inactive"""
+        self.set_input(self.input_pins[index], self.HIGH if active else self.LOW)
+
+    def door_locked(self):
+        return self.outputs.get(self.output_pins[7]) == self.LOW
+
+    def open_courier_door(self):
+        """Courier opens the delivery door. Returns False if it is locked."""
+        if self.door_locked():
+            return False
+        self.set_contact(4, True)
+        return True
+
+    def close_courier_door(self):
+        self.set_contact(4, False)
+    # endregion
+
+    # region Fault injection
+    def stall_motor(self, flap_index, stalled=True):
+        """Motor of flap 0 (links) or 1 (rechts) no longer moves the flap"""
+        with self._lock:
+            flap = self.flaps[flap_index]
+            flap.stalled = stalled
+            flap.update_drive()
+
+    def stick_input(self, index, level):
+        """INPUTS[index] reads level regardless of the physical state"""
+        self.stuck[self.input_pins[index]] = level
+
+    def release_input(self, index):
+        pin = self.input_pins[index]
+        self.stuck.pop(pin, None)
+        self._notify(pin)
+    # endregion
@@ -0,0 +1,362 @@
+# Input handling: edge-driven GPIO sampling with polling fallback
+import threading
+import collections
+import logging
+import time
+from config import Config
+from Clock import get_clock
+
+logger = logging.getLogger(__name__)
+
+MODE_INTERRUPT = 'interrupt'
+MODE_POLL = 'poll'
+
+RATE_ACTIVE = 'active'  # motor running or courier door open
+RATE_IDLE = 'idle'
+
+
+def debounce_windows(count):
+    """Debounce window in seconds for each of the first count inputs"""
+    return [Config.DEBOUNCE_TIMES.get(i, Config.DEBOUNCE_TIME) for i in range(count)]
+
+
+class SamplingStats:
+    """Per sampling rate counters: samples, time spent sampling and detection latency.
+
+    The latency of a change runs from its edge (interrupt mode) or the first
+    sample that saw it (poll mode) to the sample that confirmed it. Its lag is
+    the part beyond the debounce window, i.e. what the sampling rate adds.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.data = {rate: {'samples': 0, 'sample_time': 0.0, 'active_time': 0.0,
+                            'changes': 0, 'latency_sum': 0.0, 'latency_max': 0.0,
+                            'lag_sum': 0.0, 'lag_max': 0.0}
+                     for rate in (RATE_ACTIVE, RATE_IDLE)}
+
+    def record_sample(self, rate, duration, interval):
+        entry = self.data[rate]
+        entry['samples'] += 1
+        entry['sample_time'] += duration
+        entry['active_time'] += interval
+
+    def record_change(self, rate, latency, window):
+        entry = self.data[rate]
+        lag = max(0.0, latency - window)
+        entry['changes'] += 1
+        entry['latency_sum'] += latency
+        entry['latency_max'] = max(entry['latency_max'], latency)
+        entry['lag_sum'] += lag
+        entry['lag_max'] = max(entry['lag_max'], lag)
+
+    def report(self):
+        """Summary per rate: sample frequency, CPU share of sampling, latency and lag in ms"""
+        summary = {}
+        for rate, entry in self.data.items():
+            samples = entry['samples']
+            summary[rate] = {
+                'samples': samples,
+                'rate_hz': samples / entry['active_time'] if entry['active_time'] else 0.0,
+                'sample_us': entry['sample_time'] / samples * 1e6 if samples else 0.0,
+                'cpu_percent': entry['sample_time'] / entry['active_time'] * 100 if entry['active_time'] else 0.0,
+                'changes': entry['changes'],
+                'latency_avg_ms': entry['latency_sum'] / entry['changes'] * 1000 if entry['changes'] else 0.0,
+                'latency_max_ms': entry['latency_max'] * 1000,
+                'lag_avg_ms': entry['lag_sum'] / entry['changes'] * 1000 if entry['changes'] else 0.0,
+                'lag_max_ms': entry['lag_max'] * 1000,
+            }
+        return summary
+
+    def log_report(self):
+        for rate, r in self.report().items():
+            logger.info(f"Abtastung {rate}: {r['samples']} Abfragen, {r['rate_hz']:.1f} Hz, "
+                        f"{r['sample_us']:.0f} µs/Abfrage, CPU {r['cpu_percent']:.2f}%, "
+                        f"{r['changes']} Änderungen, Latenz avg {r['latency_avg_ms']:.1f} ms / "
+                        f"max {r['latency_max_ms']:.1f} ms, davon nach Entprellung avg "
+                        f"{r['lag_avg_ms']:.1f} ms / max {r['lag_max_ms']:.1f} ms")
+
+
+class InputEngine:
+    """Detects level changes on the input pins and reports them to a callback.
+
+    In interrupt mode GPIO.add_event_detect wakes the engine as soon as an edge
+    occurs; the pins are additionally re-read every INPUT_RESYNC_INTERVAL seconds
+    so a missed edge cannot leave the state stale. Poll mode reads all pins every
+    POLL_INTERVAL seconds and is used as fallback if edge detection is unavailable.
+
+    A level change is only reported after the pin has stayed at the new level for
+    its debounce window (Config.DEBOUNCE_TIMES / DEBOUNCE_TIME). Any edge on the pin
+    or a sample showing the old level again restarts the window.
+
+    While busy() returns True (motor cycle, courier door open) the inputs are read
+    every SAMPLE_INTERVAL_ACTIVE seconds regardless of the mode.
+
+    With a LatencyMonitor every dispatched change is traced from the edge that
+    started its debounce window (or the sample that first saw it in poll mode).
+
+    active_pins (interrupt mode, many pins such as a fleet of boxes) returns the
+    bit mask of the inputs that need every sample, e.g. the pins of busy boxes.
+    A sample then reads only those, the pins with an edge and the pending ones;
+    all pins are read every INPUT_RESYNC_INTERVAL seconds.
+    """
+    def __init__(self, gpio, pins, on_change, mode=None, windows=None, oversampling=None, busy=None, clock=None,
+                 latency=None, active_pins=None):
+        self.gpio = gpio
+        self.pins = list(pins)
+        self.on_change = on_change
+        self.mode = mode or Config.INPUT_MODE
+        self.windows = list(windows) if windows is not None else debounce_windows(len(self.pins))
+        self.oversampling = oversampling or Config.INPUT_OVERSAMPLING
+        self.busy = busy
+        self.rate = RATE_IDLE
+        self.stats = SamplingStats()
+        # Last debounced input levels, bit i = level of pins[i] (1 = HIGH)
+        self.snapshot = 0
+        self._bits = [(1 << i, pin) for i, pin in enumerate(self.pins)]
+        self._bit_of_pin = {pin: bit for bit, pin in self._bits}
+        self.active_pins = active_pins
+        self._next_full_read = 0.0  # with active_pins: time of the next read of all pins
+        # Debounce state: pins waiting for confirmation and since when
+        self._pending = 0
+        self._since = [0.0] * len(self.pins)
+        self._edges = 0
+        self._edge_lock = threading.Lock()
+        # Latency tracing: time of the last edge per bit and origin of each pending change
+        self.latency = latency
+        self._edge_times = {}
+        self._origin = [0.0] * len(self.pins)
+        self._event_names = [(f"input{i}_falling", f"input{i}_rising") for i in range(len(self.pins))]
+        self.clock = clock or get_clock()
+        self._now = self.clock.now
+        self._last_sample = self._now()
+        self._wakeup = threading.Event()
+        # Called on an edge or post(); the asyncio runtime replaces it to wake its loop instead of wait()
+        self.wake = self._wakeup.set
+        self._lock = threading.Lock()
+        self._posted = collections.deque()  # work for the control thread, see post()
+
+    def start(self, status=None):
+        """Take over the initial pin levels and register edge detection"""
+        if status is not None:
+            self.snapshot = self.word_from_levels(status)
+        self._last_sample = self._now()
+
+        if self.mode == MODE_INTERRUPT:
+            try:
+                for pin in self.pins:
+                    self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._on_edge)
+            except Exception as e:
+                logger.warning(f"Interrupt-Erkennung nicht verfügbar ({e}) - verwende Polling.")
+                self.mode = MODE_POLL
+        elif self.mode != MODE_POLL:
+            logger.warning(f"Unbekannter Eingabemodus '{self.mode}' - verwende Polling.")
+            self.mode = MODE_POLL
+
+        logger.info(f"Eingabe-Engine gestartet im Modus '{self.mode}'.")
+
+    def _on_edge(self, channel):
+        """GPIO callback: only note the edge and wake the sampling thread"""
+        bit = self._bit_of_pin.get(channel, 0)
+        with self._edge_lock:
+            self._edges |= bit
+            self._edge_times[bit] = self._now()
+        self.wake()
+
+    def post(self, work, wake=True):
+        """Hand work() to the control thread (the one calling wait()/run_posted()) and wake it.
+
+        Returns False if CONTROL_QUEUE_SIZE jobs are already waiting. Signal
+        handlers pass wake=False: they run on the main thread, which may hold
+        the lock of the wakeup Event, so the work waits for the current wait()
+        to time out instead.
+        """
+        if len(self._posted) >= Config.CONTROL_QUEUE_SIZE:
+            return False
+        self._posted.append(work)
+        if wake:
+            self.wake()
+        return True
+
+    def run_posted(self):
+        """Run the work handed over by post(), in order. Returns the number of jobs run."""
+        count = 0
+        while self._posted:
+            work = self._posted.popleft()
+            count += 1
+            try:
+                work()
+            except Exception as e:
+                logger.error(f"Fehler in übergebener Aufgabe {getattr(work, '__name__', work)}: {e}")
+        return count
+
+    def update_rate(self):
+        """Switch between active and idle sampling depending on busy()"""
+        rate = RATE_ACTIVE if self.busy is not None and self.busy() else RATE_IDLE
+        if rate != self.rate:
+            logger.info(f"Abtastrate gewechselt: {self.rate} -> {rate}")
+            self.rate = rate
+        return rate
+
+    def timeout(self):
+        """Seconds to wait for an edge before the pins are read anyway"""
+        if self.rate == RATE_ACTIVE:
+            timeout = Config.SAMPLE_INTERVAL_ACTIVE
+        elif self.mode == MODE_INTERRUPT:
+            timeout = Config.INPUT_RESYNC_INTERVAL
+        else:
+            timeout = Config.POLL_INTERVAL
+        if self._pending:
+            # Wake up exactly when the first pending pin can be confirmed
+            timeout = min(timeout, max(0.0, self.next_deadline() - self._now()))
+        return timeout
+
+    def next_deadline(self):
+        """Earliest time at which a pending level change can be confirmed"""
+        deadline = None
+        pending = self._pending
+        while pending:
+            low = pending & -pending
+            pending ^= low
+            i = low.bit_length() - 1
+            candidate = self._since[i] + self.windows[i]
+            if deadline is None or candidate < deadline:
+                deadline = candidate
+        return deadline
+
+    def wait(self, limit=None):
+        """Block until an edge was signalled or the mode timeout (at most limit) has elapsed.
+
+        Returns True if woken by an edge.
+        """
+        self.update_rate()
+        timeout = self.timeout()
+        if limit is not None:
+            timeout = min(timeout, limit)
+        woken = self.clock.wait(self._wakeup, timeout)
+        self._wakeup.clear()
+        return woken
+
+    def word_from_levels(self, levels):
+        """Pack a list of pin levels (index = input number) into a snapshot word"""
+        word = 0
+        for bit, level in zip(self._bits, levels):
+            if level == self.gpio.HIGH:
+                word |= bit[0]
+        return word
+
+    def read_word(self, mask=None):
+        """Read all inputs (or those in mask) into one integer, bit i = pins[i] is HIGH"""
+        gpio_input = self.gpio.input
+        high = self.gpio.HIGH
+        word = 0
+        if mask is not None:
+            pins = self.pins
+            while mask:
+                low = mask & -mask
+                mask ^= low
+                if gpio_input(pins[low.bit_length() - 1]) == high:
+                    word |= low
+            return word
+        for bit, pin in self._bits:
+            if gpio_input(pin) == high:
+                word |= bit
+        return word
+
+    def read_majority(self, mask=None):
+        """Read all inputs (or those in mask) oversampling times, each bit is decided by majority vote"""
+        args = () if mask is None else (mask,)
+        if self.oversampling <= 1:
+            return self.read_word(*args)
+        words = [self.read_word(*args) for _ in range(self.oversampling)]
+        if len(words) == 3:
+            a, b, c = words
+            return (a & b) | (a & c) | (b & c)
+        word = 0
+        for bit, pin in self._bits:
+            if sum(1 for w in words if w & bit) * 2 > len(words):
+                word |= bit
+        return word
+
+    def is_high(self, index):
+        """Last debounced level of input number index"""
+        return bool(self.snapshot >> index & 1)
+
+    def _take_edges(self):
+        """Edge bits and edge times noted by _on_edge since the last call"""
+        with self._edge_lock:
+            edges = self._edges
+            self._edges = 0
+            edge_times = self._edge_times
+            if edge_times:
+                self._edge_times = {}
+        return edges, edge_times
+
+    def sample(self):
+        """Read all inputs, debounce them and dispatch the confirmed changes.
+
+        Returns the bit mask of the inputs that were dispatched.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            if self.active_pins is not None and self.mode == MODE_INTERRUPT and self._now() < self._next_full_read:
+                # Partial read: take the edges first so an edge during the read is kept for the next sample
+                edges, edge_times = self._take_edges()
+                mask = edges | self._pending | self.active_pins()
+                raw = self.read_majority(mask) | self.snapshot & ~mask
+                now = self._now()
+            else:
+                raw = self.read_majority()
+                now = self._now()
+                edges, edge_times = self._take_edges()
+                if self.active_pins is not None:
+                    self._next_full_read = now + Config.INPUT_RESYNC_INTERVAL
+            interval = now - self._last_sample
+            self._last_sample = now
+
+            diff = raw ^ self.snapshot
+            # Pins back at their stable level are no longer pending; new differences
+            # and pending pins that saw another edge (bounce) start a new window
+            restart = diff & (~self._pending | edges)
+            self._pending = diff
+            while restart:
+                low = restart & -restart
+                restart ^= low
+                i = low.bit_length() - 1
+                self._since[i] = now
+                self._origin[i] = edge_times.get(low, now)
+
+            confirmed = 0
+            pending = self._pending
+            while pending:
+                low = pending & -pending
+                pending ^= low
+                i = low.bit_length() - 1
+                if now >= self._since[i] + self.windows[i]:
+                    confirmed |= low
+                    self.stats.record_change(self.rate, now - self._origin[i], self.windows[i])
+            if not confirmed:
+                self.stats.record_sample(self.rate, time.perf_counter() - started, interval)
+                return 0
+
+            self._pending &= ~confirmed
+            self.snapshot ^= confirmed
+            word = self.snapshot
+            changed = confirmed
+            while changed:
+                low = changed & -changed
+                changed ^= low
+                i = low.bit_length() - 1
+                new = 1 if word & low else 0
+                if self.latency is not None:
+                    self.latency.begin(self._event_names[i][new], self._origin[i])
+                    try:
+                        self.on_change(i, new ^ 1, new)
+                    finally:
+                        self.latency.end()
+                else:
+                    self.on_change(i, new ^ 1, new)
+                logger.info(f"GPIO {self.pins[i]} changed: {new ^ 1} -> {new}")
+            self.stats.record_sample(self.rate, time.perf_counter() - started, interval)
+            return confirmed
@@ -0,0 +1,146 @@
+# Edge-to-action latency measurement with fixed-bucket histograms
+import threading
+import logging
+import json
+from bisect import bisect_left
+from Clock import get_clock
+
+logger = logging.getLogger(__name__)
+
+# Stages of an input event, each measured from the edge that triggered it
+STAGE_DISPATCH = 'dispatch'  # change handed to pinChanged() (trace opened)
+STAGE_HANDLER = 'handler'    # first edge handler entered
+STAGE_OUTPUT = 'output'      # last GPIO.output() of the event (all relays switched)
+STAGES = (STAGE_DISPATCH, STAGE_HANDLER, STAGE_OUTPUT)
+
+# Upper bucket bounds in ms; one more bucket collects everything above
+BUCKET_BOUNDS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class LatencyHistogram:
+    """Latency distribution in the fixed buckets BUCKET_BOUNDS_MS"""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket containing the q-quantile (max for the overflow bucket)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(float(bound), self.max_ms)
+        return self.max_ms
+
+    def report(self):
+        return {
+            'count': self.count,
+            'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max_ms,
+            'buckets': list(self.counts),
+        }
+
+
+class _TraceSlot(threading.local):
+    trace = None  # class default: a lookup without open trace does not raise internally
+
+
+class LatencyMonitor:
+    """Collects per event type how long it took from the input edge to each stage.
+
+    The InputEngine opens a trace with begin() before dispatching a confirmed
+    change and closes it with end() afterwards. In between, pinChanged() marks
+    the handler entry and the InstrumentedGPIO the outputs in the same thread. Marks from other
+    threads (timer callbacks) have no open trace and cost only a lookup.
+    """
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.histograms = {}  # event -> {stage: LatencyHistogram}
+        self._lock = threading.Lock()
+        self._local = _TraceSlot()
+
+    def _time(self):
+        return (self.clock or get_clock()).now()
+
+    def begin(self, event, edge_time):
+        """Start a trace for event whose edge was detected at edge_time (clock time).
+
+        Called right before the change is dispatched, so this is also STAGE_DISPATCH.
+        """
+        self._local.trace = {'event': event, 'edge': edge_time, STAGE_DISPATCH: self._time()}
+
+    def mark(self, stage):
+        """Timestamp stage of the open trace; only STAGE_OUTPUT is overwritten by later marks"""
+        trace = self._local.trace
+        if trace is None or (stage in trace and stage != STAGE_OUTPUT):
+            return
+        trace[stage] = self._time()
+
+    def end(self):
+        """Close the open trace and add its stage latencies to the histograms.
+
+        Returns {stage: ms} of the stages reached, None without open trace.
+        """
+        trace = self._local.trace
+        if trace is None:
+            return None
+        self._local.trace = None
+        edge = trace['edge']
+        latencies = {stage: (trace[stage] - edge) * 1000 for stage in STAGES if stage in trace}
+        with self._lock:
+            stages = self.histograms.get(trace['event'])
+            if stages is None:
+                stages = self.histograms[trace['event']] = {stage: LatencyHistogram() for stage in STAGES}
+            for stage, ms in latencies.items():
+                stages[stage].record(ms)
+        return latencies
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def report(self):
+        """{event: {stage: histogram report}} for all events seen so far"""
+        with self._lock:
+            return {event: {stage: histogram.report() for stage, histogram in stages.items()}
+                    for event, stages in sorted(self.histograms.items())}
+
+    def to_json(self):
+        return json.dumps({'bounds_ms': list(BUCKET_BOUNDS_MS), 'events': self.report()})
+
+    def log_report(self):
+        for event, stages in self.report().items():
+            parts = [f"{stage} p50 {r['p50_ms']:.1f} / p99 {r['p99_ms']:.1f} / max {r['max_ms']:.1f} ms"
+                     for stage, r in stages.items() if r['count']]
+            logger.info(f"Latenz {event} ({stages[STAGE_DISPATCH]['count']}x): {', '.join(parts)}")
+
+
+class InstrumentedGPIO:
+    """Wraps a GPIO module and marks STAGE_OUTPUT on every output() call"""
+    def __init__(self, gpio, monitor):
+        self._gpio = gpio
+        self._monitor = monitor
+
+    def output(self, pin, state):
+        self._gpio.output(pin, state)
+        self._monitor.mark(STAGE_OUTPUT)
+
+    def __getattr__(self, name):
+        return getattr(self._gpio, name)
+
+
+latency_monitor = LatencyMonitor()
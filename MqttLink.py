@@ -0,0 +1,264 @@
+# Network loop and reconnect scheduling of the MQTT client
+import time
+import random
+import asyncio
+import threading
+import logging
+from Clock import in_loop_thread
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+STATE_DISCONNECTED = 'disconnected'
+STATE_CONNECTING = 'connecting'   # TCP verbunden, CONNACK steht aus
+STATE_CONNECTED = 'connected'
+
+
+def backoff_delay(attempt, min_delay=None, max_delay=None, rand=random.random):
+    """Wait before reconnect attempt number attempt (1, 2, ...): doubling, capped, jittered.
+
+    The result lies in [d/2, d] with d = min(max_delay, min_delay * 2^(attempt-1)),
+    so boxes that lost the broker together do not all come back at once.
+    """
+    min_delay = min_delay if min_delay is not None else Config.MQTT_RECONNECT_MIN
+    max_delay = max_delay if max_delay is not None else Config.MQTT_RECONNECT_MAX
+    delay = min(max_delay, min_delay * 2 ** min(attempt - 1, 30))
+    return delay / 2 + rand() * delay / 2
+
+
+class MqttLink:
+    """Runs client.loop() on its own thread and reconnects without blocking callbacks.
+
+    Replaces paho's loop_start(): the same thread services the socket while
+    connected and, after the connection is lost, waits a jittered backoff
+    (backoff_delay) and calls client.reconnect() - with no limit on the number
+    of attempts. paho callbacks only report to connected() / disconnected(),
+    which never block. The first connect after start() goes the same way, so
+    an unreachable broker at startup is retried as well.
+
+    stats() reports the connection state, the current outage, the attempts
+    and the time the last reconnect took.
+    """
+    def __init__(self, client, min_delay=None, max_delay=None, loop_timeout=1.0, clock=time.monotonic):
+        self.client = client
+        self.min_delay = min_delay if min_delay is not None else Config.MQTT_RECONNECT_MIN
+        self.max_delay = max_delay if max_delay is not None else Config.MQTT_RECONNECT_MAX
+        self.loop_timeout = loop_timeout
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.state = STATE_DISCONNECTED
+        self._next_attempt = 0.0
+        self._disconnected_since = clock()
+        self._attempts = 0             # Versuche im aktuellen Ausfall
+        self._ever_connected = False   # die erste Verbindung zählt nicht als Reconnect
+        self.total_attempts = 0
+        self.reconnects = 0
+        self.disconnected_time = 0.0   # Summe abgeschlossener Ausfälle in Sekunden
+        self.last_reconnect_time = None
+        self.max_reconnect_time = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="MqttLink", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        try:
+            self.client.disconnect()
+        except Exception as e:
+            logger.debug(f"MQTT-Disconnect: {e}")
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    # region paho callbacks (never block)
+    def connected(self):
+        """CONNACK received (on_connect with rc 0)"""
+        with self._cond:
+            if self.state == STATE_CONNECTED:
+                return
+            outage = self.clock() - self._disconnected_since
+            self.state = STATE_CONNECTED
+            attempts, self._attempts = self._attempts, 0
+            if self._ever_connected:
+                self.disconnected_time += outage
+                self.last_reconnect_time = outage
+                self.max_reconnect_time = max(self.max_reconnect_time, outage)
+                self.reconnects += 1
+            self._ever_connected = True
+        logger.info(f"MQTT verbunden nach {outage:.1f} s ({attempts} Versuche).")
+
+    def disconnected(self):
+        """Connection lost (on_disconnect or a failed loop); schedules the next attempt"""
+        with self._cond:
+            if self.state == STATE_DISCONNECTED:
+                return
+            if self.state == STATE_CONNECTED:
+                self._disconnected_since = self.clock()  # ein abgelehnter Versuch verlängert den Ausfall nur
+            self.state = STATE_DISCONNECTED
+            self._next_attempt = self.clock() + backoff_delay(self._attempts + 1, self.min_delay,
+                                                                          self.max_delay)
+            self._cond.notify_all()
+    # endregion
+
+    def stats(self):
+        with self._cond:
+            now = self.clock()
+            return {
+                'state': self.state,
+                'disconnected_for': round(now - self._disconnected_since, 3) if self.state != STATE_CONNECTED else 0.0,
+                'attempts': self._attempts,
+                'total_attempts': self.total_attempts,
+                'reconnects': self.reconnects,
+                'disconnected_time': round(self.disconnected_time, 3),
+                'last_reconnect_time': self.last_reconnect_time,
+                'max_reconnect_time': self.max_reconnect_time,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and self.state == STATE_DISCONNECTED:
+                    wait = self._next_attempt - self.clock()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if self._stopping:
+                    return
+                state = self.state
+            if state == STATE_DISCONNECTED:
+                self._attempt()
+            else:
+                self._service()
+
+    def _attempt(self):
+        """One reconnect attempt on this thread; blocks at most for the TCP connect"""
+        attempt = self._begin_attempt()
+        try:
+            self.client.reconnect()
+            self._attempt_sent()
+        except Exception as e:
+            self._attempt_failed(attempt, e)
+
+    def _begin_attempt(self):
+        with self._cond:
+            self._attempts += 1
+            self.total_attempts += 1
+            return self._attempts
+
+    def _attempt_sent(self):
+        """TCP connected and CONNECT sent, CONNACK pending"""
+        with self._cond:
+            if self.state == STATE_DISCONNECTED:
+                self.state = STATE_CONNECTING
+
+    def _attempt_failed(self, attempt, error):
+        delay = backoff_delay(attempt + 1, self.min_delay, self.max_delay)
+        with self._cond:
+            self._next_attempt = self.clock() + delay
+        logger.warning(f"MQTT-Verbindungsversuch {attempt} fehlgeschlagen: {error}. Nächster Versuch in {delay:.1f} s.")
+
+    def _service(self):
+        try:
+            rc = self.client.loop(self.loop_timeout)
+        except Exception as e:
+            logger.warning(f"MQTT-Netzwerkfehler: {e}")
+            rc = -1
+        if rc:
+            self.disconnected()
+
+
+class AsyncMqttLink(MqttLink):
+    """MqttLink for the asyncio runtime: the client socket is served by the event loop.
+
+    paho's socket callbacks register the socket with loop.add_reader() /
+    add_writer(), so reads and writes run as loop callbacks. A task calls
+    loop_misc() (keepalive) every loop_timeout seconds and, after a lost
+    connection, awaits the same jittered backoff as MqttLink. Only the TCP
+    connect inside client.reconnect() blocks, so it runs in the loop's
+    default executor. stats() is the same as for MqttLink.
+    """
+    def __init__(self, client, loop, min_delay=None, max_delay=None, loop_timeout=1.0, clock=time.monotonic):
+        super().__init__(client, min_delay, max_delay, loop_timeout, clock)
+        self.loop = loop
+        self._task = None
+        self._wake = asyncio.Event()
+
+    def _call(self, function, *args):
+        """Run function on the loop thread; paho may call back from the executor during reconnect()"""
+        if in_loop_thread(self.loop):
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def start(self):
+        client = self.client
+        client.on_socket_open = lambda c, userdata, sock: self._call(self.loop.add_reader, sock, self._read)
+        client.on_socket_close = lambda c, userdata, sock: self._call(self._forget, sock)
+        client.on_socket_register_write = lambda c, userdata, sock: self._call(self.loop.add_writer, sock,
+                                                                               self._write)
+        client.on_socket_unregister_write = lambda c, userdata, sock: self._call(self.loop.remove_writer, sock)
+        if self._task is None:
+            self._call(self._create_task)
+
+    def _create_task(self):
+        self._task = self.loop.create_task(self._run_async())
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._stopping = True
+        self._call(self._wake.set)
+        try:
+            self.client.disconnect()
+        except Exception as e:
+            logger.debug(f"MQTT-Disconnect: {e}")
+
+    def disconnected(self):
+        super().disconnected()
+        self._call(self._wake.set)
+
+    def _forget(self, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+
+    def _read(self):
+        if self.client.loop_read():
+            self.disconnected()
+
+    def _write(self):
+        if self.client.loop_write():
+            self.disconnected()
+
+    async def _sleep(self, seconds):
+        """Sleep, but wake up early on disconnected() or stop()"""
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run_async(self):
+        while not self._stopping:
+            if self.state == STATE_DISCONNECTED:
+                wait = self._next_attempt - self.clock()
+                if wait > 0:
+                    await self._sleep(wait)
+                    continue
+                await self._attempt_async()
+            else:
+                await self._sleep(self.loop_timeout)
+                if self.state != STATE_DISCONNECTED and self.client.loop_misc():
+                    self.disconnected()
+
+    async def _attempt_async(self):
+        attempt = self._begin_attempt()
+        try:
+            await self.loop.run_in_executor(None, self.client.reconnect)
+            self._attempt_sent()
+        except Exception as e:
+            self._attempt_failed(attempt, e)
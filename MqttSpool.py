@@ -0,0 +1,125 @@
+# Append-only disk spool for MQTT messages while the broker is unreachable
+import os
+import json
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = '.spool'
+
+
+class MqttSpool:
+    """Bounded store-and-forward buffer in segment files below directory.
+
+    Every message is one JSON line [topic, payload]. append() writes a whole
+    batch and fsyncs once, so the SD card sees one sync per batch and not one
+    per message. A segment is closed once it holds segment_bytes; when all
+    segments together exceed max_bytes the oldest segment is deleted and its
+    messages are lost (counted in dropped_bytes). Nothing is kept in RAM
+    except the segment list and the read position.
+
+    peek() / commit() read in order from the oldest segment; fully read
+    segments are deleted. Segments left over from a previous run are replayed
+    too. After a crash during replay the last uncommitted messages are sent
+    again (at least once).
+    """
+    def __init__(self, directory, max_bytes=None, segment_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes or Config.MQTT_SPOOL_MAX_BYTES
+        self.segment_bytes = segment_bytes or Config.MQTT_SPOOL_SEGMENT_BYTES
+        os.makedirs(directory, exist_ok=True)
+        # [sequence number, size in bytes] of every segment, oldest first
+        self._segments = []
+        for name in os.listdir(directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            try:
+                seq = int(name[:-len(_SUFFIX)])
+            except ValueError:
+                logger.warning(f"MQTT-Spool: fremde Datei {name} ignoriert.")
+                continue
+            self._segments.append([seq, os.path.getsize(os.path.join(directory, name))])
+        self._segments.sort()
+        self._read_offset = 0     # position in the oldest segment
+        self._writer = None       # open file of the newest segment, None = start a new one
+        self.dropped_bytes = 0
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:08d}{_SUFFIX}")
+
+    def pending_bytes(self):
+        """Bytes not yet committed, 0 if the spool is empty"""
+        return sum(size for _, size in self._segments) - self._read_offset
+
+    def append(self, messages):
+        """Append a batch of (topic, payload) pairs with a single fsync"""
+        if not messages:
+            return
+        data = ''.join(json.dumps([topic, payload], separators=(',', ':')) + '\n'
+                       for topic, payload in messages).encode('utf-8')
+        if self._writer is None or self._segments[-1][1] >= self.segment_bytes:
+            self._rotate()
+        self._writer.write(data)
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._segments[-1][1] += len(data)
+        self._enforce_limit()
+
+    def _rotate(self):
+        """Close the current segment and start a new one (never appends to old files)"""
+        if self._writer is not None:
+            self._writer.close()
+        seq = self._segments[-1][0] + 1 if self._segments else 0
+        self._writer = open(self._path(seq), 'ab')
+        self._segments.append([seq, 0])
+
+    def _enforce_limit(self):
+        while len(self._segments) > 1 and sum(size for _, size in self._segments) > self.max_bytes:
+            seq, size = self._segments.pop(0)
+            self.dropped_bytes += size - self._read_offset
+            self._read_offset = 0
+            os.remove(self._path(seq))
+            logger.warning(f"MQTT-Spool voll ({self.max_bytes} Bytes), ältestes Segment {seq} verworfen.")
+
+    def peek(self, count):
+        """Up to count of the oldest messages as (topic, payload, length), without removing them.
+
+        topic is None for a damaged line; commit() it like a sent message to skip it.
+        """
+        messages = []
+        if not self._segments:
+            return messages
+        seq, size = self._segments[0]
+        with open(self._path(seq), 'rb') as f:
+            f.seek(self._read_offset)
+            while len(messages) < count:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    # Unvollständige letzte Zeile eines abgeschlossenen Segments (Absturz beim Schreiben)
+                    if line and (len(self._segments) > 1 or self._writer is None):
+                        messages.append((None, None, len(line)))
+                    break
+                try:
+                    topic, payload = json.loads(line)
+                    messages.append((topic, payload, len(line)))
+                except ValueError:
+                    logger.warning(f"MQTT-Spool: beschädigte Zeile in Segment {seq} übersprungen.")
+                    messages.append((None, None, len(line)))
+        return messages
+
+    def commit(self, messages):
+        """Remove messages returned by peek() after they were sent"""
+        for _, _, length in messages:
+            self._read_offset += length
+        if not self._segments:
+            return
+        seq, size = self._segments[0]
+        if self._read_offset < size:
+            return
+        if len(self._segments) == 1 and self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._segments.pop(0)
+        self._read_offset = 0
+        os.remove(self._path(seq))
@@ -0,0 +1,586 @@
+# Control logic of one Paketbox: state, timers, GPIO backend and publisher in one object
+import time
+import logging
+from PaketBoxState import PaketBoxState, DoorState, MotorState, ANY_ERROR, IS_OPEN, FLAPS_CLOSED
+from TimerManager import TimerManager, Timer
+from TransitionHistory import TransitionHistory
+from LatencyMonitor import latency_monitor, STAGE_HANDLER
+from mqtt import Event
+from StateDocument import StateDocument
+from Commands import CommandDispatcher
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+EDGE_FALLING = 0
+EDGE_RISING = 1
+
+ERROR_VALUES = (DoorState.ERROR, MotorState.ERROR)
+
+
+class _BoxLogger(logging.LoggerAdapter):
+    """Prefixes every message with the name of the box"""
+    def process(self, msg, kwargs):
+        return f"[{self.extra['box']}] {msg}", kwargs
+
+
+class PaketBoxController:
+    """One Paketbox with everything its handlers touch.
+
+    The controller owns the PaketBoxState, the TimerManager, the GPIO backend
+    (module or object with the RPi.GPIO API), the publisher (the mqtt module,
+    an mqtt.Publisher or None) and the transition history. Handlers are
+    methods and only use these attributes, so several controllers can run
+    side by side in one process.
+    inputs/outputs are the pin maps in the order of Config.INPUTS/OUTPUTS;
+    a name prefixes the log messages of the box.
+    """
+    def __init__(self, gpio, state=None, timer_manager=None, publisher=None, history=None,
+                 latency=None, inputs=Config.INPUTS, outputs=Config.OUTPUTS, name=None):
+        self.name = name
+        self.logger = logger if name is None else _BoxLogger(logger, {'box': name})
+        self.gpio = gpio
+        self.state = state if state is not None else PaketBoxState()
+        self.timer_manager = timer_manager if timer_manager is not None else TimerManager()
+        self.publisher = publisher
+        self.state_document = None  # see subscribe_state_reports()
+        self.commands = None        # see subscribe_commands()
+        self.history = history if history is not None else TransitionHistory(Config.HISTORY_SIZE)
+        self.state.attach_history(self.history)
+        self.latency = latency if latency is not None else latency_monitor
+        self.inputs = inputs
+        self.outputs = outputs
+        # _edge_handlers[index][edge] -> list of handlers, edge equals the new pin level
+        self._edge_handlers = []
+        self.build_edge_dispatch_table()
+
+    def _publish(self, event, value):
+        if self.publisher:
+            self.publisher.publish(event, value)
+
+    def initialize_door_states(self):
+        """Initialize door states based on current GPIO input readings."""
+        self.logger.info("Initialisiere Türzustände basierend auf GPIO-Eingängen...")
+        GPIO = self.gpio
+
+        # Read current GPIO states
+        statusOld = [GPIO.input(pin) for pin in self.inputs]
+
+        # Set door states based on GPIO readings
+        self.state.set_left_door(DoorState.OPEN if statusOld[0] == GPIO.HIGH else DoorState.CLOSED)
+        self.state.set_right_door(DoorState.OPEN if statusOld[2] == GPIO.HIGH else DoorState.CLOSED)
+        self.state.set_paket_tuer(DoorState.OPEN if statusOld[4] == GPIO.HIGH else DoorState.CLOSED)
+
+        self.logger.info(f"Türzustände initialisiert: {self.state}")
+        return statusOld
+
+    def sampling_busy(self):
+        """Inputs are sampled fast while a flap motor runs or the courier door is open."""
+        return self.state.is_any_motor_running() or self.state.paket_tuer == DoorState.OPEN
+
+    # region Outputs
+
+    def ResetErrorState(self):
+        """Reset all doors and motors from ERROR state to safe state."""
+        self.logger.info("Starte Reset des Fehlerzustands...")
+        state = self.state
+
+        # Check if any door or motor is in error state
+        if state.is_any_error():
+            self.logger.warning("Fehlerzustand erkannt - setze alle Türen und Motoren auf sicheren Zustand zurück")
+
+            # Re-initialize door states based on actual GPIO readings
+            self.initialize_door_states()
+
+            # Reset motor states from ERROR to STOPPED
+            if state.is_any_motor_error():
+                self.logger.info("Setze Motor-Fehlerzustände zurück...")
+                state.transition(left_motor=MotorState.STOPPED, right_motor=MotorState.STOPPED)
+                self.logger.info("Motor-Zustände auf STOPPED zurückgesetzt")
+
+            self.logger.info(f"Fehlerzustand behoben. Aktueller Zustand: {state}")
+        elif self.isDoorLocked():
+            self.unlockDoor()
+        else:
+            self.logger.info("Kein Fehlerzustand erkannt - keine Aktion erforderlich")
+
+        return not state.is_any_error()
+
+    def lichtMueltonneOn(self):
+        self.gpio.output(self.outputs[5], self.gpio.LOW) # Licht an
+        self.logger.info("Licht Mültonne wurde eingeschaltet.")
+
+    def lichtMueltonneOff(self):
+        self.gpio.output(self.outputs[5], self.gpio.HIGH) # Licht aus
+        self.logger.info("Licht Mültonne wurde ausgeschaltet.")
+
+    def notHaltMotoren(self):
+        GPIO = self.gpio
+        outputs = self.outputs
+        GPIO.output(outputs[0], GPIO.HIGH) # Alle Motoren stoppen
+        GPIO.output(outputs[1], GPIO.HIGH)
+        GPIO.output(outputs[2], GPIO.HIGH)
+        GPIO.output(outputs[3], GPIO.HIGH)
+        GPIO.output(outputs[7], GPIO.LOW) # Riegel Tür verriegelt
+
+        # Cancel all active motor timers
+        self.timer_manager.cancel_all_timers()
+
+        # Set motor states to error due to emergency stop
+        self.state.transition(left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+
+        self.logger.warning("Nothalt: Alle Motoren gestoppt, Timer abgebrochen und Tür verriegelt.")
+
+    def isAnyMotorRunning(self):
+        """Check if any motor is currently running using state management."""
+        return self.state.is_any_motor_running()
+
+    def setLigthtPaketboxOn(self):
+        self.gpio.output(self.outputs[6], self.gpio.LOW) # Licht an
+        self.logger.info("Licht Paketbox wurde eingeschaltet.")
+
+    def setLigthtPaketboxOff(self):
+        self.gpio.output(self.outputs[6], self.gpio.HIGH) # Licht aus
+        self.logger.info("Licht Paketbox wurde ausgeschaltet.")
+
+    def setOutputWithRuntime(self, runtime, gpio, state, timer_id=None):
+        """Set GPIO output for specified runtime, then automatically reset to opposite state."""
+        try:
+            GPIO = self.gpio
+            GPIO.output(gpio, state)
+            def reset_output():
+                opposite_state = GPIO.LOW if state == GPIO.HIGH else GPIO.HIGH
+                GPIO.output(gpio, opposite_state)
+                self.logger.debug(f"GPIO {gpio} zurückgeschaltet zu {opposite_state}")
+                # Clear timer reference when completed normally
+                if timer_id:
+                    self.timer_manager.clear_timer(timer_id)
+
+            timer = Timer(runtime, reset_output)
+            timer.start()
+
+            # Register timer with manager if timer_id provided
+            if timer_id:
+                self.timer_manager.add_timer(timer_id, timer)
+
+            return timer  # Return timer for potential cancellation
+        except Exception as e:
+            self.logger.error(f"Hardwarefehler in setOutputWithRuntime: {e}")
+            return None
+
+    # endregion
+    # region Actions
+
+    def unlockDoor(self):
+        try:
+            self.gpio.output(self.outputs[7], self.gpio.HIGH) # Riegel öffnet Tür. Tür kann wieder geöffnet werden
+            self.logger.info("Türe Paketzusteller wurde entriegelt.")
+        except Exception as e:
+            self.logger.error(f"Hardwarefehler in unlockDoor: {e}")
+
+    def lockDoor(self):
+        try:
+            self.gpio.output(self.outputs[7], self.gpio.LOW) # Riegel schließt Tür. Tür kann nicht mehr geöffnet werden
+            self.logger.info("Türe Paketzusteller wurde verriegelt.")
+        except Exception as e:
+            self.logger.error(f"Hardwarefehler in lockDoor: {e}")
+
+    def isDoorLocked(self):
+        try:
+            return self.gpio.input(self.outputs[7]) == self.gpio.LOW
+        except Exception as e:
+            self.logger.error(f"Hardwarefehler in isDoorLocked: {e}")
+            return None
+
+    def Klappen_schliessen(self):
+        """Close both flaps with proper error handling and state validation."""
+        GPIO = self.gpio
+        state = self.state
+
+        # Error check and motor state CLOSING in one step, a concurrent emergency stop cannot slip in between
+        if not state.transition(forbid=ANY_ERROR, left_motor=MotorState.CLOSING, right_motor=MotorState.CLOSING):
+            self.logger.warning("Motorsteuerung gestoppt: Globaler Fehlerzustand aktiv!")
+            return False
+
+        self.logger.info("Klappen fahren zu")
+
+        # Start closing motors with timer management
+        timerLeftFlap = self.setOutputWithRuntime(Config.CLOSURE_TIMER_SECONDS, self.outputs[0], GPIO.LOW, 'left_motor')
+        timerRightFlap = self.setOutputWithRuntime(Config.CLOSURE_TIMER_SECONDS, self.outputs[2], GPIO.LOW, 'right_motor')
+
+        if not timerLeftFlap or not timerRightFlap:
+            self.logger.error("Fehler beim Starten der Motoren!")
+            # Reset motor states on error
+            state.transition(left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+            return False
+
+        timerCheckClosing = Timer(Config.CLOSURE_TIMER_SECONDS + 1, self.endlagen_pruefung_closing)
+        timerCheckClosing.start()
+        self.timer_manager.add_timer('left_check', timerCheckClosing)
+        return True
+
+    def endlagen_pruefung_closing(self):
+        """Check end positions after closing timeout."""
+        state = self.state
+        # Clear timer reference
+        self.timer_manager.clear_timer('left_check')
+
+        # Motors STOPPED only if both flaps are closed, checked and set in one step
+        if not state.transition(require=FLAPS_CLOSED,
+                                left_motor=MotorState.STOPPED, right_motor=MotorState.STOPPED):
+            doors = state.snapshot()
+            self.logger.error(f"Fehler: Klappen nicht geschlossen nach Schließungsversuch!")
+            self.logger.error(f"Status: Links={doors.left_door.name}, Rechts={doors.right_door.name}")
+            state.transition(left_door=DoorState.ERROR, right_door=DoorState.ERROR,
+                             left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+            return False
+        else:
+            self.logger.info("Klappen erfolgreich geschlossen.")
+            self.unlockDoor()
+            return True
+
+    def Paket_Tuer_Zusteller_geschlossen(self):
+        self.logger.info("Türe Paketzusteller wurde geschlossen.")
+
+        # Cancel 15-Minuten-Überwachung da Tür jetzt geschlossen ist
+        self.timer_manager.cancel_timer('door_open_watchdog')
+        self.logger.info("15-Minuten-Überwachung für geöffnete Paket-Tür abgebrochen.")
+
+        # Cancel any existing timer using timer manager
+        self.timer_manager.cancel_timer('delayed_open')
+        self.logger.info("Vorherigen Klappen-Öffnungs-Timer abgebrochen.")
+
+        self.logger.info("Starte verzögertes Öffnen der Klappen in 10 Sekunden...")
+
+        delayed_timer = Timer(10.0, self.delayed_klappen_oeffnen)
+        delayed_timer.start()
+        self.timer_manager.add_timer('delayed_open', delayed_timer)
+        # Audiofile: Box wird geleert, dies dauert 2 Minuten
+
+    def delayed_klappen_oeffnen(self):
+        # Clear timer reference when executing
+        self.timer_manager.clear_timer('delayed_open')
+
+        # Check if door is still closed before opening flaps
+        if self.state.paket_tuer == DoorState.CLOSED:
+            self.logger.info("10 Sekunden vergangen, starte Öffnen der Klappen...")
+            self.lockDoor()
+            self.Klappen_oeffnen()
+        else:
+            self.logger.warning("Klappen-Öffnung abgebrochen: Paketzusteller-Tür ist wieder geöffnet!")
+
+    def Klappen_oeffnen_abbrechen(self):
+        """Cancel delayed flap opening timer using timer manager."""
+        if self.timer_manager.active_timers['delayed_open'] is not None:
+            self.timer_manager.cancel_timer('delayed_open')
+            self.logger.info("Klappen-Öffnung wurde abgebrochen.")
+            return True
+        else:
+            self.logger.info("Kein aktiver Klappen-Öffnungs-Timer zum Abbrechen.")
+            return False
+
+    def Paket_Tuer_Zusteller_geoeffnet(self):
+        # Cancel flap opening if door is opened during waiting period
+        self.Klappen_oeffnen_abbrechen()
+
+        if self.state.is_open():
+            self.logger.warning(f"Fehler: Tür wurde geöffnet und Klappen waren nicht zu.")
+            self.Klappen_schliessen()
+
+        self.logger.info("Türe Paketzusteller wurde geöffnet")
+
+        # Starte 15-Minuten-Überwachung für geöffnete Paket-Tür (15 * 60 = 900 Sekunden)
+        watchdog_timer = Timer(900.0, self.door_open_watchdog)
+        watchdog_timer.start()
+        self.timer_manager.add_timer('door_open_watchdog', watchdog_timer)
+        self.logger.info("15-Minuten-Überwachung für geöffnete Paket-Tür gestartet.")
+
+    def door_open_watchdog(self):
+        # Clear timer reference when executing
+        self.timer_manager.clear_timer('door_open_watchdog')
+
+        # Check if door is still open after 15 minutes
+        if self.state.paket_tuer == DoorState.OPEN:
+            self.logger.warning("WARNUNG: Paket-Tür ist seit 15 Minuten geöffnet! Öffne Klappen zur Entleerung...")
+
+            # Sende MQTT-Fehlernachricht
+            try:
+                error_message = f"FEHLER: Paket-Tür seit 15 Minuten geöffnet - automatische Entleerung gestartet"
+                self._publish(Event.STATUS, error_message)
+                self.logger.info(f"MQTT-Fehlernachricht gesendet: {error_message}")
+            except Exception as e:
+                self.logger.error(f"Fehler beim Senden der MQTT-Nachricht: {e}")
+
+            # Öffne Klappen zur Entleerung
+            self.Klappen_oeffnen()
+        else:
+            self.logger.debug("15-Minuten-Timer abgelaufen, aber Paket-Tür ist bereits geschlossen.")
+
+    def Klappen_oeffnen(self):
+        """Open both flaps with proper error handling and state validation."""
+        GPIO = self.gpio
+        state = self.state
+
+        # Error check and motor state OPENING in one step, a concurrent emergency stop cannot slip in between
+        if not state.transition(forbid=ANY_ERROR, left_motor=MotorState.OPENING, right_motor=MotorState.OPENING):
+            self.logger.warning("Motorsteuerung gestoppt: Globaler Fehlerzustand aktiv!")
+            return False
+
+        self.logger.info("Klappen fahren auf")
+
+        # Start opening motors with timer management
+        timer1 = self.setOutputWithRuntime(Config.MOTOR_REVERSE_SIGNAL, self.outputs[1], GPIO.LOW, 'left_motor')
+        timer2 = self.setOutputWithRuntime(Config.MOTOR_REVERSE_SIGNAL, self.outputs[3], GPIO.LOW, 'right_motor')
+
+        if not timer1 or not timer2:
+            self.logger.error("Fehler beim Starten der Motoren!")
+            # Reset motor states on error
+            state.transition(left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+            return False
+
+        timer = Timer(Config.CLOSURE_TIMER_SECONDS + 1, self.endlagen_pruefung)
+        timer.start()
+        self.timer_manager.add_timer('right_check', timer)
+        return True
+
+    def endlagen_pruefung(self):
+        """Check end positions after opening timeout."""
+        state = self.state
+        # Clear timer reference
+        self.timer_manager.clear_timer('right_check')
+
+        # Motors STOPPED only if both flaps are open, checked and set in one step
+        if not state.transition(require=IS_OPEN,
+                                left_motor=MotorState.STOPPED, right_motor=MotorState.STOPPED):
+            doors = state.snapshot()
+            self.logger.error(f"Fehler: Klappen nicht offen nach Öffnungsversuch!")
+            self.logger.error(f"Status: Links={doors.left_door.name}, Rechts={doors.right_door.name}")
+            state.transition(left_door=DoorState.ERROR, right_door=DoorState.ERROR,
+                             left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+            return False
+        else:
+            self.logger.info("Klappen erfolgreich geöffnet.")
+            self.logger.info(f"Starte automatisches Schließen der Klappen... Status: {state}")
+            # Auto-close after successful opening
+            if state.is_open():
+                self.Klappen_schliessen()
+            else:
+                self.logger.error(f"Fehler: Klappen nicht beide im OPEN-Zustand!")
+            return True
+
+    def ResetDoors(self):
+        """Reset doors to safe closed state."""
+        state = self.state
+        self.logger.info(f"Current door state: {state}")
+        if state.is_any_open():
+            self.logger.info("Resetting doors to closed state...")
+            self.lockDoor()
+            return self.Klappen_schliessen()
+        elif state.is_any_error():
+            self.logger.warning("Doors in error state - manual intervention required!")
+            return False
+        else:
+            self.logger.info("Doors already in safe state.")
+            return True
+
+    def resume_timer(self, timer_id, remaining, downtime=0.0):
+        """Restart a timer of the TimerManager after a process restart (see Checkpoint.py).
+
+        remaining is the time the timer had left when it was saved. Motor runtimes
+        and their end position checks continue where they stopped, since the relays
+        were off while the process was down; the other timers count the downtime.
+        Returns True if the timer was scheduled.
+        """
+        if timer_id in ('left_motor', 'right_motor'):
+            motor = self.state.left_motor if timer_id == 'left_motor' else self.state.right_motor
+            close_output, open_output = (0, 1) if timer_id == 'left_motor' else (2, 3)
+            if motor == MotorState.CLOSING:
+                pin = self.outputs[close_output]
+            elif motor == MotorState.OPENING:
+                pin = self.outputs[open_output]
+            else:
+                return False
+            return self.setOutputWithRuntime(remaining, pin, self.gpio.LOW, timer_id) is not None
+
+        callbacks = {
+            'left_check': self.endlagen_pruefung_closing,
+            'right_check': self.endlagen_pruefung,
+            'delayed_open': self.delayed_klappen_oeffnen,
+            'door_open_watchdog': self.door_open_watchdog,
+        }
+        if timer_id not in callbacks:
+            self.logger.warning(f"Timer {timer_id} kann nicht fortgesetzt werden.")
+            return False
+        if timer_id in ('delayed_open', 'door_open_watchdog'):
+            remaining = max(0.0, remaining - downtime)
+        timer = Timer(remaining, callbacks[timer_id])
+        timer.start()
+        self.timer_manager.add_timer(timer_id, timer)
+        self.logger.info(f"Timer {timer_id} fortgesetzt, läuft in {remaining:.1f} s ab.")
+        return True
+
+    # endregion
+    # region Edge dispatch
+
+    def register_edge_handler(self, index, edge, handler_func):
+        """Register handler_func to be called on the given edge of input number index."""
+        while len(self._edge_handlers) <= index:
+            self._edge_handlers.append(([], []))
+        self._edge_handlers[index][edge].append(handler_func)
+
+    def _paket_tuer_geoeffnet(self):
+        self.state.set_paket_tuer(DoorState.OPEN)
+        self.logger.info(f"Paketklappe Zusteller geöffnet.")
+        self.Paket_Tuer_Zusteller_geoeffnet()
+        self._publish(Event.PAKET_ZUSTELLER, "ON")
+
+    def _paket_tuer_geschlossen(self):
+        self.state.set_paket_tuer(DoorState.CLOSED)
+        self.logger.info(f"Paketklappe Zusteller geschlossen.")
+        self._publish(Event.PAKET_ZUSTELLER, "OFF")
+        self.Paket_Tuer_Zusteller_geschlossen()
+
+    def _briefkasten_geoeffnet(self):
+        self.logger.info(f"Briefkasten Zusteller geöffnet.")
+        self._publish(Event.BRIEFKASTEN, "ON")
+
+    def _briefkasten_geschlossen(self):
+        self.logger.info(f"Briefkasten Zusteller geschlossen.")
+        self._publish(Event.BRIEFKASTEN, "OFF")
+
+    def _briefkasten_leeren_geoeffnet(self):
+        self.logger.info(f"Briefkasten Türe zum Leeren geöffnet.")
+        self._publish(Event.BRIEFKASTEN_ENTLEEREN, "ON")
+
+    def _briefkasten_leeren_geschlossen(self):
+        self.logger.info(f"Briefkasten Türe zum Leeren geschlossen.")
+        self._publish(Event.BRIEFKASTEN_ENTLEEREN, "OFF")
+
+    def _paketbox_leeren_geoeffnet(self):
+        self.logger.info(f"Paketbox Türe zum Leeren geöffnet.")
+        self._publish(Event.PAKETBOX_ENTLEEREN, "ON")
+        self.setLigthtPaketboxOn()
+        if self.isAnyMotorRunning():
+            self.logger.warning("Nothalt: Türen sind offen, Motoren werden angehalten.")
+            self.notHaltMotoren()
+
+    def _paketbox_leeren_geschlossen(self):
+        self.logger.info(f"Paketbox Türe zum Leeren geschlossen.")
+        self._publish(Event.PAKETBOX_ENTLEEREN, "OFF")
+        self.setLigthtPaketboxOff()
+        self.ResetErrorState()
+        self.ResetDoors()
+
+    def _muelltonne_geoeffnet(self):
+        self.logger.info(f"Tür Mültonne geöffnet.")
+        self.lichtMueltonneOn()
+
+    def _muelltonne_geschlossen(self):
+        self.logger.info(f"Tür Mültonne geschlossen.")
+        self.lichtMueltonneOff()
+
+    def _klappe_links_zu(self):
+        self.state.set_left_door(DoorState.CLOSED)
+        self.logger.info(f"Packet Klappe links geschlossen/oben.")
+
+    def _klappe_links_auf(self):
+        self.state.set_left_door(DoorState.OPEN)
+        self.logger.info(f"Packet Klappe links geöffnet/unten.")
+
+    def _klappe_rechts_zu(self):
+        self.state.set_right_door(DoorState.CLOSED)
+        self.logger.info(f"Packet Klappe recht geschlossen/oben.")
+
+    def _klappe_rechts_auf(self):
+        self.state.set_right_door(DoorState.OPEN)
+        self.logger.info(f"Packet Klappe rechts geöffnet/unten.")
+
+    def _tueroeffner_6_gedrueckt(self):
+        self.logger.info(f"Türöffner Taster 6 gedrückt.")
+
+    def _bewegungsmelder_ausgeloest(self):
+        self.logger.info(f"Bewegungsmelder hat ausgelöst.")
+        self._publish(Event.BEWEGUNGSMELDER, "ON")
+
+    def _bewegungsmelder_ruhe(self):
+        self._publish(Event.BEWEGUNGSMELDER, "OFF")
+
+    def build_edge_dispatch_table(self):
+        """(Re)build the default input -> handler table. Called once by __init__."""
+        self._edge_handlers[:] = [([], []) for _ in self.inputs]
+        register = self.register_edge_handler
+        register(0, EDGE_FALLING, self._klappe_links_zu)
+        register(1, EDGE_FALLING, self._klappe_links_auf)
+        register(2, EDGE_FALLING, self._klappe_rechts_zu)
+        register(3, EDGE_FALLING, self._klappe_rechts_auf)
+        register(4, EDGE_RISING, self._paket_tuer_geoeffnet)
+        register(4, EDGE_FALLING, self._paket_tuer_geschlossen)
+        register(5, EDGE_RISING, self._briefkasten_geoeffnet)
+        register(5, EDGE_FALLING, self._briefkasten_geschlossen)
+        register(6, EDGE_RISING, self._briefkasten_leeren_geoeffnet)
+        register(6, EDGE_FALLING, self._briefkasten_leeren_geschlossen)
+        register(7, EDGE_RISING, self._paketbox_leeren_geoeffnet)
+        register(7, EDGE_FALLING, self._paketbox_leeren_geschlossen)
+        register(8, EDGE_FALLING, self._tueroeffner_6_gedrueckt)
+        register(9, EDGE_RISING, self._muelltonne_geoeffnet)
+        register(9, EDGE_FALLING, self._muelltonne_geschlossen)
+        register(10, EDGE_RISING, self._bewegungsmelder_ausgeloest)
+        register(10, EDGE_FALLING, self._bewegungsmelder_ruhe)
+
+    def pinChanged(self, pin, oldState, newState):
+        """Dispatch a level change of input number pin to its registered handlers."""
+        if oldState == newState:
+            self.logger.warning(f"pinChanged: oldState == newState keine Änderung erkannt.")
+            return
+        try:
+            handlers = self._edge_handlers[pin][newState]
+        except IndexError:
+            self.logger.warning(f"pinChanged: kein Eingang {pin} bzw. Pegel {newState} bekannt.")
+            return
+        history = self.history
+        history.record_edge(pin, oldState, newState)
+        try:
+            mark = self.latency.mark
+            for handler_func in handlers:
+                mark(STAGE_HANDLER)
+                handler_func()
+        finally:
+            history.dispatch = None
+
+    # endregion
+    # region Error reporting
+
+    def fehlerzustand_geaendert(self, change):
+        """State observer: report entering and leaving the error state via MQTT."""
+        if change.current & ANY_ERROR and not change.previous & ANY_ERROR:
+            self.logger.warning(f"WARNUNG: System im Fehlerzustand! {change.current}")
+            if self.publisher:
+                self.publisher.publish(Event.STATUS, f"{time.strftime('%Y-%m-%d %H:%M:%S')} FEHLER Paketbox")
+                self.publisher.publish(Event.HISTORY, self.history.to_json(Config.HISTORY_DUMP))
+        elif change.previous & ANY_ERROR and not change.current & ANY_ERROR:
+            self.logger.info(f"Fehlerzustand aufgehoben: {change.current}")
+            if self.publisher:
+                self.publisher.publish(Event.STATUS, f"{time.strftime('%Y-%m-%d %H:%M:%S')} Paketbox wieder bereit")
+
+    def subscribe_error_reports(self):
+        """Report error state changes of this box via fehlerzustand_geaendert()."""
+        self.state.subscribe(self.fehlerzustand_geaendert, new=ERROR_VALUES)
+        self.state.subscribe(self.fehlerzustand_geaendert, old=ERROR_VALUES)
+
+    def subscribe_state_reports(self):
+        """Publish the state as retained document plus deltas (StateDocument). Needs a publisher."""
+        self.state_document = StateDocument(self.state, self.publisher)
+        self.state_document.attach()
+
+    def subscribe_commands(self, post):
+        """Accept MQTT commands (Commands.COMMANDS); post hands them to the control thread."""
+        self.commands = CommandDispatcher(self, post)
+        self.commands.subscribe()
+
+    def verlauf_ausgeben(self, signum=None, frame=None):
+        """SIGUSR1, on the control thread: write the transition history to the log and MQTT."""
+        self.history.log_dump(Config.HISTORY_DUMP)
+        if self.publisher:
+            self.publisher.publish(Event.HISTORY, self.history.to_json(Config.HISTORY_DUMP))
+
+    # endregion
@@ -1,5 +1,11 @@
 from enum import Enum, auto
+from typing import NamedTuple
 import threading
+import queue
+import logging
+from Clock import in_loop_thread
+
+logger = logging.getLogger(__name__)
 
 
 class DoorState(Enum):
@@ -13,90 +19,368 @@ class MotorState(Enum):
    CLOSING = auto()
    ERROR = auto()
 
-class PaketBoxState:
+# Bit layout of a StateSnapshot: each field stores enum value - 1 in two bits,
+# the derived flags above them are precomputed for every field combination
+_LEFT_DOOR, _RIGHT_DOOR, _PAKET_TUER, _LEFT_MOTOR, _RIGHT_MOTOR = 0, 2, 4, 6, 8
+_FIELD_BITS = 10
+_DOORS = tuple(DoorState)
+_MOTORS = tuple(MotorState)
+
+IS_OPEN = 1 << 10                 # beide Klappen offen
+ANY_OPEN = 1 << 11
+ALL_CLOSED = 1 << 12              # beide Klappen und Pakettür geschlossen
+ANY_ERROR = 1 << 13
+ANY_MOTOR_RUNNING = 1 << 14
+ANY_MOTOR_ERROR = 1 << 15
+BOTH_MOTORS_STOPPED = 1 << 16
+FLAPS_CLOSED = 1 << 17            # beide Klappen geschlossen (Pakettür egal)
+
+
+class StateSnapshot(int):
+   """Immutable state of all five fields packed into one int, plus derived flags"""
+   __slots__ = ()
+
+   def __new__(cls, left_door=DoorState.CLOSED, right_door=DoorState.CLOSED, paket_tuer=DoorState.CLOSED,
+               left_motor=MotorState.STOPPED, right_motor=MotorState.STOPPED):
+      return _SNAPSHOTS[(left_door._value_ - 1) << _LEFT_DOOR | (right_door._value_ - 1) << _RIGHT_DOOR
+                        | (paket_tuer._value_ - 1) << _PAKET_TUER | (left_motor._value_ - 1) << _LEFT_MOTOR
+                        | (right_motor._value_ - 1) << _RIGHT_MOTOR]
+
+   @property
+   def left_door(self):
+      return _DOORS[self >> _LEFT_DOOR & 3]
+   @property
+   def right_door(self):
+      return _DOORS[self >> _RIGHT_DOOR & 3]
+   @property
+   def paket_tuer(self):
+      return _DOORS[self >> _PAKET_TUER & 3]
+   @property
+   def left_motor(self):
+      return _MOTORS[self >> _LEFT_MOTOR & 3]
+   @property
+   def right_motor(self):
+      return _MOTORS[self >> _RIGHT_MOTOR & 3]
+
+   def __str__(self):
+      return (f"Klappe links: {self.left_door.name}, Klappe rechts: {self.right_door.name}, "
+            f"Pakettür: {self.paket_tuer.name}, "
+            f"Motor links: {self.left_motor.name}, Motor rechts: {self.right_motor.name}")
+
+   def to_dict(self):
+      """Field name -> enum name, always in the order of FIELDS"""
+      return {field: getattr(self, field).name for field in FIELDS}
+
+   def __repr__(self):
+      return (f"StateSnapshot(left_door={self.left_door.name}, right_door={self.right_door.name}, "
+              f"paket_tuer={self.paket_tuer.name}, left_motor={self.left_motor.name}, "
+              f"right_motor={self.right_motor.name})")
+
+
+def _derived_flags(fields):
+   """Derived flags of one field combination, computed once per combination at import"""
+   door_codes = [fields >> shift & 3 for shift in (_LEFT_DOOR, _RIGHT_DOOR, _PAKET_TUER)]
+   if 3 in door_codes:
+      return 0  # no DoorState has value 4, such snapshots are never selected
+   left_door, right_door, paket_tuer = (_DOORS[code] for code in door_codes)
+   motors = [_MOTORS[fields >> shift & 3] for shift in (_LEFT_MOTOR, _RIGHT_MOTOR)]
+   doors = [left_door, right_door]
+   flags = 0
+   if all(door == DoorState.OPEN for door in doors):
+      flags |= IS_OPEN
+   if any(door == DoorState.OPEN for door in doors):
+      flags |= ANY_OPEN
+   if all(door == DoorState.CLOSED for door in doors + [paket_tuer]):
+      flags |= ALL_CLOSED
+   if any(door == DoorState.ERROR for door in doors + [paket_tuer]) or MotorState.ERROR in motors:
+      flags |= ANY_ERROR
+   if any(motor in (MotorState.OPENING, MotorState.CLOSING) for motor in motors):
+      flags |= ANY_MOTOR_RUNNING
+   if MotorState.ERROR in motors:
+      flags |= ANY_MOTOR_ERROR
+   if all(motor == MotorState.STOPPED for motor in motors):
+      flags |= BOTH_MOTORS_STOPPED
+   if all(door == DoorState.CLOSED for door in doors):
+      flags |= FLAPS_CLOSED
+   return flags
+
+
+# All 2^10 field combinations as ready-made snapshots; setters only look them up
+_SNAPSHOTS = [int.__new__(StateSnapshot, fields | _derived_flags(fields)) for fields in range(1 << _FIELD_BITS)]
+
+_SHIFTS = {'left_door': _LEFT_DOOR, 'right_door': _RIGHT_DOOR, 'paket_tuer': _PAKET_TUER,
+           'left_motor': _LEFT_MOTOR, 'right_motor': _RIGHT_MOTOR}
+FIELDS = tuple(_SHIFTS)  # stable field order of StateSnapshot.to_dict() and StateChange.fields
+_FIELD_MASK = (1 << _FIELD_BITS) - 1
+# Field bits to keep when one field (key = shift) is replaced; drops the derived flags
+_KEEP = {shift: _FIELD_MASK & ~(3 << shift) for shift in _SHIFTS.values()}
+
+
+def unpack(value) -> StateSnapshot:
+   """StateSnapshot for an int taken from a snapshot earlier, e.g. read back from a checkpoint"""
+   return _SNAPSHOTS[int(value) & _FIELD_MASK]
+
+
+class StateChange(NamedTuple):
+   """One state update as seen by a subscriber"""
+   fields: tuple                # changed fields that matched the subscription
+   previous: StateSnapshot
+   current: StateSnapshot
+
+
+def _as_set(value):
+   if value is None:
+      return None
+   if isinstance(value, (str, Enum)):
+      return frozenset([value])
+   return frozenset(value)
+
+
+class Subscription:
+   """Callback plus filter on field names and old / new values"""
+   def __init__(self, callback, fields=None, old=None, new=None):
+      self.callback = callback
+      self.fields = _as_set(fields)
+      self.old = _as_set(old)
+      self.new = _as_set(new)
+
+   def matches(self, previous, current):
+      """Changed fields between the two snapshots that pass the filter"""
+      matched = []
+      for field in _SHIFTS:
+         if self.fields is not None and field not in self.fields:
+            continue
+         old, new = getattr(previous, field), getattr(current, field)
+         if old is new:
+            continue
+         if (self.old is None or old in self.old) and (self.new is None or new in self.new):
+            matched.append(field)
+      return tuple(matched)
+
+
+class StateNotifier:
+   """Delivers state changes in order to the subscriptions on one dedicated thread.
+
+   Writers only enqueue (subscriptions, previous, current) under the state lock;
+   matching and callbacks run on the notifier thread, so a slow subscriber never
+   delays a setter or a motor timer. Each change carries the subscriptions of
+   its own state, so one notifier can serve many PaketBoxState instances.
+   """
    def __init__(self):
+      self._queue = queue.Queue()
+      self._thread = threading.Thread(target=self._run, name="StateNotifier", daemon=True)
+      self._thread.start()
+
+   def post(self, subscriptions, previous, current):
+      if previous is not current:
+         self._queue.put((subscriptions, previous, current))
+
+   def flush(self, timeout=None):
+      """Wait until the queue is empty and the last callback returned"""
+      done = threading.Event()
+      self._queue.put((None, None, done))
+      return done.wait(timeout)
+
+   def _run(self):
+      while True:
+         subscriptions, previous, current = self._queue.get()
+         if subscriptions is None:
+            current.set()
+            continue
+         _deliver(subscriptions, previous, current)
+
+
+def _deliver(subscriptions, previous, current):
+   for subscription in subscriptions:
+      fields = subscription.matches(previous, current)
+      if not fields:
+         continue
+      try:
+         subscription.callback(StateChange(fields, previous, current))
+      except Exception as e:
+         logger.error(f"Fehler in Zustands-Beobachter {getattr(subscription.callback, '__name__', subscription.callback)}: {e}")
+
+
+class LoopNotifier:
+   """StateNotifier for the asyncio runtime: delivers the changes as callbacks on the event loop.
+
+   No thread of its own; changes keep their order because loop callbacks run
+   first in, first out. post() may be called from any thread.
+   """
+   def __init__(self, loop):
+      self.loop = loop
+
+   def post(self, subscriptions, previous, current):
+      if previous is current:
+         return
+      if in_loop_thread(self.loop):
+         self.loop.call_soon(_deliver, subscriptions, previous, current)
+      else:
+         self.loop.call_soon_threadsafe(_deliver, subscriptions, previous, current)
+
+   def flush(self, timeout=None):
+      """Wait until the changes so far were delivered; only from outside the loop thread"""
+      if in_loop_thread(self.loop):
+         raise RuntimeError("LoopNotifier.flush() auf dem Loop-Thread würde den Loop blockieren")
+      done = threading.Event()
+      self.loop.call_soon_threadsafe(done.set)
+      return done.wait(timeout)
+
+
+class PaketBoxState:
+   """Door and motor state of the box.
+
+   The state is one immutable StateSnapshot (an int) that writers replace
+   under _lock. Readers just take the current reference, so predicates and
+   __str__ never block and always see a consistent combination of all five
+   fields. Each predicate is a single bit test on the precomputed flags.
+
+   Observers registered with subscribe() are told about every change in the
+   order the changes happened, on a StateNotifier thread. Pass notifier to
+   share one thread between several states (fleet mode).
+   """
+   __slots__ = ('_lock', '_snapshot', '_notifier', '_subscriptions', '_history')
+
+   def __init__(self, notifier=None):
       self._lock = threading.Lock()
-      self.left_door = DoorState.CLOSED
-      self.right_door = DoorState.CLOSED
-      self.paket_tuer = DoorState.CLOSED
-      self.left_motor = MotorState.STOPPED
-      self.right_motor = MotorState.STOPPED
+      self._snapshot = StateSnapshot()
+      self._notifier = notifier  # created by the first subscribe() if not given
+      self._subscriptions = ()   # replaced on change, never mutated in place
+      self._history = None       # TransitionHistory, see attach_history()
+
+   def snapshot(self) -> StateSnapshot:
+      return self._snapshot
+
+   @property
+   def left_door(self):
+      return _DOORS[self._snapshot >> _LEFT_DOOR & 3]
+   @property
+   def right_door(self):
+      return _DOORS[self._snapshot >> _RIGHT_DOOR & 3]
+   @property
+   def paket_tuer(self):
+      return _DOORS[self._snapshot >> _PAKET_TUER & 3]
+   @property
+   def left_motor(self):
+      return _MOTORS[self._snapshot >> _LEFT_MOTOR & 3]
+   @property
+   def right_motor(self):
+      return _MOTORS[self._snapshot >> _RIGHT_MOTOR & 3]
 
    def set_left_door(self, state: DoorState):
       with self._lock:
-         self.left_door = state
+         previous = self._snapshot
+         self._snapshot = _SNAPSHOTS[previous & _KEEP[_LEFT_DOOR] | (state._value_ - 1) << _LEFT_DOOR]
+         if self._history is not None:
+            self._history.record_state(previous, self._snapshot)
+         if self._subscriptions:
+            self._notifier.post(self._subscriptions, previous, self._snapshot)
    def set_right_door(self, state: DoorState):
       with self._lock:
-         self.right_door = state
+         previous = self._snapshot
+         self._snapshot = _SNAPSHOTS[previous & _KEEP[_RIGHT_DOOR] | (state._value_ - 1) << _RIGHT_DOOR]
+         if self._history is not None:
+            self._history.record_state(previous, self._snapshot)
+         if self._subscriptions:
+            self._notifier.post(self._subscriptions, previous, self._snapshot)
    def set_paket_tuer(self, state: DoorState):
       with self._lock:
-         self.paket_tuer = state
+         previous = self._snapshot
+         self._snapshot = _SNAPSHOTS[previous & _KEEP[_PAKET_TUER] | (state._value_ - 1) << _PAKET_TUER]
+         if self._history is not None:
+            self._history.record_state(previous, self._snapshot)
+         if self._subscriptions:
+            self._notifier.post(self._subscriptions, previous, self._snapshot)
    
    def set_left_motor(self, state: MotorState):
       with self._lock:
-         self.left_motor = state
+         previous = self._snapshot
+         self._snapshot = _SNAPSHOTS[previous & _KEEP[_LEFT_MOTOR] | (state._value_ - 1) << _LEFT_MOTOR]
+         if self._history is not None:
+            self._history.record_state(previous, self._snapshot)
+         if self._subscriptions:
+            self._notifier.post(self._subscriptions, previous, self._snapshot)
    def set_right_motor(self, state: MotorState):
       with self._lock:
-         self.right_motor = state
+         previous = self._snapshot
+         self._snapshot = _SNAPSHOTS[previous & _KEEP[_RIGHT_MOTOR] | (state._value_ - 1) << _RIGHT_MOTOR]
+         if self._history is not None:
+            self._history.record_state(previous, self._snapshot)
+         if self._subscriptions:
+            self._notifier.post(self._subscriptions, previous, self._snapshot)
+
+   def transition(self, require=0, forbid=0, **updates):
+      """Apply several field updates at once if the current flags allow it.
+
+      require / forbid are masks of the derived flags (e.g. forbid=ANY_ERROR);
+      the updates are given as field=state. Check and update happen under one
+      lock acquisition. Returns True if the transition was applied.
+      """
+      with self._lock:
+         previous = s = self._snapshot
+         if s & require != require or s & forbid:
+            return False
+         for field, state in updates.items():
+            shift = _SHIFTS[field]
+            s = s & _KEEP[shift] | (state._value_ - 1) << shift
+         self._snapshot = _SNAPSHOTS[s & _FIELD_MASK]
+         if self._history is not None:
+            self._history.record_state(previous, self._snapshot)
+         if self._subscriptions:
+            self._notifier.post(self._subscriptions, previous, self._snapshot)
+         return True
+
+   def set_notifier(self, notifier):
+      """Deliver changes through notifier (e.g. a LoopNotifier). Call before the first subscribe()."""
+      with self._lock:
+         self._notifier = notifier
+
+   def attach_history(self, history):
+      """Record every state update in history (a TransitionHistory), None to stop"""
+      self._history = history
+
+   def subscribe(self, callback, fields=None, old=None, new=None):
+      """Call callback(StateChange) whenever a field changes, on the notifier thread.
+
+      fields, old and new filter the changes: a field name or enum value, or a
+      collection of them; None matches everything. Returns the Subscription.
+      """
+      subscription = Subscription(callback, fields, old, new)
+      with self._lock:
+         if self._notifier is None:
+            self._notifier = StateNotifier()
+         self._subscriptions = self._subscriptions + (subscription,)
+      return subscription
+
+   def unsubscribe(self, subscription):
+      with self._lock:
+         self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+
+   def wait_notified(self, timeout=None):
+      """Block until all changes so far were delivered. Not to be called from a callback."""
+      notifier = self._notifier
+      return notifier.flush(timeout) if notifier is not None else True
 
    def is_open(self):
-       with self._lock:
-         return all([
-            self.left_door == DoorState.OPEN,
-            self.right_door == DoorState.OPEN
-         ])
-       
+      return self._snapshot & IS_OPEN != 0
+
    def is_any_open(self):
-       with self._lock:
-         return any([
-            self.left_door == DoorState.OPEN,
-            self.right_door == DoorState.OPEN
-         ])
+      return self._snapshot & ANY_OPEN != 0
 
    def is_all_closed(self):
-      with self._lock:
-         return all([
-            self.left_door == DoorState.CLOSED,
-            self.right_door == DoorState.CLOSED,
-            self.paket_tuer == DoorState.CLOSED
-         ])
+      return self._snapshot & ALL_CLOSED != 0
 
    def is_any_error(self):
-      with self._lock:
-         return any([
-            self.left_door == DoorState.ERROR,
-            self.right_door == DoorState.ERROR,
-            self.paket_tuer == DoorState.ERROR,
-            self.left_motor == MotorState.ERROR,
-            self.right_motor == MotorState.ERROR
-         ])
+      return self._snapshot & ANY_ERROR != 0
 
    def is_any_motor_running(self):
-      with self._lock:
-         return any([
-            self.left_motor == MotorState.OPENING,
-            self.left_motor == MotorState.CLOSING,
-            self.right_motor == MotorState.OPENING,
-            self.right_motor == MotorState.CLOSING
-         ])
+      return self._snapshot & ANY_MOTOR_RUNNING != 0
 
    def is_any_motor_error(self):
-      with self._lock:
-         return any([
-            self.left_motor == MotorState.ERROR,
-            self.right_motor == MotorState.ERROR
-         ])
+      return self._snapshot & ANY_MOTOR_ERROR != 0
 
    def are_both_motors_stopped(self):
-      with self._lock:
-         return all([
-            self.left_motor == MotorState.STOPPED,
-            self.right_motor == MotorState.STOPPED
-         ])
+      return self._snapshot & BOTH_MOTORS_STOPPED != 0
 
    def __str__(self):
-      with self._lock:
-         return (f"Klappe links: {self.left_door.name}, Klappe rechts: {self.right_door.name}, "
-               f"Pakettür: {self.paket_tuer.name}, "
-               f"Motor links: {self.left_motor.name}, Motor rechts: {self.right_motor.name}")
-      
+      return str(self._snapshot)
@@ -0,0 +1,67 @@
+# Machine-readable box state over MQTT: retained document plus sequenced deltas
+import json
+import time
+import threading
+import logging
+import mqtt
+from mqtt import Event
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+class StateDocument:
+    """Publishes the PaketBoxState of one box for dashboards.
+
+    The document {"boot":..,"seq":..,"left_door":..,...} goes to
+    Event.STATE, retained, so a new subscriber gets the current state at
+    once. It is sent on attach() and after every (re)connect; later
+    changes keep it current through the coalescing queue (only the newest
+    document waits). Every state change is also published on
+    Event.STATE_DELTA as {"seq":..,<changed field>:<new value>,...}.
+
+    seq counts the changes since boot (the start time of the process). A
+    subscriber that sees a delta with a seq other than its last one + 1
+    missed a change and takes the retained document again; a lower seq
+    means the box restarted. Fields are always in the order of
+    PaketBoxState.FIELDS, values are the enum names.
+    """
+    def __init__(self, state, publisher):
+        self.state = state
+        self.publisher = publisher
+        self.boot = int(time.time())
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._current = state.snapshot()
+        self._subscription = None
+
+    def attach(self):
+        """Publish the document now, on every reconnect and a delta per state change"""
+        with self._lock:
+            self._current = self.state.snapshot()
+        self._subscription = self.state.subscribe(self._state_changed)
+        mqtt.on_connected(self.publish_document)
+        self.publish_document()
+
+    def document(self):
+        with self._lock:
+            data = {'boot': self.boot, 'seq': self._seq}
+            data.update(self._current.to_dict())
+        return _dumps(data)
+
+    def publish_document(self):
+        return self.publisher.publish(Event.STATE, self.document())
+
+    def _state_changed(self, change):
+        # Läuft auf dem Notifier-Thread, Änderungen kommen in Reihenfolge
+        with self._lock:
+            self._seq += 1
+            self._current = change.current
+            delta = {'seq': self._seq}
+            for field in change.fields:
+                delta[field] = getattr(change.current, field).name
+        self.publisher.publish(Event.STATE_DELTA, _dumps(delta))
+        self.publish_document()
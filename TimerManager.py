@@ -1,12 +1,243 @@
 # Timer state management for active motor timers
 import threading
+import heapq
+import itertools
 import logging
+import Clock
 
 logger = logging.getLogger(__name__)
 
 
+class _TimerContext(threading.local):
+    running = False  # this thread is inside a timer callback
+
+
+_context = _TimerContext()
+
+
+def in_timer():
+    """True while the calling thread runs a timer callback, whichever scheduler started it"""
+    return _context.running
+
+
+def _run_timer(timer):
+    previous, _context.running = _context.running, True
+    try:
+        timer.function(*timer.args, **timer.kwargs)
+    except Exception as e:
+        logger.error(f"Fehler in Timer-Callback {getattr(timer.function, '__name__', timer.function)}: {e}")
+    finally:
+        _context.running = previous
+        timer.state = Timer.FINISHED
+
+
+class TimerScheduler:
+    """Runs all timers on one worker thread, ordered by deadline in a min-heap.
+
+    Scheduling is O(log n). Cancelling only flags the entry (O(1)); flagged
+    entries are dropped when they reach the top of the heap, and the heap is
+    compacted once more than half of it consists of cancelled entries.
+
+    With a virtual clock no thread is started; the clock calls run_due()
+    whenever it advances past a deadline.
+    """
+    def __init__(self, clock=None):
+        self.clock = clock or Clock.get_clock()
+        self._heap = []
+        self._cancelled = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        if self.clock.virtual:
+            self.clock.attach(self)
+
+    def schedule(self, timer):
+        """Queue timer to run timer.interval seconds from now"""
+        with self._cond:
+            timer.deadline = self.clock.now() + timer.interval
+            heapq.heappush(self._heap, (timer.deadline, next(self._seq), timer))
+            if self.clock.virtual:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="TimerScheduler", daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is timer:
+                self._cond.notify()
+
+    def cancel(self, timer):
+        """Prevent timer from running. Returns False if it already started or ran."""
+        with self._cond:
+            if timer.state != Timer.SCHEDULED:
+                return False
+            timer.state = Timer.CANCELLED
+            self._cancelled += 1
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [entry for entry in self._heap if entry[2].state == Timer.SCHEDULED]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+            return True
+
+    def pending(self):
+        """Number of timers still waiting to run"""
+        with self._cond:
+            return sum(1 for entry in self._heap if entry[2].state == Timer.SCHEDULED)
+
+    def next_deadline(self):
+        """Deadline of the next pending timer, None if there is none"""
+        with self._cond:
+            self._drop_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_cancelled(self):
+        while self._heap and self._heap[0][2].state != Timer.SCHEDULED:
+            heapq.heappop(self._heap)
+            self._cancelled = max(0, self._cancelled - 1)
+
+    def _next_due(self):
+        """Pop the next due timer, or return the seconds until the next deadline"""
+        self._drop_cancelled()
+        if not self._heap:
+            return None, None
+        deadline, _, timer = self._heap[0]
+        remaining = deadline - self.clock.now()
+        if remaining > 0:
+            return None, remaining
+        heapq.heappop(self._heap)
+        timer.state = Timer.RUNNING
+        return timer, 0
+
+    def _execute(self, timer):
+        _run_timer(timer)
+
+    def run_due(self):
+        """Run all timers whose deadline has passed in the calling thread"""
+        while True:
+            with self._cond:
+                timer, _ = self._next_due()
+            if timer is None:
+                return
+            self._execute(timer)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                timer, remaining = self._next_due()
+                if timer is None:
+                    self._cond.wait(remaining)
+                    continue
+            self._execute(timer)
+
+
+class LoopScheduler:
+    """Runs timers as loop.call_later() callbacks on an asyncio event loop.
+
+    Same interface as TimerScheduler for the asyncio runtime: no worker
+    thread, the timers run on the loop thread between the other callbacks.
+    schedule() and cancel() may also be called from other threads.
+    """
+    def __init__(self, loop, clock=None):
+        self.loop = loop
+        self.clock = clock or Clock.get_clock()
+        self._handles = {}  # timer -> asyncio.TimerHandle of every scheduled timer
+
+    def schedule(self, timer):
+        timer.deadline = self.clock.now() + timer.interval
+        if Clock.in_loop_thread(self.loop):
+            self._arm(timer)
+        else:
+            self.loop.call_soon_threadsafe(self._arm, timer)
+
+    def _arm(self, timer):
+        if timer.state == Timer.SCHEDULED:
+            self._handles[timer] = self.loop.call_later(max(0.0, timer.deadline - self.clock.now()),
+                                                        self._execute, timer)
+
+    def cancel(self, timer):
+        if timer.state != Timer.SCHEDULED:
+            return False
+        timer.state = Timer.CANCELLED
+        if Clock.in_loop_thread(self.loop):
+            self._disarm(timer)
+        else:
+            self.loop.call_soon_threadsafe(self._disarm, timer)
+        return True
+
+    def _disarm(self, timer):
+        handle = self._handles.pop(timer, None)
+        if handle is not None:
+            handle.cancel()
+
+    def pending(self):
+        return len(self._handles)
+
+    def next_deadline(self):
+        return min((timer.deadline for timer in self._handles), default=None)
+
+    def _execute(self, timer):
+        self._handles.pop(timer, None)
+        if timer.state != Timer.SCHEDULED:
+            return
+        timer.state = Timer.RUNNING
+        _run_timer(timer)
+
+
+default_scheduler = TimerScheduler()
+
+
+def use_clock(clock):
+    """Make clock the process-wide clock and schedule new Timers on it.
+
+    Returns the previous clock so tests can restore it.
+    """
+    global default_scheduler
+    previous = Clock.set_clock(clock)
+    default_scheduler = TimerScheduler(clock)
+    return previous
+
+
+def use_loop(loop):
+    """Schedule new Timers as callbacks on the asyncio loop (asyncio runtime).
+
+    Returns the previous scheduler.
+    """
+    global default_scheduler
+    previous, default_scheduler = default_scheduler, LoopScheduler(loop)
+    return previous
+
+
+class Timer:
+    """Drop-in replacement for threading.Timer that runs on a shared TimerScheduler"""
+    SCHEDULED = 'scheduled'
+    CANCELLED = 'cancelled'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+
+    def __init__(self, interval, function, args=None, kwargs=None, scheduler=None):
+        self.interval = interval
+        self.function = function
+        self.args = args if args is not None else []
+        self.kwargs = kwargs if kwargs is not None else {}
+        self.scheduler = scheduler or default_scheduler
+        self.deadline = None
+        self.state = None
+
+    def start(self):
+        self.state = Timer.SCHEDULED
+        self.scheduler.schedule(self)
+
+    def cancel(self):
+        return self.scheduler.cancel(self)
+
+    def is_alive(self):
+        return self.state in (Timer.SCHEDULED, Timer.RUNNING)
+
+
 class TimerManager:
-    """Central timer management for motor operations"""
+    """Central timer management for motor operations.
+
+    on_change, if set, is called without arguments after every add, cancel and
+    clear (used by Checkpoint.Checkpointer).
+    """
     def __init__(self):
         # Predefined timer categories
         self.active_timers = {
@@ -18,6 +249,11 @@ class TimerManager:
             'door_open_watchdog': None  # 15-Minuten-Überwachung für geöffnete Paket-Tür
         }
         self._lock = threading.Lock()
+        self.on_change = None
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
 
     def add_timer(self, timer_id: str, timer):
         """Add or replace a timer in the manager"""
@@ -27,6 +263,7 @@ class TimerManager:
                 self.active_timers[timer_id].cancel()
             # Add new timer (create key if doesn't exist)
             self.active_timers[timer_id] = timer
+        self._changed()
 
     def cancel_timer(self, timer_id: str):
         """Cancel a specific timer"""
@@ -34,6 +271,7 @@ class TimerManager:
             if timer_id in self.active_timers and self.active_timers[timer_id] is not None:
                 self.active_timers[timer_id].cancel()
                 self.active_timers[timer_id] = None
+        self._changed()
 
     def cancel_all_timers(self):
         """Cancel all active timers (emergency stop)"""
@@ -48,9 +286,11 @@ class TimerManager:
             self.active_timers = {key: None for key in self.active_timers.keys()}
             if cancelled_count > 0:
                 logger.info(f"Insgesamt {cancelled_count} Timer abgebrochen")
+        self._changed()
 
     def clear_timer(self, timer_id: str):
         """Clear a timer reference (called when timer completes normally)"""
         with self._lock:
             if timer_id in self.active_timers:
-                self.active_timers[timer_id] = None
\ No newline at end of file
+                self.active_timers[timer_id] = None
+        self._changed()
@@ -0,0 +1,143 @@
+# Fixed-size history of state transitions and input edges for post-mortem analysis
+import threading
+import itertools
+import logging
+import json
+from array import array
+from Clock import get_clock
+from TimerManager import in_timer
+from PaketBoxState import StateSnapshot
+
+logger = logging.getLogger(__name__)
+
+KIND_STATE = 0  # PaketBoxState update: old/new are packed StateSnapshot fields
+KIND_EDGE = 1   # debounced input change: field = input index, old/new = level
+
+# Cause codes: what triggered a state update
+CAUSE_OTHER = 0
+CAUSE_TIMER = 1
+CAUSE_INPUT = 16  # + input index
+
+_FIELD_NAMES = ('left_door', 'right_door', 'paket_tuer', 'left_motor', 'right_motor')
+_FIELD_MASK = (1 << 10) - 1
+# Packed entries of every possible edge, [index][new level]: building them
+# per edge would allocate several 64 bit ints
+_EDGE_ENTRIES = [tuple((CAUSE_INPUT + index) << 48 | new << 32 | (new ^ 1) << 16 | index << 8 | KIND_EDGE
+                       for new in (0, 1)) for index in range(256)]
+
+
+class TransitionHistory:
+    """Ring buffer of the last capacity events in two typed arrays.
+
+    Each entry is a timestamp ('d') and one packed 64 bit word ('Q') holding
+    kind, field, old, new and cause. Recording is O(1) and writes into the
+    preallocated arrays, so memory stays constant no matter how long the box
+    runs. Entries are decoded only when the history is dumped.
+
+    Writers reserve their slot with next() on an itertools.count, which is
+    atomic in CPython, so recording takes no lock. A third array stamps each
+    slot with its sequence number + 1, written after timestamp and entry;
+    count is the highest stamp, and a dump skips slots that are being
+    written or were overwritten meanwhile.
+
+    Causes: updates made inside a timer callback (TimerManager.in_timer(),
+    for the threaded and the asyncio scheduler alike) count as timer.
+    record_edge() sets dispatch to (cause, thread) until the dispatcher
+    resets it to None; updates of that thread in between are attributed to
+    the input. Everything else, e.g. MQTT commands or other threads during
+    a dispatch, counts as other.
+    """
+    def __init__(self, capacity, clock=None):
+        self.capacity = capacity
+        self.clock = clock
+        self._time = array('d', [0.0]) * capacity
+        self._entry = array('Q', [0]) * capacity
+        self._stamp = array('Q', [0]) * capacity  # sequence number + 1 of the complete entry
+        self._seq = itertools.count()
+        self.dispatch = None  # (CAUSE_INPUT + index, thread ident) while an edge is dispatched
+
+    def _record(self, entry):
+        n = next(self._seq)
+        i = n % self.capacity
+        self._stamp[i] = 0
+        self._time[i] = (self.clock or get_clock()).now()
+        self._entry[i] = entry
+        self._stamp[i] = n + 1
+
+    @property
+    def count(self):
+        """Events recorded since start, including overwritten ones"""
+        return max(self._stamp)
+
+    def current_cause(self):
+        if in_timer():
+            return CAUSE_TIMER
+        dispatch = self.dispatch
+        if dispatch is not None and dispatch[1] == threading.get_ident():
+            return dispatch[0]
+        return CAUSE_OTHER
+
+    def record_state(self, previous, current):
+        if previous is current:
+            return  # set to the value it already had
+        self._record(self.current_cause() << 48 | (current & _FIELD_MASK) << 32
+                     | (previous & _FIELD_MASK) << 16 | KIND_STATE)
+
+    def record_edge(self, index, old, new):
+        """Record a dispatched edge and attribute the following state updates to it"""
+        self.dispatch = (CAUSE_INPUT + index, threading.get_ident())
+        # _record() inlined: this runs for every edge before its handlers
+        n = next(self._seq)
+        i = n % self.capacity
+        stamp = self._stamp
+        stamp[i] = 0
+        self._time[i] = (self.clock or get_clock()).now()
+        self._entry[i] = _EDGE_ENTRIES[index][new]
+        stamp[i] = n + 1
+
+    def entries(self, last=None):
+        """Oldest first: (time, kind, field, old, new, cause) of the last entries"""
+        count = self.count
+        size = min(count, self.capacity)
+        if last is not None:
+            size = min(size, last)
+        raw = []
+        for n in range(count - size, count):
+            i = n % self.capacity
+            if self._stamp[i] == n + 1:
+                entry = (self._time[i], self._entry[i])
+                if self._stamp[i] == n + 1:
+                    raw.append(entry)
+        return [(t, e & 0xFF, e >> 8 & 0xFF, e >> 16 & 0xFFFF, e >> 32 & 0xFFFF, e >> 48) for t, e in raw]
+
+    @staticmethod
+    def cause_name(cause):
+        if cause >= CAUSE_INPUT:
+            return f"Eingang {cause - CAUSE_INPUT}"
+        return 'Timer' if cause == CAUSE_TIMER else 'sonstig'
+
+    def decode(self, last=None):
+        """Entries as dicts, state updates split into one dict per changed field"""
+        events = []
+        for t, kind, field, old, new, cause in self.entries(last):
+            if kind == KIND_EDGE:
+                events.append({'t': round(t, 4), 'field': f"input{field}", 'old': old, 'new': new,
+                               'cause': self.cause_name(cause)})
+                continue
+            before = int.__new__(StateSnapshot, old)
+            after = int.__new__(StateSnapshot, new)
+            for name in _FIELD_NAMES:
+                old_value, new_value = getattr(before, name), getattr(after, name)
+                if old_value is not new_value:
+                    events.append({'t': round(t, 4), 'field': name, 'old': old_value.name,
+                                   'new': new_value.name, 'cause': self.cause_name(cause)})
+        return events
+
+    def to_json(self, last=None):
+        return json.dumps({'count': self.count, 'events': self.decode(last)})
+
+    def log_dump(self, last=None):
+        events = self.decode(last)
+        logger.info(f"Verlauf der letzten {len(events)} Ereignisse ({self.count} seit Start):")
+        for e in events:
+            logger.info(f"  {e['t']:.3f} {e['field']}: {e['old']} -> {e['new']} ({e['cause']})")
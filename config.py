@@ -4,9 +4,44 @@ import os
 class Config:
     CLOSURE_TIMER_SECONDS = 65
     MOTOR_REVERSE_SIGNAL = CLOSURE_TIMER_SECONDS - 1
-    DEBOUNCE_TIME = 0.2
+    DEBOUNCE_TIME = 0.2            # Standard-Entprellzeit in Sekunden
+    # Entprellzeit je Eingang (Index wie INPUTS), fehlende Einträge verwenden DEBOUNCE_TIME
+    DEBOUNCE_TIMES = {
+        0: 0.05, 1: 0.05, 2: 0.05, 3: 0.05,  # Endschalter Klappen
+        4: 0.05, 5: 0.05,                    # Reed-/Magnetkontakte Zustelltür, Briefkasten
+        7: 0.02,                             # Paketbox Tür zum Leeren, löst den Nothalt aus
+        8: 0.05, 9: 0.05,                    # Taster
+        10: 0.5,                             # Bewegungsmelder
+    }
+    INPUT_OVERSAMPLING = 1         # Lesevorgänge je Abtastung, ungerade Zahl = Mehrheitsentscheid
     ERROR_REPORT_INTERVAL = 5.0
 
+    # Eingänge: 'interrupt' (GPIO.add_event_detect) oder 'poll' (zyklisches Abfragen)
+    INPUT_MODE = os.environ.get('PAKETBOX_INPUT_MODE', 'interrupt')
+    # Laufzeit: 'threads' (Hauptloop plus Hilfs-Threads) oder 'asyncio' (alles in einem Event-Loop)
+    RUNTIME = os.environ.get('PAKETBOX_RUNTIME', 'threads')
+    POLL_INTERVAL = 1.0            # Sekunden zwischen zwei Abfragen im Polling-Modus
+    INPUT_RESYNC_INTERVAL = 5.0    # Sicherheits-Abfrage im Interrupt-Modus (verpasste Flanken)
+    SAMPLE_INTERVAL_ACTIVE = 0.02  # Abtastintervall bei laufendem Motor / offener Zustelltür (50 Hz)
+    SAMPLE_STATS_INTERVAL = 3600   # Sekunden zwischen zwei Statistik-Ausgaben der Abtastung
+    HISTORY_SIZE = 1024            # Einträge im Verlauf (Zustandswechsel und Flanken), SIGUSR1 = Ausgabe
+    HISTORY_DUMP = 100             # Einträge je Ausgabe per Log/MQTT
+    CONTROL_QUEUE_SIZE = 16        # wartende Aufgaben für den Steuer-Thread (z.B. MQTT-Befehle), danach abgelehnt
+
+    # Zustandssicherung für schnellen Neustart (Zustand, laufende Timer, Ausgänge), leer = aus (Standard);
+    # absoluten Pfad angeben, z.B. PAKETBOX_CHECKPOINT=/var/lib/paketbox/paketbox.checkpoint
+    CHECKPOINT_FILE = os.environ.get('PAKETBOX_CHECKPOINT', '')
+    CHECKPOINT_INTERVAL = 0.5      # Sekunden, in denen Änderungen zu einem Schreibvorgang gebündelt werden
+
+    # Hardware-Simulation statt MockGPIO, wenn RPi.GPIO fehlt (PAKETBOX_SIMULATION=1)
+    SIMULATION = os.environ.get('PAKETBOX_SIMULATION', '0') == '1'
+    SIM_FLAP_TRAVEL_TIME = 20.0    # Sekunden, die eine simulierte Klappe von Endlage zu Endlage braucht
+
+    # Flotten-Modus: mehrere Boxen in einem Prozess, JSON-Datei mit einer Liste von
+    # {"name", "inputs", "outputs", "topic_prefix"} je Box (PAKETBOX_FLEET=/pfad/fleet.json)
+    FLEET_FILE = os.environ.get('PAKETBOX_FLEET', '')
+    FLEET_SIM_BOXES = int(os.environ.get('PAKETBOX_FLEET_SIM', '0'))  # >0: so viele simulierte Boxen
+
     # MQTT Configuration - uses environment variables with fallback defaults for testing
     MQTT_USER = os.environ.get('MQTT_USER', 'dein_benutzername')
     MQTT_PASS = os.environ.get('MQTT_PASS', 'dein_passwort')
@@ -17,6 +52,26 @@ class Config:
     MQTT_TOPIC_BRIEFKASTEN = os.environ.get('MQTT_TOPIC_BRIEFKASTEN', 'home/raspi/briefkasten')
     MQTT_TOPIC_BRIEFKASTEN_ENTLEEREN = os.environ.get('MQTT_TOPIC_BRIEFKASTEN_ENTLEEREN', 'home/raspi/briefkastenleeren')
     MQTT_TOPIC_PAKETBOX_ENTLEEREN = os.environ.get('MQTT_TOPIC_PAKETBOX_ENTLEEREN', 'home/raspi/paketboxleeren')
+    MQTT_TOPIC_BEWEGUNGSMELDER = os.environ.get('MQTT_TOPIC_BEWEGUNGSMELDER', 'home/raspi/bewegungsmelder')
+    MQTT_TOPIC_LATENCY = os.environ.get('MQTT_TOPIC_LATENCY', 'home/raspi/paketbox_latenz')
+    MQTT_TOPIC_HISTORY = os.environ.get('MQTT_TOPIC_HISTORY', 'home/raspi/paketbox_verlauf')
+    MQTT_TOPIC_STATE = os.environ.get('MQTT_TOPIC_STATE', 'home/raspi/paketbox_state')  # retained
+    MQTT_TOPIC_STATE_DELTA = os.environ.get('MQTT_TOPIC_STATE_DELTA', 'home/raspi/paketbox_state_delta')
+    # Befehle an die Box ({"id": .., "cmd": ..} oder nur der Befehlsname) und Quittungen mit Latenz
+    MQTT_TOPIC_COMMAND = os.environ.get('MQTT_TOPIC_COMMAND', 'home/raspi/paketbox_cmd')
+    MQTT_TOPIC_COMMAND_ACK = os.environ.get('MQTT_TOPIC_COMMAND_ACK', 'home/raspi/paketbox_cmd_ack')
+    MQTT_COMMAND_MAX_BYTES = 256   # längere Befehle werden abgelehnt
+    MQTT_QUEUE_SIZE = 256          # Nachrichten in der Sende-Queue, danach wird die älteste verworfen
+    MQTT_FLUSH_TIMEOUT = 2.0       # Sekunden, die stop_mqtt() auf noch wartende Nachrichten wartet
+    MQTT_RECONNECT_MIN = 1.0       # Wartezeit vor dem ersten Reconnect, verdoppelt sich je Fehlversuch (mit Zufallsanteil)
+    MQTT_RECONNECT_MAX = 60.0      # obere Grenze der Wartezeit; die Zahl der Versuche ist unbegrenzt
+    # Spool auf Platte für Broker-Ausfälle (leer = aus, Standard): Segmentdateien, nach dem Reconnect gedrosselt
+    # nachgesendet; absoluten Pfad angeben, z.B. PAKETBOX_MQTT_SPOOL=/var/lib/paketbox/mqtt_spool
+    MQTT_SPOOL_DIR = os.environ.get('PAKETBOX_MQTT_SPOOL', '')
+    MQTT_SPOOL_MAX_BYTES = 4 * 1024 * 1024      # darüber wird das älteste Segment verworfen
+    MQTT_SPOOL_SEGMENT_BYTES = 256 * 1024
+    MQTT_SPOOL_REPLAY_RATE = 20    # Nachrichten je Sekunde beim Nachsenden
+    MQTT_SPOOL_RETRY = 5.0         # Sekunden bis zum nächsten Versuch, solange der Broker nicht erreichbar ist
    
     # GPIO pin assignments
     # Using BCM numbering
@@ -7,57 +7,342 @@ except ImportError:
 
 import logging
 import time
+import threading
+import collections
+from enum import Enum, auto
 from config import Config as config
+from MqttSpool import MqttSpool
+from MqttLink import MqttLink, AsyncMqttLink
+from Clock import in_loop_thread
 
 logger = logging.getLogger(__name__)
 
 _client = None  # interne Referenz für den MQTT-Client
+_link = None    # MqttLink: Netzwerk-Thread und Reconnect von _client
+_loop = None    # asyncio-Loop im asyncio-Betrieb, see use_loop()
+_connect_callbacks = []  # see on_connected()
+_message_handlers = {}   # topic -> handler(payload), see on_message()
+
+# Overflow policies of the publish queue, chosen per message
+POLICY_DROP_OLDEST = 'drop_oldest'  # Ereignisse: Reihenfolge bleibt, bei voller Queue fällt die älteste Nachricht weg
+POLICY_LATEST = 'latest'            # Berichte: eine noch wartende Nachricht desselben Topics wird ersetzt
+
+
+class PublishQueue:
+    """Bounded queue between the control threads and one MQTT sender thread.
+
+    put() is O(1) and only holds the queue lock for a deque append, so edge
+    handlers, timers and the emergency stop never wait for the broker. The
+    sender thread (started on the first put) drains the queue in batches and
+    calls _client.publish(). When the queue is full the oldest message is
+    dropped. Messages with POLICY_LATEST are coalesced: while one is still
+    waiting, a newer payload for the same topic replaces it in place.
+
+    Topics in retained are published with the retain flag, also on replay.
+
+    With a spool (MqttSpool) messages that cannot be published because the
+    broker is unreachable go to disk, one batch per fsync. Once the client is
+    connected again the spool is replayed in order at MQTT_SPOOL_REPLAY_RATE
+    messages per second; new messages queue up behind it to keep the order.
+    """
+    def __init__(self, maxsize=None, spool=None):
+        self.maxsize = maxsize or config.MQTT_QUEUE_SIZE
+        self.spool = spool
+        self._items = collections.deque()  # (topic, [payload]), the list is replaced in place
+        self._latest = {}                  # topic -> waiting entry of a POLICY_LATEST message
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._busy = False
+        self._thread = None
+        self._next_replay = 0.0
+        self.retained = set()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.spooled = 0
+        self.replayed = 0
+
+    def put(self, topic, payload, policy=POLICY_DROP_OLDEST):
+        with self._lock:
+            if policy == POLICY_LATEST:
+                entry = self._latest.get(topic)
+                if entry is not None:
+                    entry[1][0] = payload
+                    self.coalesced += 1
+                    return True
+            entry = (topic, [payload])
+            if len(self._items) >= self.maxsize:
+                old_topic, old_payload = self._items.popleft()
+                if self._latest.get(old_topic, (None, None))[1] is old_payload:
+                    del self._latest[old_topic]
+                self.dropped += 1
+                logger.debug(f"MQTT-Queue voll, älteste Nachricht verworfen: {old_topic}")
+            self._items.append(entry)
+            if policy == POLICY_LATEST:
+                self._latest[topic] = entry
+            self._start()
+            self._ready.notify()
+            return True
+
+    def wake(self):
+        """Check the connection now, e.g. after a reconnect, and replay the spool"""
+        with self._lock:
+            self._next_replay = 0.0
+            if self.spool is not None and self.spool.pending_bytes():
+                self._start()
+            self._ready.notify()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="MqttSender", daemon=True)
+            self._thread.start()
+
+    def pending(self):
+        with self._lock:
+            return len(self._items)
+
+    def flush(self, timeout=None):
+        """Wait until the queue is empty and the last batch was published or spooled"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._items and not self._busy, timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = {'pending': len(self._items), 'sent': self.sent, 'dropped': self.dropped,
+                     'coalesced': self.coalesced, 'failed': self.failed}
+            if self.spool is not None:
+                stats.update(spooled=self.spooled, replayed=self.replayed,
+                             spool_bytes=self.spool.pending_bytes(), spool_dropped_bytes=self.spool.dropped_bytes)
+            return stats
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._busy = False
+                while not self._items:
+                    self._idle.notify_all()
+                    timeout = self._replay_timeout()
+                    if timeout == 0:
+                        break
+                    self._ready.wait(timeout)
+                batch = [(topic, payload[0]) for topic, payload in self._items]
+                self._items.clear()
+                self._latest.clear()
+                self._busy = bool(batch)
+            if batch:
+                self._deliver(batch)
+            if self.spool is not None and self._replay_timeout() == 0:
+                self._replay()
+
+    def _replay_timeout(self):
+        """Seconds until the next replay step, None if the spool is empty"""
+        if self.spool is None or not self.spool.pending_bytes():
+            return None
+        return max(0.0, self._next_replay - time.monotonic())
+
+    def _connected(self):
+        client = _client
+        if client is None:
+            return False
+        is_connected = getattr(client, 'is_connected', None)
+        return bool(is_connected()) if callable(is_connected) else True
+
+    def _deliver(self, batch):
+        spool = self.spool
+        if spool is not None and (spool.pending_bytes() or not self._connected()):
+            self._to_spool(batch)
+            return
+        for index, (topic, payload) in enumerate(batch):
+            if not self._publish(topic, payload) and spool is not None:
+                self._to_spool(batch[index:])
+                return
+
+    def _to_spool(self, messages):
+        try:
+            self.spool.append(messages)
+            self.spooled += len(messages)
+        except Exception as e:  # z.B. Platte voll oder Payload nicht als JSON speicherbar; Sender läuft weiter
+            self.failed += len(messages)
+            logger.error(f"MQTT-Spool: {len(messages)} Nachrichten nicht gespeichert: {e}")
+
+    def _replay(self):
+        """Send the next few spooled messages; paced to MQTT_SPOOL_REPLAY_RATE"""
+        rate = config.MQTT_SPOOL_REPLAY_RATE
+        if not self._connected():
+            self._next_replay = time.monotonic() + config.MQTT_SPOOL_RETRY
+            return
+        messages = self.spool.peek(max(1, rate // 10))
+        sent = []
+        for message in messages:
+            topic, payload, _ = message
+            if topic is not None and not self._publish(topic, payload):
+                break
+            sent.append(message)
+        self.spool.commit(sent)
+        self.replayed += sum(1 for topic, _, _ in sent if topic is not None)
+        if len(sent) < len(messages):
+            self._next_replay = time.monotonic() + config.MQTT_SPOOL_RETRY
+        else:
+            self._next_replay = time.monotonic() + len(sent) / rate
+            if not self.spool.pending_bytes():
+                logger.info(f"MQTT-Spool nachgesendet ({self.replayed} Nachrichten seit Start).")
+
+    def _publish(self, topic, payload):
+        """Publish one message; False if the broker did not take it"""
+        client = _client
+        try:
+            if client is None:
+                raise RuntimeError("kein MQTT-Client")
+            if topic in self.retained:
+                result = client.publish(topic, payload, retain=True)
+            else:
+                result = client.publish(topic, payload)
+            rc = getattr(result, 'rc', 0)
+            if isinstance(rc, int) and rc != 0:
+                raise RuntimeError(f"Rückgabecode {rc}")
+            self.sent += 1
+            logger.debug(f"MQTT gesendet: {topic}")
+            return True
+        except Exception as e:
+            if self.spool is None:
+                self.failed += 1
+                logger.error(f"MQTT-Senden an {topic} fehlgeschlagen: {e}")
+            else:
+                logger.debug(f"MQTT-Senden an {topic} fehlgeschlagen, Nachricht in den Spool: {e}")
+            return False
+
+
+class AsyncPublishQueue(PublishQueue):
+    """PublishQueue for the asyncio runtime: drained by loop callbacks instead of a sender thread.
+
+    put() schedules one drain callback; the batch is handed to paho, which
+    writes it from the loop as the socket becomes writable (AsyncMqttLink).
+    Spool replay is paced with loop.call_later().
+    """
+    def __init__(self, loop, maxsize=None, spool=None):
+        super().__init__(maxsize, spool)
+        self.loop = loop
+        self._drain_scheduled = False
+        self._replay_handle = None
+
+    def _start(self):
+        # Called under the queue lock by put() and wake()
+        if not self._drain_scheduled:
+            self._drain_scheduled = True
+            if in_loop_thread(self.loop):
+                self.loop.call_soon(self._drain)
+            else:
+                self.loop.call_soon_threadsafe(self._drain)
+
+    def wake(self):
+        with self._lock:
+            self._next_replay = 0.0
+            self._start()
+
+    def _drain(self):
+        with self._lock:
+            self._drain_scheduled = False
+            batch = [(topic, payload[0]) for topic, payload in self._items]
+            self._items.clear()
+            self._latest.clear()
+        if batch:
+            self._deliver(batch)
+        if self.spool is not None and self._replay_timeout() == 0:
+            self._replay()
+        timeout = self._replay_timeout()
+        if self._replay_handle is not None:
+            self._replay_handle.cancel()
+        self._replay_handle = self.loop.call_later(timeout, self.wake) if timeout is not None else None
+        with self._lock:
+            self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        if in_loop_thread(self.loop) or not self.loop.is_running():
+            self._drain()  # auf dem Loop-Thread bzw. ohne laufenden Loop kann nicht gewartet werden: jetzt senden
+            return self.pending() == 0
+        return super().flush(timeout)
+
+
+_queue = PublishQueue()
+
+def use_loop(loop):
+    """asyncio runtime: send from loop callbacks and run the network I/O on loop. Call before start_mqtt()."""
+    global _queue, _loop
+    _loop = loop
+    retained = _queue.retained
+    _queue = AsyncPublishQueue(loop, spool=_queue.spool)
+    _queue.retained = retained
 
 def mqtt_connect(client, userdata, flags, rc):
     if rc == 0:
         logger.info("Verbunden mit MQTT-Broker")
+        if _link is not None:
+            _link.connected()
         client.subscribe(config.MQTT_TOPIC_MESSAGE)
+        for topic in list(_message_handlers):
+            client.subscribe(topic)
+        _queue.wake()  # gespoolte Nachrichten nachsenden
+        for callback in list(_connect_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Fehler in MQTT-Connect-Callback {getattr(callback, '__name__', callback)}: {e}")
     else:
         logger.warning(f"MQTT-Verbindung fehlgeschlagen, Rückgabecode: {rc}")
 
+def on_connected(callback):
+    """Call callback() after every successful (re)connect, on the network thread; must not block"""
+    _connect_callbacks.append(callback)
+
 def mqtt_disconnect(client, userdata, rc):
-    """Handle MQTT disconnection with limited retry attempts."""
+    """Connection lost: only recorded here, MqttLink reconnects on its own thread."""
     if not MQTT_AVAILABLE:
         return
-        
-    logger.warning("MQTT-Verbindung verloren. Versuche erneut zu verbinden...")
-    max_retries = 5
-    retry_count = 0
-    base_delay = 5  # seconds
-    
-    while retry_count < max_retries:
-        try:
-            retry_count += 1
-            # Exponential backoff with jitter
-            delay = min(base_delay * (2 ** (retry_count - 1)), 60)
-            logger.info(f"Reconnect-Versuch {retry_count}/{max_retries} in {delay} Sekunden...")
-            time.sleep(delay)
-            
-            client.reconnect()
-            logger.info("MQTT erfolgreich wieder verbunden.")
-            return
-        except Exception as e:
-            logger.error(f"Reconnect-Versuch {retry_count} fehlgeschlagen: {e}")
-            if retry_count >= max_retries:
-                logger.error(f"MQTT-Reconnect nach {max_retries} Versuchen aufgegeben. Manueller Neustart erforderlich.")
-                break
+    if rc != 0:
+        logger.warning(f"MQTT-Verbindung verloren (Rückgabecode {rc}). Neuer Versuch im Hintergrund.")
+    if _link is not None:
+        _link.disconnected()
+
+def on_message(topic, handler):
+    """Subscribe topic and call handler(payload bytes) for each message, on the network thread.
+
+    handler must not block; slow work belongs on the control thread (InputEngine.post).
+    """
+    _message_handlers[topic] = handler
+    if _client is not None:
+        _client.subscribe(topic)  # ohne Verbindung folgt das Abonnement in mqtt_connect
 
 def mqtt_message(client, userdata, msg):
-    logger.info(f"Nachricht empfangen: {msg.topic} {msg.payload.decode()}")
+    handler = _message_handlers.get(msg.topic)
+    if handler is None:
+        logger.info(f"Nachricht empfangen: {msg.topic} {msg.payload.decode(errors='replace')}")
+        return
+    try:
+        handler(msg.payload)
+    except Exception as e:
+        logger.error(f"Fehler bei Nachricht auf {msg.topic}: {e}")
 
 def start_mqtt():
-    """Initialisiert und startet die MQTT-Verbindung im Hintergrund."""
-    global _client
+    """Initialisiert und startet die MQTT-Verbindung im Hintergrund.
+
+    Der Verbindungsaufbau läuft im MqttLink-Thread; ist der Broker nicht
+    erreichbar, wird es dort ohne Begrenzung weiter versucht.
+    """
+    global _client, _link
     
     if not MQTT_AVAILABLE:
         logger.warning("MQTT nicht verfügbar - paho-mqtt Bibliothek nicht installiert")
         return False
         
+    if config.MQTT_SPOOL_DIR and _queue.spool is None:
+        try:
+            _queue.spool = MqttSpool(config.MQTT_SPOOL_DIR)
+            _queue.wake()  # Nachrichten aus dem letzten Lauf
+        except OSError as e:
+            logger.error(f"MQTT-Spool {config.MQTT_SPOOL_DIR} nicht verfügbar: {e}")
+
     try:
         _client = mqtt.Client()
         _client.username_pw_set(config.MQTT_USER, config.MQTT_PASS)  # <--- Zugangsdaten setzen
@@ -65,8 +350,9 @@ def start_mqtt():
         _client.on_disconnect = mqtt_disconnect
         _client.on_message = mqtt_message
 
-        _client.connect(config.MQTT_BROKER, config.MQTT_PORT, 60)
-        _client.loop_start()
+        _client.connect_async(config.MQTT_BROKER, config.MQTT_PORT, 60)
+        _link = MqttLink(_client) if _loop is None else AsyncMqttLink(_client, _loop)
+        _link.start()
         logger.info("MQTT-Client gestartet.")
         return True
     except Exception as e:
@@ -77,76 +363,153 @@ def stop_mqtt():
     """Beendet die MQTT-Verbindung."""
     global _client
     if _client:
-        _client.loop_stop()
-        _client.disconnect()
+        _queue.flush(config.MQTT_FLUSH_TIMEOUT)  # noch wartende Nachrichten senden
+        if _link is not None:
+            _link.stop()
+        else:
+            _client.disconnect()
         logger.info("MQTT-Client gestoppt.")
 
-def publish_status(message):
-    """Sendet eine Statusnachricht über MQTT."""
+def _send(topic, payload, what, policy=POLICY_DROP_OLDEST):
+    """Queue payload for the sender thread; never waits on the network."""
     if not MQTT_AVAILABLE:
-        logger.debug(f"MQTT nicht verfügbar - Status ignoriert: {message}")
+        logger.debug(f"MQTT nicht verfügbar - {what} ignoriert: {payload}")
         return False
-        
+
     if _client:
-        _client.publish(config.MQTT_TOPIC_MESSAGE, message)
-        logger.info(f"MQTT gesendet: {message}")
-        return True
+        return _queue.put(topic, payload, policy)
     else:
-        logger.warning("MQTT-Client nicht verbunden, Nachricht nicht gesendet.")
+        logger.warning(f"MQTT-Client nicht verbunden, {what} nicht gesendet.")
         return False
 
+class Event(Enum):
+    """Everything the box publishes; each member is one row of EVENTS"""
+    STATUS = auto()
+    PAKET_ZUSTELLER = auto()
+    BRIEFKASTEN = auto()
+    BRIEFKASTEN_ENTLEEREN = auto()
+    PAKETBOX_ENTLEEREN = auto()
+    BEWEGUNGSMELDER = auto()
+    LATENCY = auto()
+    HISTORY = auto()
+    STATE = auto()
+    STATE_DELTA = auto()
+    COMMAND_ACK = auto()
+
+
+# Event -> (Config attribute of the topic, name in log messages, overflow policy,
+#           skip repeated payloads, retained)
+EVENTS = {
+    Event.STATUS: ('MQTT_TOPIC_MESSAGE', "Status", POLICY_DROP_OLDEST, False, False),
+    Event.PAKET_ZUSTELLER: ('MQTT_TOPIC_PAKETZUSTELLER', "Paket-Zusteller-Event", POLICY_DROP_OLDEST, True, False),
+    Event.BRIEFKASTEN: ('MQTT_TOPIC_BRIEFKASTEN', "Briefkasten-Event", POLICY_DROP_OLDEST, True, False),
+    Event.BRIEFKASTEN_ENTLEEREN: ('MQTT_TOPIC_BRIEFKASTEN_ENTLEEREN', "Briefkasten-Entleeren-Event",
+                                  POLICY_DROP_OLDEST, True, False),
+    Event.PAKETBOX_ENTLEEREN: ('MQTT_TOPIC_PAKETBOX_ENTLEEREN', "Paketbox-Entleeren-Event",
+                               POLICY_DROP_OLDEST, True, False),
+    Event.BEWEGUNGSMELDER: ('MQTT_TOPIC_BEWEGUNGSMELDER', "Bewegungsmelder-Event", POLICY_DROP_OLDEST, True, False),
+    Event.LATENCY: ('MQTT_TOPIC_LATENCY', "Latenzbericht", POLICY_LATEST, False, False),
+    Event.HISTORY: ('MQTT_TOPIC_HISTORY', "Verlauf", POLICY_LATEST, False, False),
+    Event.STATE: ('MQTT_TOPIC_STATE', "Zustand", POLICY_LATEST, False, True),
+    Event.STATE_DELTA: ('MQTT_TOPIC_STATE_DELTA', "Zustandsänderung", POLICY_DROP_OLDEST, False, False),
+    Event.COMMAND_ACK: ('MQTT_TOPIC_COMMAND_ACK', "Befehlsquittung", POLICY_DROP_OLDEST, False, False),
+}
+
+
+def box_topic(topic, prefix=None):
+    """topic of the box with this prefix: <prefix>/<last level of topic>, unchanged without prefix"""
+    if not prefix:
+        return topic
+    return f"{prefix.rstrip('/')}/{topic.rsplit('/', 1)[-1]}"
+
+
+class Publisher:
+    """Publishes Events of one box through the shared client connection.
+
+    The topic of every event is resolved once when the publisher is created.
+    With a prefix (fleet mode) each topic is moved below it, keeping its last
+    level (home/raspi/paketbox -> <prefix>/paketbox). For ON/OFF events a
+    payload equal to the last one queued on that topic is skipped, so reed
+    contact chatter does not reach the broker twice.
+    """
+    def __init__(self, prefix=None):
+        self.prefix = prefix.rstrip('/') if prefix else None
+        self._routes = {}  # event -> (topic, what, policy, dedup)
+        for event, (attribute, what, policy, dedup, retain) in EVENTS.items():
+            topic = box_topic(getattr(config, attribute), self.prefix)
+            if self.prefix:
+                what = f"{what} ({self.prefix})"
+            self._routes[event] = (topic, what, policy, dedup)
+            if retain:
+                _queue.retained.add(topic)
+        self._last = {}    # event -> last payload queued
+        self.skipped = 0
+
+    def topic(self, event):
+        return self._routes[event][0]
+
+    def publish(self, event, payload):
+        topic, what, policy, dedup = self._routes[event]
+        if dedup and self._last.get(event) == payload:
+            self.skipped += 1
+            return True
+        sent = _send(topic, payload, what, policy)
+        if dedup and sent:
+            self._last[event] = payload  # nur gesendete Werte zählen, sonst ginge das erste ON nach dem Connect verloren
+        return sent
+
+    def publish_status(self, message):
+        return self.publish(Event.STATUS, message)
+
+    def publish_latency(self, report):
+        return self.publish(Event.LATENCY, report)
+
+    def publish_history(self, report):
+        return self.publish(Event.HISTORY, report)
+
+
+_publisher = Publisher()  # Standard-Box ohne Präfix
+
+def publish(event, payload):
+    """Sendet ein Event der Standard-Box über MQTT."""
+    return _publisher.publish(event, payload)
+
+def publish_status(message):
+    """Sendet eine Statusnachricht über MQTT."""
+    return _publisher.publish(Event.STATUS, message)
+
 def publish_paket_zusteller_event(state):
     """Sendet Paket-Zusteller-Event (ON/OFF)."""
-    if not MQTT_AVAILABLE:
-        logger.debug(f"MQTT nicht verfügbar - Paket-Zusteller-Event ignoriert: {state}")
-        return False
-        
-    if _client:
-        _client.publish(config.MQTT_TOPIC_PAKETZUSTELLER, state)
-        logger.info(f"Paket-Zusteller-Event gesendet: {state}")
-        return True
-    else:
-        logger.warning("MQTT-Client nicht verbunden, Paket-Zusteller-Event nicht gesendet.")
-        return False
+    return _publisher.publish(Event.PAKET_ZUSTELLER, state)
 
 def publish_briefkasten_event(state):
     """Sendet Briefkasten-Event (ON/OFF)."""
-    if not MQTT_AVAILABLE:
-        logger.debug(f"MQTT nicht verfügbar - Briefkasten-Event ignoriert: {state}")
-        return False
-        
-    if _client:
-        _client.publish(config.MQTT_TOPIC_BRIEFKASTEN, state)
-        logger.info(f"Briefkasten-Event gesendet: {state}")
-        return True
-    else:
-        logger.warning("MQTT-Client nicht verbunden, Briefkasten-Event nicht gesendet.")
-        return False
+    return _publisher.publish(Event.BRIEFKASTEN, state)
 
 def publish_briefkasten_entleeren_event(state):
     """Sendet Briefkasten-Entleeren-Event (ON/OFF)."""
-    if not MQTT_AVAILABLE:
-        logger.debug(f"MQTT nicht verfügbar - Briefkasten-Entleeren-Event ignoriert: {state}")
-        return False
-        
-    if _client:
-        _client.publish(config.MQTT_TOPIC_BRIEFKASTEN_ENTLEEREN, state)
-        logger.info(f"Briefkasten-Entleeren-Event gesendet: {state}")
-        return True
-    else:
-        logger.warning("MQTT-Client nicht verbunden, Briefkasten-Entleeren-Event nicht gesendet.")
-        return False
+    return _publisher.publish(Event.BRIEFKASTEN_ENTLEEREN, state)
 
 def publish_paketbox_entleeren_event(state):
     """Sendet Paketbox-Entleeren-Event (ON/OFF)."""
-    if not MQTT_AVAILABLE:
-        logger.debug(f"MQTT nicht verfügbar - Paketbox-Entleeren-Event ignoriert: {state}")
-        return False
-        
-    if _client:
-        _client.publish(config.MQTT_TOPIC_PAKETBOX_ENTLEEREN, state)
-        logger.info(f"Paketbox-Entleeren-Event gesendet: {state}")
-        return True
-    else:
-        logger.warning("MQTT-Client nicht verbunden, Paketbox-Entleeren-Event nicht gesendet.")
-        return False
\ No newline at end of file
+    return _publisher.publish(Event.PAKETBOX_ENTLEEREN, state)
+
+def publish_latency(report):
+    """Sendet die Latenz-Histogramme (JSON) der Eingangsereignisse; nur der neueste Bericht zählt."""
+    return _publisher.publish(Event.LATENCY, report)
+
+def publish_history(report):
+    """Sendet den Verlauf der letzten Zustandswechsel (JSON); nur der neueste Verlauf zählt."""
+    return _publisher.publish(Event.HISTORY, report)
+
+def flush(timeout=None):
+    """Wait until the sender thread has published everything queued so far"""
+    return _queue.flush(timeout)
+
+def queue_stats():
+    """Counters of the publish queue: pending, sent, dropped, coalesced, failed"""
+    return _queue.stats()
+
+def connection_stats():
+    """Connection state and reconnect metrics (MqttLink.stats()), None before start_mqtt()"""
+    return _link.stats() if _link is not None else None
@@ -2,10 +2,18 @@
 # Version 0.7.0
 import time
 import sys
+import signal
 import logging
 from PaketBoxState import DoorState, MotorState
 from config import *
-from state import pbox_state, sendMqttErrorState, mqttObject  # Import from central state module
+from state import pbox_state, history  # Import from central state module
+from InputEngine import InputEngine
+from Clock import get_clock
+from LatencyMonitor import latency_monitor, InstrumentedGPIO
+from Checkpoint import Checkpointer, LoopCheckpointWriter
+from PaketBoxState import LoopNotifier
+import AsyncRuntime
+from PaketBoxController import PaketBoxController, EDGE_FALLING, EDGE_RISING, ERROR_VALUES
 import mqtt
 
 # Configure logging
@@ -47,10 +55,21 @@ except ImportError:
          print(f"[MOCK] GPIO add_event_detect(pin={pin}, edge={edge}, bouncetime={bouncetime})")
       def cleanup(self):
          print(f"[MOCK] GPIO cleanup()")
-   GPIO = MockGPIO()
+   if Config.SIMULATION:
+      from GpioSimulator import SimulatedGPIO
+      GPIO = SimulatedGPIO()
+   else:
+      GPIO = MockGPIO()
    
 
-# Import handler after state is defined to avoid circular imports
+# Standard-Paketbox dieses Prozesses: besitzt Zustand, Timer, GPIO und Publisher
+controller = PaketBoxController(GPIO, state=pbox_state, history=history)
+
+# Als Skript gestartet: handler verwendet diesen Controller, statt paketbox ein zweites Mal zu laden
+if __name__ == "__main__":
+    sys.modules['paketbox'] = sys.modules[__name__]
+
+# Import handler after the controller is defined to avoid circular imports
 import handler
 # Re-export modules for test compatibility
 import time
@@ -59,150 +78,113 @@ import time
 closure_timer_seconds = Config.CLOSURE_TIMER_SECONDS
 # endregion
 
+# Input engine of the running main loop; input_engine.snapshot holds the last sampled inputs
+input_engine = None
 
-def initialize_door_states():
-    """Initialize door states based on current GPIO input readings."""
-    logger.info("Initialisiere Türzustände basierend auf GPIO-Eingängen...")
-    
-    statusOld = [0] * len(Config.INPUTS)
-    
-    # Read current GPIO states
-    for i, pin in enumerate(Config.INPUTS):
-        statusOld[i] = GPIO.input(pin)
-    
-    # Set door states based on GPIO readings
-    pbox_state.set_left_door(DoorState.OPEN if statusOld[0] == GPIO.HIGH else DoorState.CLOSED)
-    pbox_state.set_right_door(DoorState.OPEN if statusOld[2] == GPIO.HIGH else DoorState.CLOSED)
-    pbox_state.set_paket_tuer(DoorState.OPEN if statusOld[4] == GPIO.HIGH else DoorState.CLOSED)
-    
-    logger.info(f"Türzustände initialisiert: {pbox_state}")
-    return statusOld
-
-def pinChanged(pin, oldState, newState):
-    if oldState == 0 and newState == 1: # rising edge  
-        if pin == 4:
-            pbox_state.set_paket_tuer(DoorState.OPEN)
-            logger.info(f"Paketklappe Zusteller geöffnet.") 
-            handler.Paket_Tuer_Zusteller_geoeffnet()
-            if mqttObject:
-                mqttObject.publish_paket_zusteller_event("ON")
-        elif pin == 5:
-            logger.info(f"Briefkasten Zusteller geöffnet.")
-            if mqttObject:
-                mqttObject.publish_briefkasten_event("ON")
-        elif pin == 6:
-            logger.info(f"Briefkasten Türe zum Leeren geöffnet.")
-            if mqttObject:
-                mqttObject.publish_briefkasten_entleeren_event("ON")
-        elif pin == 7:
-            logger.info(f"Paketbox Türe zum Leeren geöffnet.")
-            if mqttObject:
-                mqttObject.publish_paketbox_entleeren_event("ON")
-            handler.setLigthtPaketboxOn()
-            if handler.isAnyMotorRunning():
-                logger.warning("Nothalt: Türen sind offen, Motoren werden angehalten.")
-                handler.notHaltMotoren()
-        elif pin == 9:  
-            logger.info(f"Tür Mültonne geöffnet.")
-            handler.lichtMueltonneOn()
-        elif pin == 10:
-            logger.info(f"Bewegungsmelder hat ausgelöst.")
-
-    elif oldState == 1 and newState == 0: # falling edge
-        if pin == 0:
-            pbox_state.set_left_door(DoorState.CLOSED)
-            logger.info(f"Packet Klappe links geschlossen/oben.")
-        elif pin == 1:
-            pbox_state.set_left_door(DoorState.OPEN)
-            logger.info(f"Packet Klappe links geöffnet/unten.")
-        elif pin == 2:
-            pbox_state.set_right_door(DoorState.CLOSED)
-            logger.info(f"Packet Klappe recht geschlossen/oben.")
-        elif pin == 3:
-            pbox_state.set_right_door(DoorState.OPEN)
-            logger.info(f"Packet Klappe rechts geöffnet/unten.")
-        elif pin == 4:
-            pbox_state.set_paket_tuer(DoorState.CLOSED)
-            logger.info(f"Paketklappe Zusteller geschlossen.")
-            if mqttObject:
-                mqttObject.publish_paket_zusteller_event("OFF")  
-            handler.Paket_Tuer_Zusteller_geschlossen()
-        elif pin == 5:
-            logger.info(f"Briefkasten Zusteller geschlossen.")
-            if mqttObject:
-                mqttObject.publish_briefkasten_event("OFF")
-        elif pin == 6:
-            logger.info(f"Briefkasten Türe zum Leeren geschlossen.")
-            if mqttObject:
-                mqttObject.publish_briefkasten_entleeren_event("OFF")
-        elif pin == 7:
-            logger.info(f"Paketbox Türe zum Leeren geschlossen.")
-            if mqttObject:
-                mqttObject.publish_paketbox_entleeren_event("OFF")
-            handler.setLigthtPaketboxOff()
-            handler.ResetErrorState()
-            handler.ResetDoors()
-        elif pin == 8:
-            logger.info(f"Türöffner Taster 6 gedrückt.")
-        elif pin == 9:
-            logger.info(f"Tür Mültonne geschlossen.")
-            handler.lichtMueltonneOff()
-
-    else:
-        logger.warning(f"pinChanged: oldState == newState keine Änderung erkannt.")
+# Module-level API of the default controller
+initialize_door_states = controller.initialize_door_states
+register_edge_handler = controller.register_edge_handler
+build_edge_dispatch_table = controller.build_edge_dispatch_table
+pinChanged = controller.pinChanged
+fehlerzustand_geaendert = controller.fehlerzustand_geaendert
+verlauf_ausgeben = controller.verlauf_ausgeben
+sampling_busy = controller.sampling_busy
 
 def main():
+    global GPIO
+    # Jedes GPIO.output() wird für die Flanke-bis-Relais-Latenz erfasst
+    GPIO = controller.gpio = InstrumentedGPIO(GPIO, latency_monitor)
+    loop = None
+    if Config.RUNTIME == AsyncRuntime.RUNTIME_ASYNCIO:
+        loop = AsyncRuntime.install()  # vor allem, was Timer, Zustandsmeldungen oder MQTT startet
+        controller.state.set_notifier(LoopNotifier(loop))
+    checkpointer = None
+    if Config.CHECKPOINT_FILE:
+        checkpointer = Checkpointer(controller, Config.CHECKPOINT_FILE,
+                                    writer=LoopCheckpointWriter(loop) if loop else None)
     try:
         # verwende GPIO Nummer statt Board Nummer
         GPIO.setmode(GPIO.BCM)
    
         # Setze alle Inputs
-        for pin in Config.INPUTS:
+        for pin in controller.inputs:
           GPIO.setup(pin, GPIO.IN)
         # Setze alle Outputs auf HIGH (Ruhezustand)
-        for output in Config.OUTPUTS:
+        for output in controller.outputs:
           GPIO.setup(output, GPIO.OUT)
           GPIO.output(output, GPIO.HIGH)
 
-        global mqttObject
-        mqttObject = mqtt
-        mqttObject.start_mqtt()
-        mqttObject.publish_status(f"{time.strftime('%Y-%m-%d %H:%M:%S')} Paketbox bereit.")
+        controller.publisher = mqtt
+        mqtt.start_mqtt()
+        mqtt.publish_status(f"{time.strftime('%Y-%m-%d %H:%M:%S')} Paketbox bereit.")
+        # Fehler werden beim Zustandswechsel gemeldet statt im Hauptloop abgefragt
+        controller.subscribe_error_reports()
+        controller.subscribe_state_reports()  # Zustand für Dashboards: retained Dokument plus Deltas
         # Initialize door states based on current GPIO readings
-        statusOld = initialize_door_states()
-        statusNew = [0] * len(Config.INPUTS)
+        statusOld = controller.initialize_door_states()
+        global input_engine
+        input_engine = InputEngine(GPIO, controller.inputs, controller.pinChanged, busy=controller.sampling_busy,
+                                   latency=latency_monitor)
+        input_engine.start(statusOld)
+        controller.subscribe_commands(input_engine.post)  # MQTT-Befehle laufen im Hauptloop, nie im Netzwerk-Thread
+        if hasattr(signal, 'SIGUSR1'):
+            # kill -USR1 <pid> gibt den Verlauf aus
+            if loop:
+                loop.add_signal_handler(signal.SIGUSR1, controller.verlauf_ausgeben)
+            else:
+                # Der Handler unterbricht den Hauptloop, evtl. mitten in einem Lock: nur übergeben
+                signal.signal(signal.SIGUSR1,
+                              lambda signum, frame: input_engine.post(controller.verlauf_ausgeben, wake=False))
 
         logger.info("Init abgeschlossen. Strg+C zum Beenden drücken.")
-        handler.ResetDoors()
-        global sendMqttErrorState
-
-        while True: 
-           time.sleep(1)  # Main loop - check system state
-           for i, pin in enumerate(Config.INPUTS):
-               statusNew[i] = GPIO.input(pin)
-               if statusNew[i] != statusOld[i]:
-                   pinChanged(i, statusOld[i], statusNew[i])
-                   logger.info(f"GPIO {pin} changed: {statusOld[i]} -> {statusNew[i]}")
-                   statusOld[i] = statusNew[i]
-
-           # Monitor for error conditions
-           if ( not sendMqttErrorState and pbox_state.is_any_error()):
-               logger.warning(f"WARNUNG: System im Fehlerzustand! {pbox_state}")
-               if mqttObject:
-                   mqttObject.publish_status(f"{time.strftime('%Y-%m-%d %H:%M:%S')} FEHLER Paketbox: {pbox_state}")
-               sendMqttErrorState = True
+        # Nach einem Neustart dort weitermachen, wo die Box stand; sonst Klappen in sichere Lage fahren
+        if checkpointer is None or not checkpointer.restore():
+            controller.ResetDoors()
+        if checkpointer:
+            checkpointer.attach()
+
+        def report_stats():
+            input_engine.stats.log_report()
+            input_engine.stats.reset()
+            latency_monitor.log_report()
+            logger.info(f"MQTT-Sende-Queue: {mqtt.queue_stats()}")
+            logger.info(f"MQTT-Verbindung: {mqtt.connection_stats()}")
+            if controller.publisher:
+                controller.publisher.publish_latency(latency_monitor.to_json())
+
+        if loop:
+            # Steuerung, Timer, Zustandsmeldungen und MQTT im Event-Loop; endet nur mit Strg+C
+            loop.run_until_complete(AsyncRuntime.drive(input_engine, report_stats))
+        else:
+            clock = get_clock()
+            next_stats_report = clock.now() + Config.SAMPLE_STATS_INTERVAL
+
+            while True:
+               input_engine.wait()  # Main loop - wakes on GPIO edge, posted command or after timeout
+               input_engine.run_posted()
+               input_engine.sample()
+
+               if clock.now() >= next_stats_report:
+                   report_stats()
+                   next_stats_report += Config.SAMPLE_STATS_INTERVAL
 
     except KeyboardInterrupt:
         logger.info("Beendet mit Strg+C")
     except Exception as e:
         logger.error(f"[Main] Fehler: {e}")
     finally:
+        if checkpointer:
+            checkpointer.flush()
         GPIO.cleanup()
         logger.info("GPIO aufgeräumt.")
-        mqttObject.stop_mqtt()
+        mqtt.stop_mqtt()
         logger.info("MQTT gestoppt.")
 
 # Diese Zeilen sorgen dafür, dass das Skript nur ausgeführt wird,
 # wenn es direkt gestartet wird (und nicht importiert).
 if __name__ == "__main__":
-   main()
+   if Config.FLEET_FILE or Config.FLEET_SIM_BOXES:
+      import Fleet
+      Fleet.main(GPIO)  # mehrere Boxen in diesem Prozess
+   else:
+      main()
@@ -1,7 +1,10 @@
 # Global state module - single source of truth for pbox_state
 from PaketBoxState import PaketBoxState
+from TransitionHistory import TransitionHistory
+from config import Config
 
-# Globale Instanz - wird nur einmal erstellt
+# Globale Instanz - wird nur einmal erstellt (Zustand des Standard-Controllers paketbox.controller)
 pbox_state = PaketBoxState()
-sendMqttErrorState = False  # To avoid repeated error messages
-mqttObject = None  # Will hold the mqtt module reference
+# Verlauf der letzten Zustandswechsel und Eingangsflanken
+history = TransitionHistory(Config.HISTORY_SIZE)
+pbox_state.attach_history(history)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the per-edge dispatch cost of pinChanged().
+
+Compares the former if/elif ladder (reproduced below as legacy_pinChanged)
+with the table-driven dispatch in paketbox.pinChanged. Logging, MQTT, the
+state setters and the handler actions are stubbed out so only the dispatch
+overhead is measured. Each variant is run several times, the best run counts.
+
+Usage: PYTHONPATH=. python tests/bench_dispatch.py [edges]
+"""
+
+import sys
+import os
+import time
+import logging
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paketbox
+import handler
+from paketbox import pbox_state, DoorState
+from PaketBoxState import PaketBoxState
+
+
+def legacy_pinChanged(pin, oldState, newState):
+    """The if/elif ladder pinChanged() used before the dispatch table"""
+    logger = paketbox.logger
+    mqttObject = paketbox.controller.publisher
+    if oldState == 0 and newState == 1: # rising edge
+        if pin == 4:
+            pbox_state.set_paket_tuer(DoorState.OPEN)
+            logger.info(f"Paketklappe Zusteller geöffnet.")
+            handler.Paket_Tuer_Zusteller_geoeffnet()
+            if mqttObject:
+                mqttObject.publish_paket_zusteller_event("ON")
+        elif pin == 5:
+            logger.info(f"Briefkasten Zusteller geöffnet.")
+            if mqttObject:
+                mqttObject.publish_briefkasten_event("ON")
+        elif pin == 6:
+            logger.info(f"Briefkasten Türe zum Leeren geöffnet.")
+            if mqttObject:
+                mqttObject.publish_briefkasten_entleeren_event("ON")
+        elif pin == 7:
+            logger.info(f"Paketbox Türe zum Leeren geöffnet.")
+            if mqttObject:
+                mqttObject.publish_paketbox_entleeren_event("ON")
+            handler.setLigthtPaketboxOn()
+            if handler.isAnyMotorRunning():
+                logger.warning("Nothalt: Türen sind offen, Motoren werden angehalten.")
+                handler.notHaltMotoren()
+        elif pin == 9:
+            logger.info(f"Tür Mültonne geöffnet.")
+            handler.lichtMueltonneOn()
+        elif pin == 10:
+            logger.info(f"Bewegungsmelder hat ausgelöst.")
+
+    elif oldState == 1 and newState == 0: # falling edge
+        if pin == 0:
+            pbox_state.set_left_door(DoorState.CLOSED)
+            logger.info(f"Packet Klappe links geschlossen/oben.")
+        elif pin == 1:
+            pbox_state.set_left_door(DoorState.OPEN)
+            logger.info(f"Packet Klappe links geöffnet/unten.")
+        elif pin == 2:
+            pbox_state.set_right_door(DoorState.CLOSED)
+            logger.info(f"Packet Klappe recht geschlossen/oben.")
+        elif pin == 3:
+            pbox_state.set_right_door(DoorState.OPEN)
+            logger.info(f"Packet Klappe rechts geöffnet/unten.")
+        elif pin == 4:
+            pbox_state.set_paket_tuer(DoorState.CLOSED)
+            logger.info(f"Paketklappe Zusteller geschlossen.")
+            if mqttObject:
+                mqttObject.publish_paket_zusteller_event("OFF")
+            handler.Paket_Tuer_Zusteller_geschlossen()
+        elif pin == 5:
+            logger.info(f"Briefkasten Zusteller geschlossen.")
+            if mqttObject:
+                mqttObject.publish_briefkasten_event("OFF")
+        elif pin == 6:
+            logger.info(f"Briefkasten Türe zum Leeren geschlossen.")
+            if mqttObject:
+                mqttObject.publish_briefkasten_entleeren_event("OFF")
+        elif pin == 7:
+            logger.info(f"Paketbox Türe zum Leeren geschlossen.")
+            if mqttObject:
+                mqttObject.publish_paketbox_entleeren_event("OFF")
+            handler.setLigthtPaketboxOff()
+            handler.ResetErrorState()
+            handler.ResetDoors()
+        elif pin == 8:
+            logger.info(f"Türöffner Taster 6 gedrückt.")
+        elif pin == 9:
+            logger.info(f"Tür Mültonne geschlossen.")
+            handler.lichtMueltonneOff()
+
+    else:
+        logger.warning(f"pinChanged: oldState == newState keine Änderung erkannt.")
+
+
+# Every (input, old, new) combination the box can produce
+EDGES = [(pin, 1 - new, new) for pin in range(11) for new in (0, 1)]
+
+STUBBED_HANDLERS = [
+    'Paket_Tuer_Zusteller_geoeffnet', 'Paket_Tuer_Zusteller_geschlossen',
+    'setLigthtPaketboxOn', 'setLigthtPaketboxOff', 'isAnyMotorRunning',
+    'notHaltMotoren', 'ResetErrorState', 'ResetDoors',
+    'lichtMueltonneOn', 'lichtMueltonneOff',
+]
+
+
+def noop(*args, **kwargs):
+    return False
+
+
+STUBBED_SETTERS = ['set_left_door', 'set_right_door', 'set_paket_tuer']
+
+REPEATS = 5
+
+
+def run(dispatch, edges):
+    """Return ns per edge for dispatch() over the given number of edges"""
+    sequence = EDGES * (edges // len(EDGES) + 1)
+    sequence = sequence[:edges]
+    start = time.perf_counter_ns()
+    for pin, old, new in sequence:
+        dispatch(pin, old, new)
+    return (time.perf_counter_ns() - start) / len(sequence)
+
+
+def main():
+    edges = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    logging.disable(logging.CRITICAL)
+    stubs = {name: noop for name in STUBBED_HANDLERS}
+    setters = {name: noop for name in STUBBED_SETTERS}
+    with patch.multiple(handler, **stubs), patch.multiple(paketbox.controller, **stubs), \
+         patch.multiple(PaketBoxState, **setters), patch.object(paketbox.controller, 'publisher', None):
+        legacy = min(run(legacy_pinChanged, edges) for _ in range(REPEATS))
+        table = min(run(paketbox.pinChanged, edges) for _ in range(REPEATS))
+
+    print(f"Edges dispatched:   {edges}")
+    print(f"if/elif ladder:     {legacy:8.0f} ns/edge")
+    print(f"dispatch table:     {table:8.0f} ns/edge")
+    print(f"Speedup:            {legacy / table:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Fleet mode scaling: CPU time and memory for N simulated boxes in one process.
+
+Every box sits on simulated I/O expanders (Fleet.simulated_gpio) and gets a
+delivery every --interval seconds of virtual time, the boxes staggered evenly.
+All boxes share one InputEngine, one TimerScheduler and one StateNotifier.
+Reported per fleet size:
+
+- cpu %:     process CPU time / virtual time, i.e. load on one core of this
+             machine if the fleet ran in real time
+- cpu/box:   the same per box
+- mem/box:   memory allocated by the fleet (tracemalloc peak, separate run) per box
+- threads:   threads started by the fleet
+
+Usage: PYTHONPATH=. python tests/bench_fleet.py [--boxes 1,10,50,100] [--hours 1] [--interval 600]
+"""
+
+import sys
+import os
+import time
+import logging
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Clock import VirtualClock
+from TimerManager import Timer, use_clock
+from InputEngine import MODE_INTERRUPT
+from Fleet import Fleet, expander_boxes, simulated_gpio
+
+
+def run_fleet(count, hours, interval, trace_memory=False):
+    clock = VirtualClock()
+    previous = use_clock(clock)
+    if trace_memory:
+        tracemalloc.start()
+    threads_before = threading.active_count()
+    try:
+        boxes = expander_boxes(count)
+        gpio = simulated_gpio(boxes, clock=clock, travel_time=20)
+        fleet = Fleet(gpio, boxes, publisher_factory=None, mode=MODE_INTERRUPT, clock=clock)
+        fleet.start()
+
+        def delivery(sim):
+            if sim.open_courier_door():
+                Timer(30, sim.close_courier_door, scheduler=sim.scheduler).start()
+            Timer(interval, delivery, args=[sim], scheduler=sim.scheduler).start()
+
+        for k, sim in enumerate(gpio.backends):
+            Timer(k * interval / count, delivery, args=[sim], scheduler=sim.scheduler).start()
+
+        duration = hours * 3600
+        cpu_start = time.process_time()
+        while clock.now() < duration:
+            fleet.run_once(limit=duration - clock.now())
+        cpu = time.process_time() - cpu_start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+
+        errors = sum(1 for box in fleet.boxes if box.state.is_any_error())
+        for box in fleet.boxes:
+            box.timer_manager.cancel_all_timers()
+        return {
+            'boxes': count,
+            'cpu_percent': cpu / duration * 100,
+            'cpu_per_box': cpu / duration * 100 / count,
+            'mem_per_box_kb': peak / count / 1024,
+            'threads': threading.active_count() - threads_before,
+            'errors': errors,
+        }
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        use_clock(previous)
+
+
+def main():
+    sizes = [1, 10, 50, 100]
+    hours = 1.0
+    interval = 600.0
+    if '--boxes' in sys.argv:
+        sizes = [int(n) for n in sys.argv[sys.argv.index('--boxes') + 1].split(',')]
+    if '--hours' in sys.argv:
+        hours = float(sys.argv[sys.argv.index('--hours') + 1])
+    if '--interval' in sys.argv:
+        interval = float(sys.argv[sys.argv.index('--interval') + 1])
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'Boxen':>6}{'CPU %':>10}{'CPU %/Box':>12}{'KiB/Box':>10}{'Threads':>9}{'Fehler':>8}")
+    for count in sizes:
+        r = run_fleet(count, hours, interval)
+        r['mem_per_box_kb'] = run_fleet(count, hours, interval, trace_memory=True)['mem_per_box_kb']
+        print(f"{r['boxes']:>6}{r['cpu_percent']:>10.3f}{r['cpu_per_box']:>12.4f}"
+              f"{r['mem_per_box_kb']:>10.1f}{r['threads']:>9}{r['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Throughput and latency benchmarks for the edge-to-relay hot paths.
+
+Each benchmark times single operations with perf_counter_ns and reports
+ops/sec plus p50, p99 and max latency in microseconds:
+
+- dispatch:        pinChanged() over all edges, handler actions stubbed
+- state_set:       PaketBoxState setters
+- state_predicate: PaketBoxState predicates (is_any_error, ...)
+- timer_contention: add_timer/cancel_timer from 4 threads at once
+- mqtt_publish:    mqtt.publish_* against a local stand-in client
+- emergency_stop:  handler.notHaltMotoren() with a stand-in GPIO
+- reference:       the former if/elif pinChanged() ladder (bench_dispatch)
+
+Absolute timings depend on the host, so every benchmark is also expressed
+as the ratio of its p50 to the p50 of the reference measured in the same
+run. tests/bench_baseline.json stores these ratios; with PAKETBOX_BENCH=1
+tests/test_benchmarks.py fails if a ratio grows beyond baseline * tolerance. Refresh the baseline
+with --update-baseline in the commit that intentionally changes a hot path.
+
+Usage: PYTHONPATH=. python tests/bench_hotpaths.py [--update-baseline] [--scale N]
+"""
+
+import sys
+import os
+import json
+import time
+import logging
+import threading
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import paketbox
+import handler
+import mqtt
+from PaketBoxState import PaketBoxState, DoorState, MotorState
+from TimerManager import TimerManager, TimerScheduler, Timer
+from bench_dispatch import EDGES, STUBBED_HANDLERS, STUBBED_SETTERS, noop, legacy_pinChanged
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+
+def summarize(samples_ns, elapsed_ns):
+    """ops/sec and latency percentiles (µs) of a list of per-op durations"""
+    samples = sorted(samples_ns)
+    count = len(samples)
+    return {
+        'ops': count,
+        'ops_per_sec': count / (elapsed_ns / 1e9) if elapsed_ns else 0.0,
+        'p50_us': samples[count // 2] / 1000,
+        'p99_us': samples[min(count - 1, int(count * 0.99))] / 1000,
+        'max_us': samples[-1] / 1000,
+    }
+
+
+def timed(operations):
+    """Run each zero-argument callable once, timing every call"""
+    clock = time.perf_counter_ns
+    samples = []
+    append = samples.append
+    start = clock()
+    for op in operations:
+        t0 = clock()
+        op()
+        append(clock() - t0)
+    return summarize(samples, clock() - start)
+
+
+def bench_dispatch(n):
+    sequence = (EDGES * (n // len(EDGES) + 1))[:n]
+    ops = [lambda e=e: paketbox.pinChanged(*e) for e in sequence]
+    stubs = {name: noop for name in STUBBED_HANDLERS}
+    setters = {name: noop for name in STUBBED_SETTERS}
+    with patch.multiple(paketbox.controller, **stubs), patch.multiple(PaketBoxState, **setters), \
+         patch.object(paketbox.controller, 'publisher', None):
+        return timed(ops)
+
+
+def bench_reference(n):
+    sequence = (EDGES * (n // len(EDGES) + 1))[:n]
+    ops = [lambda e=e: legacy_pinChanged(*e) for e in sequence]
+    stubs = {name: noop for name in STUBBED_HANDLERS}
+    setters = {name: noop for name in STUBBED_SETTERS}
+    with patch.multiple(handler, **stubs), patch.multiple(PaketBoxState, **setters), \
+         patch.object(paketbox.controller, 'publisher', None):
+        return timed(ops)
+
+
+def bench_state_set(n):
+    state = PaketBoxState()
+    values = [DoorState.OPEN, DoorState.CLOSED]
+    motors = [MotorState.OPENING, MotorState.STOPPED]
+    ops = []
+    for i in range(n):
+        if i % 2:
+            ops.append(lambda v=values[i // 2 % 2]: state.set_left_door(v))
+        else:
+            ops.append(lambda v=motors[i // 2 % 2]: state.set_right_motor(v))
+    return timed(ops)
+
+
+def bench_state_predicate(n):
+    state = PaketBoxState()
+    predicates = [state.is_any_error, state.is_any_open, state.is_all_closed,
+                  state.is_any_motor_running, state.are_both_motors_stopped]
+    return timed(predicates[i % len(predicates)] for i in range(n))
+
+
+def bench_timer_contention(n, threads=4):
+    scheduler = TimerScheduler()
+    manager = TimerManager()
+    per_thread = n // threads
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        timer_id = f"bench_{index}"
+        clock = time.perf_counter_ns
+        samples = []
+        barrier.wait()
+        for i in range(per_thread):
+            t0 = clock()
+            if i % 2:
+                manager.cancel_timer(timer_id)
+            else:
+                timer = Timer(60, noop, scheduler=scheduler)
+                timer.start()
+                manager.add_timer(timer_id, timer)
+            samples.append(clock() - t0)
+        with lock:
+            results.extend(samples)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter_ns()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return summarize(results, time.perf_counter_ns() - start)
+
+
+class StandInClient:
+    """Accepts publish() calls like paho's client without any network I/O"""
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+
+
+def bench_mqtt_publish(n):
+    publishers = [mqtt.publish_paket_zusteller_event, mqtt.publish_briefkasten_event,
+                  mqtt.publish_briefkasten_entleeren_event, mqtt.publish_paketbox_entleeren_event]
+    ops = [lambda p=publishers[i % 4], v=("ON", "OFF")[(i // 4) % 2]: p(v) for i in range(n)]
+    with patch.object(mqtt, 'MQTT_AVAILABLE', True), patch.object(mqtt, '_client', StandInClient()):
+        return timed(ops)
+
+
+class StandInGPIO:
+    HIGH = 1
+    LOW = 0
+
+    def output(self, pin, state):
+        pass
+
+
+def bench_emergency_stop(n):
+    def stop():
+        handler.notHaltMotoren()
+        paketbox.pbox_state.set_left_motor(MotorState.OPENING)
+        paketbox.pbox_state.set_right_motor(MotorState.OPENING)
+    with patch.object(paketbox.controller, 'gpio', StandInGPIO()), \
+         patch.object(paketbox.controller, 'timer_manager', TimerManager()):
+        result = timed(stop for _ in range(n))
+    paketbox.pbox_state.set_left_motor(MotorState.STOPPED)
+    paketbox.pbox_state.set_right_motor(MotorState.STOPPED)
+    return result
+
+
+REFERENCE = 'reference'
+
+BENCHMARKS = {
+    REFERENCE: (bench_reference, 50000),
+    'dispatch': (bench_dispatch, 50000),
+    'state_set': (bench_state_set, 100000),
+    'state_predicate': (bench_state_predicate, 100000),
+    'timer_contention': (bench_timer_contention, 20000),
+    'mqtt_publish': (bench_mqtt_publish, 50000),
+    'emergency_stop': (bench_emergency_stop, 20000),
+}
+
+
+def run_all(scale=1.0, names=None):
+    """Run the benchmarks with scale * their default op count.
+
+    The reference always runs first; each result gets 'ratio', its p50
+    relative to the reference p50.
+    """
+    previous = logging.root.manager.disable
+    logging.disable(logging.CRITICAL)
+    try:
+        results = {}
+        for name, (bench, ops) in BENCHMARKS.items():
+            if names is None or name in names or name == REFERENCE:
+                results[name] = bench(max(100, int(ops * scale)))
+        reference = results[REFERENCE]['p50_us']
+        for result in results.values():
+            result['ratio'] = result['p50_us'] / reference
+        return results
+    finally:
+        logging.disable(previous)
+
+
+def load_baseline():
+    with open(BASELINE_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    scale = 1.0
+    if '--scale' in sys.argv:
+        scale = float(sys.argv[sys.argv.index('--scale') + 1])
+    results = run_all(scale)
+
+    print(f"{'Benchmark':<18}{'ops/s':>12}{'p50 µs':>10}{'p99 µs':>10}{'max µs':>10}{'ratio':>8}")
+    for name, r in results.items():
+        print(f"{name:<18}{r['ops_per_sec']:>12.0f}{r['p50_us']:>10.2f}{r['p99_us']:>10.2f}{r['max_us']:>10.1f}"
+              f"{r['ratio']:>8.2f}")
+
+    if '--update-baseline' in sys.argv:
+        baseline = {name: {key: round(r[key], 3) for key in ('ratio', 'ops_per_sec', 'p50_us', 'p99_us')}
+                    for name, r in results.items()}
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"Baseline geschrieben: {BASELINE_FILE}")
+
+
+if __name__ == '__main__':
+    main()
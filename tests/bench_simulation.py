@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Throughput of complete delivery cycles on the simulated hardware.
+
+Runs the real control stack (InputEngine, pinChanged, handler timers) against
+GpioSimulator.SimulatedGPIO on a VirtualClock. Logging is disabled so the
+numbers reflect the control logic, not log formatting.
+
+Usage: PYTHONPATH=. python tests/bench_simulation.py [cycles]
+"""
+
+import sys
+import os
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_simulator import SimulationHarness
+from state import pbox_state
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    logging.disable(logging.CRITICAL)
+    sim = SimulationHarness(travel_time=20)
+    try:
+        failures = 0
+        start = time.perf_counter()
+        for _ in range(cycles):
+            sim.delivery()
+            sim.run(sim.cycle_time())
+            if pbox_state.is_any_error() or not pbox_state.is_all_closed():
+                failures += 1
+        elapsed = time.perf_counter() - start
+    finally:
+        sim.close()
+
+    print(f"Delivery cycles:    {cycles}")
+    print(f"Failed cycles:      {failures}")
+    print(f"Virtual time:       {sim.clock.now() / 3600:.1f} h")
+    print(f"Real time:          {elapsed:.2f} s")
+    print(f"Cycles per second:  {cycles / elapsed:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the PaketBoxState predicates and setters.
+
+Compares the former lock + list based implementation (reproduced below as
+LegacyPaketBoxState) with the packed StateSnapshot in PaketBoxState, where
+each predicate is one bit test. Reports ns per call and the number of
+allocations per call measured with tracemalloc.
+
+Usage: PYTHONPATH=. python tests/bench_state.py [calls]
+"""
+
+import sys
+import os
+import time
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PaketBoxState import PaketBoxState, DoorState, MotorState
+
+
+class LegacyPaketBoxState:
+    """PaketBoxState before the snapshot/bitfield rework"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.left_door = DoorState.CLOSED
+        self.right_door = DoorState.CLOSED
+        self.paket_tuer = DoorState.CLOSED
+        self.left_motor = MotorState.STOPPED
+        self.right_motor = MotorState.STOPPED
+
+    def set_left_motor(self, state):
+        with self._lock:
+            self.left_motor = state
+
+    def is_any_error(self):
+        with self._lock:
+            return any([
+                self.left_door == DoorState.ERROR,
+                self.right_door == DoorState.ERROR,
+                self.paket_tuer == DoorState.ERROR,
+                self.left_motor == MotorState.ERROR,
+                self.right_motor == MotorState.ERROR
+            ])
+
+    def is_any_motor_running(self):
+        with self._lock:
+            return any([
+                self.left_motor == MotorState.OPENING,
+                self.left_motor == MotorState.CLOSING,
+                self.right_motor == MotorState.OPENING,
+                self.right_motor == MotorState.CLOSING
+            ])
+
+    def is_all_closed(self):
+        with self._lock:
+            return all([
+                self.left_door == DoorState.CLOSED,
+                self.right_door == DoorState.CLOSED,
+                self.paket_tuer == DoorState.CLOSED
+            ])
+
+
+def time_calls(func, calls, *args):
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / calls * 1e9
+
+
+def transient_bytes(func, *args):
+    """Bytes allocated (and freed again) during one call, measured with tracemalloc"""
+    func(*args)  # warm-up: caches and free lists
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - base
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    legacy, packed = LegacyPaketBoxState(), PaketBoxState()
+    print(f"{'Operation':<26}{'legacy ns':>12}{'packed ns':>12}{'speedup':>10}")
+    for name, args in (('is_any_error', ()), ('is_any_motor_running', ()), ('is_all_closed', ()),
+                       ('set_left_motor', (MotorState.OPENING,))):
+        old = time_calls(getattr(legacy, name), calls, *args)
+        new = time_calls(getattr(packed, name), calls, *args)
+        print(f"{name:<26}{old:>12.0f}{new:>12.0f}{old / new:>9.1f}x")
+
+    print()
+    print(f"{'Bytes allocated per call':<26}{'legacy':>12}{'packed':>12}")
+    for name in ('is_any_error', 'is_any_motor_running', 'is_all_closed'):
+        print(f"{name:<26}{transient_bytes(getattr(legacy, name)):>12}{transient_bytes(getattr(packed, name)):>12}")
+
+if __name__ == '__main__':
+    main()
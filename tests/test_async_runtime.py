@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import mqtt
+import TimerManager
+import AsyncRuntime
+from TimerManager import Timer
+from InputEngine import InputEngine, MODE_INTERRUPT
+from PaketBoxState import PaketBoxState, DoorState, LoopNotifier
+
+
+class EdgeGPIO:
+    """Input levels plus edge callbacks, like RPi.GPIO"""
+    LOW = 0
+    HIGH = 1
+    BOTH = 'BOTH'
+
+    def __init__(self, pins):
+        self.levels = {pin: self.LOW for pin in pins}
+        self.callbacks = {}
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def set(self, pin, level):
+        self.levels[pin] = level
+        self.callbacks[pin](pin)
+
+
+class TestAsyncRuntime(unittest.TestCase):
+    """Timers, state notifications, edges, commands and MQTT sends run on the loop thread"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.previous_scheduler = TimerManager.use_loop(self.loop)
+
+    def tearDown(self):
+        TimerManager.default_scheduler = self.previous_scheduler
+        self.loop.close()
+
+    def run_loop(self, scenario):
+        threads = threading.active_count()
+        self.loop.run_until_complete(asyncio.wait_for(scenario(), 2))
+        self.assertEqual(threading.active_count(), threads)  # kein zusätzlicher Thread
+
+    def test_timers_run_in_deadline_order_and_can_be_cancelled(self):
+        calls = []
+        async def scenario():
+            Timer(0.02, calls.append, ['b']).start()
+            Timer(0.01, calls.append, ['a']).start()
+            cancelled = Timer(0.015, calls.append, ['x'])
+            cancelled.start()
+            self.assertTrue(cancelled.cancel())
+            self.assertEqual(TimerManager.default_scheduler.pending(), 2)
+            await asyncio.sleep(0.05)
+        self.run_loop(scenario)
+        self.assertEqual(calls, ['a', 'b'])
+
+    def test_edges_and_posted_work_are_handled_on_the_loop_thread(self):
+        pins = [5, 6]
+        gpio = EdgeGPIO(pins)
+        seen = []
+        engine = InputEngine(gpio, pins, lambda i, old, new: seen.append(('edge', i, threading.get_ident())),
+                             mode=MODE_INTERRUPT, windows=[0.0, 0.0])
+        engine.start([0, 0])
+        state = PaketBoxState(LoopNotifier(self.loop))
+        state.subscribe(lambda change: seen.append(('state', change.fields, threading.get_ident())))
+
+        async def scenario():
+            task = asyncio.ensure_future(AsyncRuntime.drive(engine))
+            await asyncio.sleep(0)
+            edge = threading.Thread(target=gpio.set, args=(6, gpio.HIGH))  # wie der Callback-Thread von RPi.GPIO
+            edge.start()
+            edge.join()
+            engine.post(lambda: state.set_paket_tuer(DoorState.OPEN))
+            while len(seen) < 2:
+                await asyncio.sleep(0.001)
+            task.cancel()
+        self.run_loop(scenario)
+        loop_thread = threading.get_ident()
+        self.assertEqual(sorted(seen), [('edge', 1, loop_thread), ('state', ('paket_tuer',), loop_thread)])
+
+    def test_publish_queue_is_drained_by_loop_callbacks(self):
+        client = MagicMock()
+        queue = mqtt.AsyncPublishQueue(self.loop)
+        async def scenario():
+            queue.put('t/a', 'ON')
+            queue.put('t/a', 'OFF')
+            self.assertEqual(client.publish.call_count, 0)  # put() sendet nicht selbst
+            await asyncio.sleep(0)
+        with patch.object(mqtt, '_client', client):
+            self.run_loop(scenario)
+        self.assertEqual([c.args for c in client.publish.call_args_list], [('t/a', 'ON'), ('t/a', 'OFF')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import unittest
+
+import bench_hotpaths
+
+# With PAKETBOX_BENCH=1 a benchmark fails once its p50, relative to the p50 of the
+# reference (the former if/elif pinChanged() ladder) measured in the same run,
+# exceeds the baseline ratio * TOLERANCE. Ratios keep the gate independent of the
+# host; each ratio is the best of REPEATS short runs, because a single run is too
+# noisy to gate on. The median is used because p99/max depend heavily on the load.
+TOLERANCE = float(os.environ.get('PAKETBOX_BENCH_TOLERANCE', '1.75'))
+REPEATS = 3
+
+
+@unittest.skipIf(os.environ.get('PAKETBOX_SKIP_BENCH') == '1', "Benchmarks deaktiviert")
+class TestEmergencyStop(unittest.TestCase):
+    def test_emergency_stop_does_not_block(self):
+        """notHaltMotoren() must stay in the microsecond range, whatever the baseline says"""
+        results = bench_hotpaths.run_all(scale=0.1, names=['emergency_stop'])
+        self.assertLess(results['emergency_stop']['p99_us'], 1000)
+
+
+@unittest.skipUnless(os.environ.get('PAKETBOX_BENCH') == '1', "Regressions-Gate nur mit PAKETBOX_BENCH=1")
+class TestHotPathRegression(unittest.TestCase):
+    """Short runs of tests/bench_hotpaths.py against tests/bench_baseline.json"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.baseline = bench_hotpaths.load_baseline()
+        cls.ratios = {}
+        for _ in range(REPEATS):
+            for name, result in bench_hotpaths.run_all(scale=0.1).items():
+                cls.ratios[name] = min(result['ratio'], cls.ratios.get(name, result['ratio']))
+
+    def test_all_benchmarks_have_a_baseline(self):
+        self.assertEqual(set(self.ratios), set(self.baseline))
+
+    def test_relative_latency_within_tolerance(self):
+        for name, ratio in self.ratios.items():
+            with self.subTest(benchmark=name):
+                limit = self.baseline[name]['ratio'] * TOLERANCE
+                self.assertLessEqual(ratio, limit, f"{name}: p50 {ratio:.2f}x Referenz > {limit:.2f}x "
+                                                   f"(Baseline {self.baseline[name]['ratio']:.2f}x)")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from Clock import VirtualClock
+from TimerManager import use_clock
+from InputEngine import InputEngine, MODE_INTERRUPT
+from GpioSimulator import SimulatedGPIO
+from PaketBoxState import DoorState, MotorState
+from PaketBoxController import PaketBoxController
+from Checkpoint import Checkpointer, CheckpointWriter
+from config import Config
+
+
+class TestCheckpoint(unittest.TestCase):
+    """A restarted controller continues from the checkpoint of the crashed one"""
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous_clock = use_clock(self.clock)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'paketbox.checkpoint')
+        self.sim = SimulatedGPIO(clock=self.clock, travel_time=20)
+        self.controllers = []
+        self.box, self.engine, self.checkpointer = self.start_process()
+
+    def tearDown(self):
+        for controller in self.controllers:
+            controller.timer_manager.cancel_all_timers()
+        use_clock(self.previous_clock)
+        shutil.rmtree(self.dir)
+
+    def start_process(self):
+        """What main() does on startup, with a checkpoint of the previous run"""
+        for pin in Config.OUTPUTS:
+            self.sim.output(pin, self.sim.HIGH)
+        box = PaketBoxController(self.sim, publisher=MagicMock())
+        self.controllers.append(box)
+        engine = InputEngine(self.sim, box.inputs, box.pinChanged, mode=MODE_INTERRUPT,
+                             busy=box.sampling_busy, clock=self.clock)
+        engine.start(box.initialize_door_states())
+        checkpointer = Checkpointer(box, self.path, writer=MagicMock())
+        return box, engine, checkpointer
+
+    def crash_and_restart(self):
+        self.box.timer_manager.cancel_all_timers()
+        self.box, self.engine, self.checkpointer = self.start_process()
+        return self.checkpointer.restore()
+
+    def run_for(self, seconds):
+        target = self.clock.now() + seconds
+        while self.clock.now() < target:
+            self.engine.wait(target - self.clock.now())
+            self.engine.sample()
+
+    def test_idle_restart_resumes_door_watchdog(self):
+        self.checkpointer.attach()
+        self.sim.open_courier_door()
+        self.run_for(100)
+        self.assertTrue(self.checkpointer.flush())
+        self.assertEqual(os.listdir(self.dir), ['paketbox.checkpoint'])
+
+        self.assertTrue(self.crash_and_restart())
+        self.assertEqual(self.box.state.paket_tuer, DoorState.OPEN)
+        self.assertTrue(self.box.state.are_both_motors_stopped())
+        watchdog = self.box.timer_manager.active_timers['door_open_watchdog']
+        self.assertAlmostEqual(watchdog.deadline - self.clock.now(), 800, delta=1)
+        self.assertEqual([flap.position for flap in self.sim.flaps], [0.0, 0.0])
+        self.box.publisher.publish.assert_not_called()
+
+    def test_restart_during_opening_finishes_the_cycle(self):
+        self.checkpointer.attach()
+        self.sim.open_courier_door()
+        self.run_for(1)
+        self.sim.close_courier_door()
+        self.run_for(15)  # 10 s Verzögerung, dann 5 s Klappenfahrt
+        self.assertEqual(self.box.state.left_motor, MotorState.OPENING)
+        self.checkpointer.flush()
+
+        self.assertTrue(self.crash_and_restart())
+        self.assertEqual(self.box.state.left_motor, MotorState.OPENING)
+        self.assertTrue(self.sim.door_locked())
+        self.run_for(2 * (Config.CLOSURE_TIMER_SECONDS + 1))
+        self.assertTrue(self.box.state.is_all_closed())
+        self.assertTrue(self.box.state.are_both_motors_stopped())
+        self.assertFalse(self.box.state.is_any_error())
+        self.assertFalse(self.sim.door_locked())
+
+    def test_downtime_counts_for_the_watchdog(self):
+        self.sim.open_courier_door()
+        self.run_for(1)
+        self.checkpointer.flush()
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        data['wall'] -= 300
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+        self.assertTrue(self.crash_and_restart())
+        watchdog = self.box.timer_manager.active_timers['door_open_watchdog']
+        self.assertAlmostEqual(watchdog.deadline - self.clock.now(), 599, delta=1)
+
+    def test_unusable_checkpoints_fall_back_to_reset(self):
+        self.assertFalse(self.checkpointer.restore())  # keiner vorhanden
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{"v":1,"sta')
+        self.assertFalse(self.checkpointer.restore())
+
+        self.checkpointer.flush()
+        self.sim.stick_input(0, self.sim.HIGH)  # Klappe links steht zwischen den Endlagen
+        self.assertFalse(self.crash_and_restart())
+
+
+class TestCheckpointWriter(unittest.TestCase):
+    def test_changes_within_the_interval_are_written_once(self):
+        writer = CheckpointWriter(interval=0.05)
+        checkpointer = MagicMock()
+        for _ in range(3):
+            writer.mark(checkpointer)
+        time.sleep(0.3)
+        checkpointer.flush.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch
+import threading
+import time
+
+from Clock import VirtualClock
+from TimerManager import Timer, TimerScheduler, use_clock
+from PaketBoxState import DoorState, MotorState
+from state import pbox_state
+from config import Config
+import paketbox
+import handler
+
+
+class TestVirtualClock(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.scheduler = TimerScheduler(self.clock)
+
+    def test_advance_runs_due_timers_at_their_deadline(self):
+        """Timers see the virtual time of their own deadline"""
+        seen = []
+        Timer(5, lambda: seen.append(self.clock.now()), scheduler=self.scheduler).start()
+        Timer(65, lambda: seen.append(self.clock.now()), scheduler=self.scheduler).start()
+
+        self.clock.advance(10)
+        self.assertEqual(seen, [5])
+        self.assertEqual(self.clock.now(), 10)
+
+        self.clock.advance(100)
+        self.assertEqual(seen, [5, 65])
+        self.assertEqual(self.clock.now(), 110)
+
+    def test_run_until_idle_follows_timer_chains(self):
+        """Timers scheduled from timer callbacks are run as well"""
+        seen = []
+        def step(n):
+            seen.append(self.clock.now())
+            if n:
+                Timer(900, step, args=[n - 1], scheduler=self.scheduler).start()
+        Timer(900, step, args=[3], scheduler=self.scheduler).start()
+
+        elapsed = self.clock.run_until_idle()
+        self.assertEqual(seen, [900, 1800, 2700, 3600])
+        self.assertEqual(elapsed, 3600)
+
+    def test_wait_returns_when_event_set_by_timer(self):
+        """wait() stops at the deadline of the timer that sets the event"""
+        event = threading.Event()
+        Timer(2.5, event.set, scheduler=self.scheduler).start()
+        self.assertTrue(self.clock.wait(event, 10))
+        self.assertEqual(self.clock.now(), 2.5)
+        self.assertFalse(self.clock.wait(threading.Event(), 1))
+        self.assertEqual(self.clock.now(), 3.5)
+
+
+class TestDeliveryCycleVirtualTime(unittest.TestCase):
+    """Runs the real handler timers on virtual time instead of patching Timer"""
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous_clock = use_clock(self.clock)
+        pbox_state.set_left_door(DoorState.CLOSED)
+        pbox_state.set_right_door(DoorState.CLOSED)
+        pbox_state.set_paket_tuer(DoorState.CLOSED)
+        pbox_state.set_left_motor(MotorState.STOPPED)
+        pbox_state.set_right_motor(MotorState.STOPPED)
+
+    def tearDown(self):
+        handler.timer_manager.cancel_all_timers()
+        use_clock(self.previous_clock)
+
+    def set_flaps(self, state):
+        pbox_state.set_left_door(state)
+        pbox_state.set_right_door(state)
+
+    @patch.object(paketbox.controller, 'gpio')
+    def test_complete_delivery_cycle(self, mock_gpio):
+        """Door closed -> delayed open -> end check -> auto close -> unlock"""
+        mock_gpio.LOW = 0
+        mock_gpio.HIGH = 1
+        open_at = 10 + 30
+        closed_at = 10 + Config.CLOSURE_TIMER_SECONDS + 1 + 30
+        Timer(open_at, self.set_flaps, args=[DoorState.OPEN]).start()
+        Timer(closed_at, self.set_flaps, args=[DoorState.CLOSED]).start()
+
+        started = time.perf_counter()
+        handler.Paket_Tuer_Zusteller_geschlossen()
+        self.clock.run_until_idle()
+        real_time = time.perf_counter() - started
+
+        self.assertEqual(self.clock.now(), 10 + 2 * (Config.CLOSURE_TIMER_SECONDS + 1))
+        self.assertTrue(pbox_state.is_all_closed())
+        self.assertTrue(pbox_state.are_both_motors_stopped())
+        self.assertFalse(pbox_state.is_any_error())
+        mock_gpio.output.assert_called_with(26, mock_gpio.HIGH)  # door unlocked at the end
+        self.assertLess(real_time, 1.0)
+
+    @patch.object(paketbox.controller, 'Klappen_oeffnen')
+    def test_door_open_watchdog_after_15_minutes(self, mock_oeffnen):
+        """The 900 s watchdog fires in virtual time if the courier door stays open"""
+        pbox_state.set_paket_tuer(DoorState.OPEN)
+        handler.Paket_Tuer_Zusteller_geoeffnet()
+
+        self.clock.advance(899)
+        mock_oeffnen.assert_not_called()
+        self.clock.advance(1)
+        mock_oeffnen.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
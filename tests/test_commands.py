@@ -0,0 +1,86 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import mqtt
+from mqtt import Event
+from Clock import VirtualClock
+from TimerManager import use_clock
+from InputEngine import InputEngine, MODE_INTERRUPT
+from LatencyMonitor import LatencyMonitor, InstrumentedGPIO
+from PaketBoxController import PaketBoxController
+from Commands import CommandDispatcher, parse
+from config import Config
+
+
+class TestParse(unittest.TestCase):
+    def test_json_and_bare_command_name(self):
+        self.assertEqual(parse(b'{"id":"a1","cmd":"reset_error"}'), ('a1', 'reset_error'))
+        self.assertEqual(parse(b'light_on\n'), (None, 'light_on'))
+
+    def test_invalid_commands_are_rejected_with_a_code(self):
+        for payload, code in ((b'{"cmd":', 'invalid_json'), (b'rm -rf', 'unknown_command'),
+                              (b'{"id":[1],"cmd":"light_on"}', 'invalid_id'),
+                              (b'{"cmd":["x"]}', 'invalid_command'), (b'{"cmd":{}}', 'invalid_command'),
+                              (b'{"id":1}', 'invalid_command'),
+                              (b'x' * (Config.MQTT_COMMAND_MAX_BYTES + 1), 'too_long')):
+            with self.assertRaisesRegex(ValueError, code):
+                parse(payload)
+
+
+class TestCommandDispatcher(unittest.TestCase):
+    """Commands arrive on the network thread and run in the control loop"""
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous_clock = use_clock(self.clock)
+        self.monitor = LatencyMonitor()
+        gpio = MagicMock()
+        gpio.LOW, gpio.HIGH = 0, 1
+        gpio.input.return_value = 0
+        self.gpio = gpio
+        self.box = PaketBoxController(InstrumentedGPIO(gpio, self.monitor), publisher=MagicMock(prefix=None),
+                                      latency=self.monitor)
+        self.engine = InputEngine(self.box.gpio, self.box.inputs, self.box.pinChanged, mode=MODE_INTERRUPT,
+                                  clock=self.clock)
+        self.engine.start(self.box.initialize_door_states())
+        self.dispatcher = CommandDispatcher(self.box, self.engine.post)
+
+    def tearDown(self):
+        self.box.timer_manager.cancel_all_timers()
+        use_clock(self.previous_clock)
+
+    def acks(self):
+        return [json.loads(c.args[1]) for c in self.box.publisher.publish.call_args_list
+                if c.args[0] == Event.COMMAND_ACK]
+
+    def test_command_runs_on_the_control_thread_and_is_acknowledged(self):
+        self.dispatcher.handle(b'{"id":7,"cmd":"light_on"}')
+        self.gpio.output.assert_not_called()  # nicht im Netzwerk-Thread
+        self.clock.advance(0.004)
+        self.assertTrue(self.engine.wait(limit=1))
+        self.assertEqual(self.engine.run_posted(), 1)
+        self.gpio.output.assert_called_once_with(Config.OUTPUTS[6], self.gpio.LOW)
+        ack, = self.acks()
+        self.assertEqual((ack['id'], ack['cmd'], ack['ok']), (7, 'light_on', True))
+        self.assertAlmostEqual(ack['ms']['output'], 4.0)
+        self.assertIn('cmd_light_on', self.monitor.report())
+
+    def test_rejected_commands_are_acknowledged_at_once(self):
+        self.dispatcher.handle(b'open_sesame')
+        self.dispatcher.handle(b'{"id":3,"cmd":{}}')
+        for _ in range(Config.CONTROL_QUEUE_SIZE + 1):
+            self.dispatcher.handle(b'light_off')
+        self.assertEqual([ack.get('error') for ack in self.acks()], ['unknown_command', 'invalid_command', 'busy'])
+        self.assertEqual(self.engine.run_posted(), Config.CONTROL_QUEUE_SIZE)
+
+    def test_messages_are_routed_by_topic(self):
+        handler = MagicMock()
+        with patch.dict(mqtt._message_handlers, clear=True):
+            mqtt.on_message(self.dispatcher.topic, handler)
+            mqtt.mqtt_message(None, None, MagicMock(topic=Config.MQTT_TOPIC_COMMAND, payload=b'history'))
+        handler.assert_called_once_with(b'history')
+
+
+if __name__ == '__main__':
+    unittest.main()
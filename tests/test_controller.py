@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock
+
+from Clock import VirtualClock
+from TimerManager import use_clock
+from PaketBoxState import DoorState, MotorState
+from PaketBoxController import PaketBoxController
+from mqtt import Event
+from config import Config
+import paketbox
+import handler
+
+
+def make_gpio():
+    gpio = MagicMock()
+    gpio.LOW = 0
+    gpio.HIGH = 1
+    gpio.input.return_value = 0
+    return gpio
+
+
+class TestPaketBoxController(unittest.TestCase):
+    """Two controllers in one process must not share state, timers or outputs"""
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous_clock = use_clock(self.clock)
+        self.a = PaketBoxController(make_gpio(), publisher=MagicMock())
+        self.b = PaketBoxController(make_gpio(), publisher=MagicMock())
+
+    def tearDown(self):
+        self.a.timer_manager.cancel_all_timers()
+        self.b.timer_manager.cancel_all_timers()
+        use_clock(self.previous_clock)
+
+    def test_instances_own_their_collaborators(self):
+        self.assertIsNot(self.a.state, self.b.state)
+        self.assertIsNot(self.a.timer_manager, self.b.timer_manager)
+        self.assertIsNot(self.a.history, self.b.history)
+
+    def test_edge_only_affects_its_own_box(self):
+        self.a.pinChanged(4, 0, 1)  # courier door opened
+        self.assertEqual(self.a.state.paket_tuer, DoorState.OPEN)
+        self.assertEqual(self.b.state.paket_tuer, DoorState.CLOSED)
+        self.a.publisher.publish.assert_called_once_with(Event.PAKET_ZUSTELLER, "ON")
+        self.b.publisher.publish.assert_not_called()
+        self.assertIsNotNone(self.a.timer_manager.active_timers['door_open_watchdog'])
+        self.assertIsNone(self.b.timer_manager.active_timers['door_open_watchdog'])
+
+    def test_delivery_cycle_switches_only_own_relays(self):
+        self.a.pinChanged(4, 1, 0)  # courier door closed -> delayed opening
+        self.clock.advance(10)
+        self.assertEqual(self.a.state.left_motor, MotorState.OPENING)
+        self.assertTrue(self.b.state.are_both_motors_stopped())
+        self.a.gpio.output.assert_any_call(Config.OUTPUTS[1], 0)
+        self.b.gpio.output.assert_not_called()
+
+    def test_emergency_stop_is_local(self):
+        self.a.state.transition(left_motor=MotorState.OPENING, right_motor=MotorState.OPENING)
+        self.b.state.transition(left_motor=MotorState.OPENING, right_motor=MotorState.OPENING)
+        self.a.pinChanged(7, 0, 1)  # emptying door opened while motors run
+        self.assertTrue(self.a.state.is_any_motor_error())
+        self.assertTrue(self.b.state.is_any_motor_running())
+
+    def test_module_api_is_bound_to_default_controller(self):
+        self.assertIs(handler.timer_manager, paketbox.controller.timer_manager)
+        self.assertIs(paketbox.controller.state, paketbox.pbox_state)
+        self.assertEqual(handler.Klappen_oeffnen, paketbox.controller.Klappen_oeffnen)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import threading
+from unittest.mock import MagicMock, patch
+
+from Clock import VirtualClock
+from TimerManager import use_clock
+from InputEngine import MODE_INTERRUPT
+from PaketBoxState import DoorState, MotorState
+from Fleet import Fleet, expander_boxes, simulated_gpio
+from config import Config
+import mqtt
+
+
+class TestFleet(unittest.TestCase):
+    """Three simulated boxes on one sampler, scheduler and notifier"""
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous_clock = use_clock(self.clock)
+        self.boxes = expander_boxes(3)
+        self.gpio = simulated_gpio(self.boxes, clock=self.clock, travel_time=20)
+        self.fleet = Fleet(self.gpio, self.boxes, publisher_factory=lambda prefix: MagicMock(),
+                           mode=MODE_INTERRUPT, clock=self.clock)
+        self.fleet.start()
+
+    def tearDown(self):
+        for box in self.fleet.boxes:
+            box.timer_manager.cancel_all_timers()
+        use_clock(self.previous_clock)
+
+    def run_for(self, seconds):
+        target = self.clock.now() + seconds
+        while self.clock.now() < target:
+            self.fleet.run_once(limit=target - self.clock.now())
+
+    def test_delivery_on_one_box_leaves_the_others_alone(self):
+        sim = self.gpio.backends[1]
+        sim.open_courier_door()
+        self.run_for(30)
+        sim.close_courier_door()
+        self.run_for(1)
+        self.assertEqual(self.fleet.boxes[1].state.paket_tuer, DoorState.CLOSED)
+        self.run_for(20)
+        self.assertEqual(self.fleet.boxes[1].state.left_motor, MotorState.OPENING)
+        for other in (0, 2):
+            self.assertTrue(self.fleet.boxes[other].state.are_both_motors_stopped())
+            self.fleet.boxes[other].publisher.publish.assert_not_called()
+
+        self.run_for(10 + 2 * (Config.CLOSURE_TIMER_SECONDS + 1))
+        box = self.fleet.boxes[1]
+        self.assertTrue(box.state.is_all_closed())
+        self.assertTrue(box.state.are_both_motors_stopped())
+        self.assertFalse(box.state.is_any_error())
+        self.assertFalse(sim.door_locked())
+        self.assertEqual([c.args[1] for c in box.publisher.publish.call_args_list
+                          if c.args[0] == mqtt.Event.PAKET_ZUSTELLER], ["ON", "OFF"])
+
+    def test_boxes_share_one_notifier_thread(self):
+        def notifier_threads():
+            return sum(1 for t in threading.enumerate() if t.name == "StateNotifier")
+        before = notifier_threads()
+        for box in self.fleet.boxes:
+            box.subscribe_error_reports()
+        self.assertEqual(notifier_threads(), before)
+        self.fleet.boxes[2].notHaltMotoren()
+        self.fleet.boxes[2].state.wait_notified(1)
+        events = [c.args[0] for c in self.fleet.boxes[2].publisher.publish.call_args_list]
+        self.assertEqual(events.count(mqtt.Event.STATUS), 1)
+        self.fleet.boxes[0].publisher.publish.assert_not_called()
+
+
+class TestPublisher(unittest.TestCase):
+    def test_topics_are_moved_below_the_box_prefix(self):
+        client = MagicMock()
+        publisher = mqtt.Publisher('home/eingang_nord/')
+        with patch.object(mqtt, 'MQTT_AVAILABLE', True), patch.object(mqtt, '_client', client):
+            self.assertTrue(publisher.publish(mqtt.Event.PAKET_ZUSTELLER, "ON"))
+            self.assertTrue(mqtt.flush(1))
+        client.publish.assert_called_once_with('home/eingang_nord/paketbox', "ON")
+
+
+if __name__ == '__main__':
+    unittest.main()
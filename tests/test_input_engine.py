@@ -0,0 +1,233 @@
+import unittest
+from unittest.mock import MagicMock
+import threading
+import time
+
+from InputEngine import InputEngine, MODE_INTERRUPT, MODE_POLL, RATE_ACTIVE, RATE_IDLE, debounce_windows
+from config import Config
+
+
+class FakeGPIO:
+    """Minimal GPIO stand-in with settable input levels"""
+    LOW = 0
+    HIGH = 1
+    BOTH = 'BOTH'
+
+    def __init__(self, pins):
+        self.levels = {pin: self.LOW for pin in pins}
+        self.callbacks = {}
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def set(self, pin, level):
+        self.levels[pin] = level
+        if pin in self.callbacks:
+            self.callbacks[pin](pin)
+
+
+class TestInputEngine(unittest.TestCase):
+    def setUp(self):
+        self.pins = [27, 17, 9]
+        self.gpio = FakeGPIO(self.pins)
+        self.on_change = MagicMock()
+        self.no_debounce = [0.0] * len(self.pins)
+
+    def test_interrupt_mode_registers_edge_detection(self):
+        """All inputs get an edge callback in interrupt mode"""
+        engine = InputEngine(self.gpio, self.pins, self.on_change, mode=MODE_INTERRUPT)
+        engine.start()
+        self.assertEqual(engine.mode, MODE_INTERRUPT)
+        self.assertEqual(sorted(self.gpio.callbacks), sorted(self.pins))
+
+    def test_fallback_to_polling_if_edge_detection_fails(self):
+        """A failing add_event_detect switches the engine to polling"""
+        self.gpio.add_event_detect = MagicMock(side_effect=RuntimeError("Failed to add edge detection"))
+        engine = InputEngine(self.gpio, self.pins, self.on_change, mode=MODE_INTERRUPT)
+        engine.start()
+        self.assertEqual(engine.mode, MODE_POLL)
+
+    def test_sample_dispatches_only_changed_pins(self):
+        """sample() calls on_change with index and old/new level"""
+        engine = InputEngine(self.gpio, self.pins, self.on_change, mode=MODE_POLL, windows=self.no_debounce)
+        engine.start([0, 0, 0])
+        self.gpio.levels[17] = 1
+        engine.sample()
+        self.on_change.assert_called_once_with(1, 0, 1)
+
+        self.on_change.reset_mock()
+        engine.sample()
+        self.on_change.assert_not_called()
+
+    def test_snapshot_word_and_multiple_changes(self):
+        """Changed pins are dispatched in index order and mirrored in the snapshot"""
+        engine = InputEngine(self.gpio, self.pins, self.on_change, mode=MODE_POLL, windows=self.no_debounce)
+        engine.start([1, 0, 0])
+        self.assertEqual(engine.snapshot, 0b001)
+
+        self.gpio.levels[27] = 0
+        self.gpio.levels[9] = 1
+        changed = engine.sample()
+
+        self.assertEqual(changed, 0b101)
+        self.assertEqual(engine.snapshot, 0b100)
+        self.assertEqual([c.args for c in self.on_change.call_args_list], [(0, 1, 0), (2, 0, 1)])
+        self.assertTrue(engine.is_high(2))
+        self.assertFalse(engine.is_high(0))
+
+    def test_edge_wakes_waiting_thread(self):
+        """An edge ends wait() long before the resync timeout"""
+        engine = InputEngine(self.gpio, self.pins, self.on_change, mode=MODE_INTERRUPT, windows=self.no_debounce)
+        engine.start([0, 0, 0])
+        threading.Timer(0.05, self.gpio.set, args=(9, 1)).start()
+
+        start = time.monotonic()
+        woken = engine.wait()
+        engine.sample()
+
+        self.assertTrue(woken)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.on_change.assert_called_once_with(2, 0, 1)
+
+    def test_post_from_signal_handler_does_not_wake(self):
+        """wake=False only queues the work; it runs after the current wait()"""
+        engine = InputEngine(self.gpio, self.pins, self.on_change, mode=MODE_INTERRUPT, windows=self.no_debounce)
+        engine.start([0, 0, 0])
+        work = MagicMock()
+        self.assertTrue(engine.post(work, wake=False))
+        self.assertFalse(engine.wait(limit=0.01))
+        self.assertEqual(engine.run_posted(), 1)
+        work.assert_called_once_with()
+
+
+class TestAdaptiveSampling(unittest.TestCase):
+    def setUp(self):
+        self.pins = [27, 17, 9]
+        self.gpio = FakeGPIO(self.pins)
+        self.busy = False
+        self.now = 0.0
+        self.engine = InputEngine(self.gpio, self.pins, MagicMock(), mode=MODE_POLL,
+                                  windows=[0.0] * 3, busy=lambda: self.busy)
+        self.engine._now = lambda: self.now
+        self.engine.start([0, 0, 0])
+
+    def test_rate_follows_busy_state(self):
+        """Fast sampling while busy, poll interval while idle"""
+        self.assertEqual(self.engine.update_rate(), RATE_IDLE)
+        self.assertEqual(self.engine.timeout(), Config.POLL_INTERVAL)
+
+        self.busy = True
+        self.assertEqual(self.engine.update_rate(), RATE_ACTIVE)
+        self.assertEqual(self.engine.timeout(), Config.SAMPLE_INTERVAL_ACTIVE)
+
+        self.busy = False
+        self.assertEqual(self.engine.update_rate(), RATE_IDLE)
+
+    def test_stats_are_kept_per_rate(self):
+        """Samples and detected changes are attributed to the current rate"""
+        self.busy = True
+        self.engine.update_rate()
+        for _ in range(50):
+            self.now += 0.02
+            self.engine.sample()
+        self.gpio.levels[9] = 1
+        self.now += 0.02
+        self.engine.sample()
+
+        report = self.engine.stats.report()
+        self.assertEqual(report[RATE_ACTIVE]['samples'], 51)
+        self.assertEqual(report[RATE_ACTIVE]['changes'], 1)
+        self.assertAlmostEqual(report[RATE_ACTIVE]['rate_hz'], 50.0, places=3)
+        self.assertEqual(report[RATE_IDLE]['samples'], 0)
+
+
+class TestInputDebounce(unittest.TestCase):
+    def setUp(self):
+        self.pins = [27, 17, 9]
+        self.gpio = FakeGPIO(self.pins)
+        self.on_change = MagicMock()
+        self.now = 100.0
+        self.engine = InputEngine(self.gpio, self.pins, self.on_change,
+                                  mode=MODE_INTERRUPT, windows=[0.05, 0.2, 0.2])
+        self.engine._now = lambda: self.now
+        self.engine.start([0, 0, 0])
+
+    def test_change_confirmed_after_window(self):
+        """A new level is only dispatched once it was stable for the window"""
+        self.gpio.set(17, 1)
+        self.engine.sample()
+        self.on_change.assert_not_called()
+        self.assertAlmostEqual(self.engine.timeout(), 0.2)
+
+        self.now += 0.2
+        self.engine.sample()
+        self.on_change.assert_called_once_with(1, 0, 1)
+        self.assertTrue(self.engine.is_high(1))
+
+    def test_bounce_restarts_window(self):
+        """Contact bounce within the window does not produce spurious changes"""
+        self.gpio.set(17, 1)
+        self.engine.sample()
+        self.now += 0.1
+        self.gpio.set(17, 0)
+        self.engine.sample()      # back at stable level -> nothing pending
+        self.now += 0.05
+        self.gpio.set(17, 1)
+        self.engine.sample()      # window starts again
+        self.now += 0.15
+        self.engine.sample()
+        self.on_change.assert_not_called()
+
+        self.now += 0.05
+        self.engine.sample()
+        self.on_change.assert_called_once_with(1, 0, 1)
+
+    def test_edge_between_samples_restarts_window(self):
+        """An edge reported by the interrupt resets the window even if the sampled level is unchanged"""
+        self.gpio.set(27, 1)
+        self.engine.sample()
+        self.now += 0.04
+        self.gpio.set(27, 0)
+        self.gpio.set(27, 1)      # bounced back before the next sample
+        self.engine.sample()
+        self.now += 0.04
+        self.engine.sample()
+        self.on_change.assert_not_called()
+
+        self.now += 0.01
+        self.engine.sample()
+        self.on_change.assert_called_once_with(0, 0, 1)
+
+    def test_stats_latency_runs_from_the_edge(self):
+        """Latency counts from the edge, lag is what the sampling adds to the window"""
+        self.gpio.set(27, 1)          # Flanke bei 100.0
+        self.now += 0.03
+        self.engine.sample()          # erst 30 ms später abgetastet
+        self.now += 0.06
+        self.engine.sample()          # Fenster (50 ms) seit 10 ms abgelaufen
+        self.on_change.assert_called_once_with(0, 0, 1)
+        report = self.engine.stats.report()[RATE_IDLE]
+        self.assertAlmostEqual(report['latency_max_ms'], 90.0)
+        self.assertAlmostEqual(report['lag_max_ms'], 40.0)
+
+    def test_emergency_door_has_a_short_window(self):
+        """Input 7 stops the motors, its window must not delay the stop beyond the end switches'"""
+        windows = debounce_windows(len(Config.INPUTS))
+        self.assertLessEqual(windows[7], 0.05)
+        self.assertLessEqual(windows[7], min(windows[0:4]))
+        self.assertIn(4, Config.DEBOUNCE_TIMES)
+
+    def test_majority_vote_oversampling(self):
+        """With oversampling a single glitching read is outvoted"""
+        engine = InputEngine(self.gpio, self.pins, self.on_change, mode=MODE_POLL,
+                             windows=[0.0] * 3, oversampling=3)
+        reads = iter([0b010, 0b000, 0b000])
+        engine.read_word = lambda: next(reads)
+        self.assertEqual(engine.read_majority(), 0b000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import json
+from unittest.mock import patch
+
+from Clock import VirtualClock
+from TimerManager import use_clock
+from GpioSimulator import SimulatedGPIO
+from InputEngine import InputEngine, MODE_INTERRUPT
+from LatencyMonitor import (LatencyHistogram, LatencyMonitor, InstrumentedGPIO, BUCKET_BOUNDS_MS,
+                            STAGE_DISPATCH, STAGE_HANDLER, STAGE_OUTPUT)
+from PaketBoxState import MotorState
+from state import pbox_state
+from config import Config
+import paketbox
+import handler
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_values_land_in_fixed_buckets(self):
+        histogram = LatencyHistogram()
+        for ms in (0.05, 0.1, 3, 3, 5000):
+            histogram.record(ms)
+        self.assertEqual(histogram.counts[0], 2)  # <= 0.1 ms
+        self.assertEqual(histogram.counts[BUCKET_BOUNDS_MS.index(5)], 2)
+        self.assertEqual(histogram.counts[-1], 1)  # overflow
+        self.assertEqual(histogram.percentile(0.5), 5)
+        self.assertEqual(histogram.percentile(0.99), 5000)
+
+
+class TestLatencyMonitor(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock(100.0)
+        self.monitor = LatencyMonitor(clock=self.clock)
+
+    def test_trace_records_each_stage_relative_to_edge(self):
+        """Dispatch/handler keep the first mark, output keeps the last one"""
+        self.monitor.begin('input7_rising', 99.9)
+        self.monitor.mark(STAGE_DISPATCH)
+        self.monitor.mark(STAGE_HANDLER)
+        self.clock.advance(0.001)
+        self.monitor.mark(STAGE_DISPATCH)
+        self.clock.advance(0.002)
+        self.monitor.mark(STAGE_HANDLER)
+        self.monitor.mark(STAGE_OUTPUT)
+        self.clock.advance(0.003)
+        self.monitor.mark(STAGE_OUTPUT)
+        self.monitor.end()
+
+        report = self.monitor.report()['input7_rising']
+        self.assertAlmostEqual(report[STAGE_DISPATCH]['max_ms'], 100)
+        self.assertAlmostEqual(report[STAGE_HANDLER]['max_ms'], 100)
+        self.assertAlmostEqual(report[STAGE_OUTPUT]['max_ms'], 106)
+
+    def test_marks_without_trace_are_ignored(self):
+        self.monitor.mark(STAGE_OUTPUT)
+        self.monitor.end()
+        self.assertEqual(self.monitor.report(), {})
+
+    def test_json_report(self):
+        self.monitor.begin('input4_rising', 100.0)
+        self.monitor.mark(STAGE_DISPATCH)
+        self.monitor.end()
+        data = json.loads(self.monitor.to_json())
+        self.assertEqual(data['bounds_ms'], list(BUCKET_BOUNDS_MS))
+        self.assertEqual(data['events']['input4_rising'][STAGE_DISPATCH]['count'], 1)
+        self.assertEqual(data['events']['input4_rising'][STAGE_OUTPUT]['count'], 0)
+
+
+class TestEmergencyStopLatency(unittest.TestCase):
+    """Door pin 7 opened while a motor runs: edge -> notHaltMotoren() relays"""
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous_clock = use_clock(self.clock)
+        self.monitor = LatencyMonitor()
+        self.gpio = SimulatedGPIO(clock=self.clock)
+        self.gpio_patch = patch.object(paketbox.controller, 'gpio', InstrumentedGPIO(self.gpio, self.monitor))
+        self.gpio_patch.start()
+        self.monitor_patch = patch.object(paketbox.controller, 'latency', self.monitor)
+        self.monitor_patch.start()
+        self.engine = InputEngine(paketbox.controller.gpio, Config.INPUTS, paketbox.pinChanged,
+                                  mode=MODE_INTERRUPT, clock=self.clock, latency=self.monitor)
+        self.engine.start(paketbox.initialize_door_states())
+
+    def tearDown(self):
+        handler.timer_manager.cancel_all_timers()
+        pbox_state.set_left_motor(MotorState.STOPPED)
+        pbox_state.set_right_motor(MotorState.STOPPED)
+        self.monitor_patch.stop()
+        self.gpio_patch.stop()
+        use_clock(self.previous_clock)
+
+    def test_emergency_stop_latency_is_debounce_window(self):
+        pbox_state.set_left_motor(MotorState.OPENING)
+        self.clock.advance(1)
+        self.gpio.set_contact(7, True)
+        for _ in range(5):
+            self.engine.wait(limit=1)
+            self.engine.sample()
+
+        self.assertEqual(pbox_state.left_motor, MotorState.ERROR)
+        report = self.monitor.report()['input7_rising']
+        window_ms = Config.DEBOUNCE_TIMES.get(7, Config.DEBOUNCE_TIME) * 1000
+        self.assertEqual(report[STAGE_OUTPUT]['count'], 1)
+        self.assertAlmostEqual(report[STAGE_DISPATCH]['max_ms'], window_ms)
+        self.assertAlmostEqual(report[STAGE_OUTPUT]['max_ms'], window_ms)
+
+
+if __name__ == '__main__':
+    unittest.main()
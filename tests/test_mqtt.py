@@ -0,0 +1,318 @@
+import os
+import time
+import socket
+import asyncio
+import shutil
+import tempfile
+import unittest
+import threading
+from unittest.mock import MagicMock, patch
+
+import mqtt
+from MqttSpool import MqttSpool
+from MqttLink import MqttLink, AsyncMqttLink, backoff_delay, STATE_CONNECTED
+from config import Config
+
+
+class TestPublishQueue(unittest.TestCase):
+    """Control threads only enqueue; the sender thread talks to the broker"""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.sending = threading.Event()
+        def publish(topic, payload):
+            self.sending.set()
+            self.release.wait(5)
+        self.client = MagicMock()
+        self.client.publish.side_effect = publish
+        self.queue = mqtt.PublishQueue(maxsize=4)
+        for patcher in (patch.object(mqtt, '_client', self.client),
+                        patch.object(mqtt, '_publisher', mqtt.Publisher())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def block_sender(self, topic):
+        """Put one message and wait until the sender hangs in publish()"""
+        self.queue.put(topic, 'blockiert')
+        self.assertTrue(self.sending.wait(1))
+
+    def published(self):
+        return [call.args for call in self.client.publish.call_args_list]
+
+    def test_put_does_not_wait_for_a_blocked_broker(self):
+        self.block_sender('t/a')
+        for k in range(10):
+            self.assertTrue(self.queue.put('t/a', str(k)))
+        self.assertEqual(self.queue.stats()['dropped'], 6)  # one message is at the sender
+        self.release.set()
+        self.assertTrue(self.queue.flush(1))
+        self.assertEqual(self.published(), [('t/a', 'blockiert'), ('t/a', '6'), ('t/a', '7'),
+                                            ('t/a', '8'), ('t/a', '9')])
+
+    def test_latest_value_wins_per_topic(self):
+        self.block_sender('t/event')
+        self.queue.put('t/verlauf', 'alt', mqtt.POLICY_LATEST)
+        self.queue.put('t/event', 'ON')
+        self.queue.put('t/verlauf', 'neu', mqtt.POLICY_LATEST)
+        self.queue.put('t/event', 'OFF')
+        self.assertEqual(self.queue.pending(), 3)
+        self.release.set()
+        self.assertTrue(self.queue.flush(1))
+        self.assertEqual(self.published(), [('t/event', 'blockiert'), ('t/verlauf', 'neu'),
+                                            ('t/event', 'ON'), ('t/event', 'OFF')])
+        self.assertEqual(self.queue.stats()['coalesced'], 1)
+
+    def test_module_functions_use_the_queue(self):
+        self.release.set()
+        with patch.object(mqtt, 'MQTT_AVAILABLE', True):
+            self.assertTrue(mqtt.publish_briefkasten_event("ON"))
+            self.assertTrue(mqtt.flush(1))
+        self.client.publish.assert_called_once_with(Config.MQTT_TOPIC_BRIEFKASTEN, "ON")
+
+
+class TestPublisher(unittest.TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        for patcher in (patch.object(mqtt, 'MQTT_AVAILABLE', True), patch.object(mqtt, '_client', self.client)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def published(self):
+        self.assertTrue(mqtt.flush(1))
+        return [call.args for call in self.client.publish.call_args_list]
+
+    def test_repeated_payload_is_skipped(self):
+        publisher = mqtt.Publisher()
+        for value in ("ON", "ON", "OFF", "OFF", "ON"):
+            self.assertTrue(publisher.publish(mqtt.Event.BRIEFKASTEN, value))
+        for _ in range(2):
+            publisher.publish(mqtt.Event.STATUS, "bereit")  # Statusmeldungen werden nie unterdrückt
+        topic = Config.MQTT_TOPIC_BRIEFKASTEN
+        self.assertEqual(self.published(), [(topic, "ON"), (topic, "OFF"), (topic, "ON"),
+                                            (Config.MQTT_TOPIC_MESSAGE, "bereit"),
+                                            (Config.MQTT_TOPIC_MESSAGE, "bereit")])
+        self.assertEqual(publisher.skipped, 2)
+
+    def test_unsent_payload_is_not_remembered(self):
+        publisher = mqtt.Publisher()
+        with patch.object(mqtt, '_client', None):
+            self.assertFalse(publisher.publish(mqtt.Event.BEWEGUNGSMELDER, "ON"))
+        self.assertTrue(publisher.publish(mqtt.Event.BEWEGUNGSMELDER, "ON"))
+        self.assertEqual(self.published(), [(Config.MQTT_TOPIC_BEWEGUNGSMELDER, "ON")])
+
+    def test_every_event_has_a_topic(self):
+        publisher = mqtt.Publisher('home/eingang_nord')
+        for event in mqtt.Event:
+            self.assertTrue(publisher.topic(event).startswith('home/eingang_nord/'))
+
+
+class TestMqttSpool(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def drain(self, spool):
+        messages = []
+        while spool.pending_bytes():
+            batch = spool.peek(3)
+            spool.commit(batch)
+            messages.extend((topic, payload) for topic, payload, _ in batch)
+        return messages
+
+    def test_one_fsync_per_batch_and_replay_in_order(self):
+        spool = MqttSpool(self.dir, max_bytes=10000, segment_bytes=60)
+        with patch('MqttSpool.os.fsync') as fsync:
+            for k in range(4):
+                spool.append([('t/a', f"{k}-{n}") for n in range(3)])
+        self.assertEqual(fsync.call_count, 4)
+        self.assertGreater(len(os.listdir(self.dir)), 1)  # rotated into several segments
+
+        restarted = MqttSpool(self.dir, max_bytes=10000, segment_bytes=60)
+        self.assertEqual(self.drain(restarted), [('t/a', f"{k}-{n}") for k in range(4) for n in range(3)])
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_size_is_bounded_by_dropping_the_oldest_segment(self):
+        spool = MqttSpool(self.dir, max_bytes=200, segment_bytes=50)
+        for k in range(50):
+            spool.append([('t/a', str(k))])
+        self.assertLessEqual(spool.pending_bytes(), 200)
+        self.assertGreater(spool.dropped_bytes, 0)
+        messages = self.drain(spool)
+        self.assertEqual(messages[-1], ('t/a', '49'))
+        self.assertEqual([int(payload) for _, payload in messages], sorted(int(p) for _, p in messages))
+
+    def test_torn_last_line_is_skipped(self):
+        spool = MqttSpool(self.dir)
+        spool.append([('t/a', 'ganz')])
+        spool._writer.write(b'["t/a","hal')
+        spool._writer.close()
+        self.assertEqual(self.drain(MqttSpool(self.dir)), [('t/a', 'ganz'), (None, None)])
+
+    def test_foreign_files_are_ignored(self):
+        MqttSpool(self.dir).append([('t/a', 'x')])
+        open(os.path.join(self.dir, 'alt.spool'), 'w').close()
+        self.assertEqual(self.drain(MqttSpool(self.dir)), [('t/a', 'x')])
+
+
+class TestStoreAndForward(unittest.TestCase):
+    """Messages published during a broker outage are sent after the reconnect"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.connected = False
+        self.client = MagicMock()
+        self.client.is_connected.side_effect = lambda: self.connected
+        patcher = patch.object(mqtt, '_client', self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = mqtt.PublishQueue(spool=MqttSpool(self.dir))
+
+    def test_outage_is_spooled_and_replayed_in_order(self):
+        for k in range(5):
+            self.queue.put('t/event', str(k))
+        self.assertTrue(self.queue.flush(1))
+        self.client.publish.assert_not_called()
+        self.assertEqual(self.queue.stats()['spooled'], 5)
+
+        self.connected = True
+        self.queue.put('t/event', 'live')  # queued behind the spool
+        self.queue.wake()
+        deadline = time.monotonic() + 2
+        while self.queue.spool.pending_bytes() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([call.args[1] for call in self.client.publish.call_args_list],
+                         ['0', '1', '2', '3', '4', 'live'])
+
+    def test_spool_error_does_not_stop_the_sender(self):
+        self.queue.put('t/event', object())  # nicht als JSON speicherbar
+        self.assertTrue(self.queue.flush(1))
+        self.assertEqual(self.queue.stats()['failed'], 1)
+
+        self.connected = True
+        self.queue.put('t/event', 'live')
+        self.assertTrue(self.queue.flush(1))
+        self.client.publish.assert_called_once_with('t/event', 'live')
+
+    def test_replay_is_throttled(self):
+        for k in range(10):
+            self.queue.put('t/event', str(k))
+        self.assertTrue(self.queue.flush(1))
+        self.connected = True
+        start = time.monotonic()
+        with patch.object(Config, 'MQTT_SPOOL_REPLAY_RATE', 40):
+            self.queue.wake()
+            while self.queue.spool.pending_bytes() and time.monotonic() - start < 2:
+                time.sleep(0.01)
+        self.assertEqual(self.client.publish.call_count, 10)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class FakeClient:
+    """paho client whose broker is down for the next `failures` connect attempts"""
+    def __init__(self, failures):
+        self.failures = failures
+        self.link = None
+        self.connack = False
+        self.lost = False
+
+    def reconnect(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError("Broker nicht erreichbar")
+        self.connack = True
+
+    def loop(self, timeout):
+        if self.connack:
+            self.connack = False
+            self.link.connected()  # on_connect
+        if self.lost:
+            self.lost = False
+            return 7  # MQTT_ERR_CONN_LOST
+        time.sleep(timeout)
+        return 0
+
+    def disconnect(self):
+        pass
+
+
+class SocketFakeClient(FakeClient):
+    """FakeClient for AsyncMqttLink: the CONNACK arrives on a real socket served by the loop"""
+    def reconnect(self):
+        super().reconnect()
+        self.sock, self.broker = socket.socketpair()
+        self.on_socket_open(self, None, self.sock)
+        self.broker.send(b'\x20')  # CONNACK
+
+    def loop_read(self):
+        self.sock.recv(1)
+        self.link.connected()
+        return 0
+
+    def loop_write(self):
+        return 0
+
+    def loop_misc(self):
+        return 0
+
+    def disconnect(self):
+        self.on_socket_close(self, None, self.sock)
+        self.sock.close()
+        self.broker.close()
+
+
+class TestMqttLink(unittest.TestCase):
+    def wait_for(self, condition, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return condition()
+
+    def test_backoff_doubles_with_jitter_and_has_no_attempt_limit(self):
+        self.assertEqual(backoff_delay(1, 1, 60, rand=lambda: 0), 0.5)
+        self.assertEqual(backoff_delay(3, 1, 60, rand=lambda: 1), 4)
+        self.assertEqual(backoff_delay(1000, 1, 60, rand=lambda: 0), 30)
+
+    def test_reconnects_until_the_broker_is_back(self):
+        client = FakeClient(failures=3)
+        link = client.link = MqttLink(client, min_delay=0.01, max_delay=0.04, loop_timeout=0.005)
+        link.start()
+        self.addCleanup(link.stop)
+        self.assertTrue(self.wait_for(lambda: link.state == STATE_CONNECTED))
+        self.assertEqual(link.stats()['total_attempts'], 4)
+
+        client.failures, client.lost = 2, True  # Broker-Neustart
+        self.assertTrue(self.wait_for(lambda: link.stats()['reconnects'] == 1))
+        stats = link.stats()
+        self.assertEqual(stats['total_attempts'], 7)
+        self.assertGreater(stats['last_reconnect_time'], 0)
+        self.assertEqual(stats['disconnected_time'], round(stats['last_reconnect_time'], 3))
+
+    def test_async_link_connects_from_the_event_loop(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        client = SocketFakeClient(failures=2)
+        link = client.link = AsyncMqttLink(client, loop, min_delay=0.01, max_delay=0.04, loop_timeout=0.005)
+
+        async def scenario():
+            link.start()
+            while link.state != STATE_CONNECTED:
+                await asyncio.sleep(0.005)
+            link.stop()
+        loop.run_until_complete(asyncio.wait_for(scenario(), 2))
+        loop.run_until_complete(loop.shutdown_default_executor())
+        self.assertEqual(link.stats()['total_attempts'], 3)
+
+    def test_disconnect_callback_returns_immediately(self):
+        link = MqttLink(FakeClient(failures=0))
+        link.state = STATE_CONNECTED
+        with patch.object(mqtt, '_link', link), patch.object(mqtt, 'MQTT_AVAILABLE', True):
+            start = time.monotonic()
+            mqtt.mqtt_disconnect(None, None, 1)
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(link.stats()['state'], 'disconnected')
+
+
+if __name__ == '__main__':
+    unittest.main()
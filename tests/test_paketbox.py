@@ -6,6 +6,7 @@ import time
 
 # Importiere die wichtigsten Symbole aus dem Hauptscript
 from paketbox import DoorState, MotorState, initialize_door_states, pinChanged
+from paketbox import register_edge_handler, build_edge_dispatch_table, EDGE_RISING, controller
 from state import pbox_state  # Import from central state module
 from handler import (
     Klappen_oeffnen, Klappen_schliessen, Klappen_oeffnen_abbrechen,
@@ -23,9 +24,9 @@ class TestPaketBox(unittest.TestCase):
         pbox_state.set_left_motor(MotorState.STOPPED)
         pbox_state.set_right_motor(MotorState.STOPPED)
 
-    @patch('paketbox.GPIO')
-    @patch('handler.setOutputWithRuntime')  # Mock this to avoid timer complexity
-    @patch('handler.threading.Timer')
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')  # Mock this to avoid timer complexity
+    @patch('PaketBoxController.Timer')
     def test_Klappen_oeffnen_success(self, mock_timer, mock_setOutput, mock_gpio):
         """Test successful flap opening operation"""
         # Setup GPIO mock
@@ -60,9 +61,9 @@ class TestPaketBox(unittest.TestCase):
         self.assertEqual(pbox_state.right_door, DoorState.OPEN)
         self.assertFalse(pbox_state.is_any_error())
 
-    @patch('paketbox.GPIO')
-    @patch('handler.setOutputWithRuntime')  # Mock this to avoid timer complexity
-    @patch('handler.threading.Timer')
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')  # Mock this to avoid timer complexity
+    @patch('PaketBoxController.Timer')
     def test_Klappen_oeffnen_error(self, mock_timer, mock_setOutput, mock_gpio):
         """Test flap opening error condition"""
         # Setup GPIO mock
@@ -95,9 +96,9 @@ class TestPaketBox(unittest.TestCase):
         self.assertEqual(pbox_state.right_door, DoorState.ERROR)
         self.assertTrue(pbox_state.is_any_error())
 
-    @patch('paketbox.GPIO')
-    @patch('handler.setOutputWithRuntime')  # Mock this to avoid timer complexity
-    @patch('handler.threading.Timer')
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')  # Mock this to avoid timer complexity
+    @patch('PaketBoxController.Timer')
     def test_Klappen_schliessen_success(self, mock_timer, mock_setOutput, mock_gpio):
         """Test successful flap closing operation"""
         # Setup initial state with open flaps
@@ -136,9 +137,9 @@ class TestPaketBox(unittest.TestCase):
         self.assertEqual(pbox_state.right_door, DoorState.CLOSED)
         self.assertFalse(pbox_state.is_any_error())
 
-    @patch('paketbox.GPIO')
-    @patch('handler.setOutputWithRuntime')  # Mock this to avoid timer complexity
-    @patch('handler.threading.Timer')
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')  # Mock this to avoid timer complexity
+    @patch('PaketBoxController.Timer')
     def test_Klappen_schliessen_error(self, mock_timer, mock_setOutput, mock_gpio):
         """Test flap closing error condition"""
         # Setup initial state with open flaps
@@ -198,16 +199,14 @@ class TestPaketBox(unittest.TestCase):
         # State should remain in error
         self.assertEqual(pbox_state.left_door, DoorState.ERROR)
 
-    @patch('handler.get_gpio')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
-    def test_motor_blockage_only_left_flap_blocked(self, mock_timer, mock_setOutput, mock_get_gpio):
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
+    def test_motor_blockage_only_left_flap_blocked(self, mock_timer, mock_setOutput, mock_gpio):
         """Test motor blockage: only left flap blocked by package"""
         # Setup GPIO mock
-        mock_gpio = MagicMock()
         mock_gpio.LOW = 0
         mock_gpio.HIGH = 1
-        mock_get_gpio.return_value = mock_gpio
         mock_setOutput.return_value = True
         
         # Capture timer callback with debug output
@@ -247,16 +246,14 @@ class TestPaketBox(unittest.TestCase):
         self.assertEqual(pbox_state.right_door, DoorState.ERROR)
         self.assertTrue(pbox_state.is_any_error())
 
-    @patch('handler.get_gpio')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
-    def test_motor_blockage_both_flaps_blocked(self, mock_timer, mock_setOutput, mock_get_gpio):
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
+    def test_motor_blockage_both_flaps_blocked(self, mock_timer, mock_setOutput, mock_gpio):
         """Test motor blockage: both flaps blocked by large package"""
         # Setup GPIO mock
-        mock_gpio = MagicMock()
         mock_gpio.LOW = 0
         mock_gpio.HIGH = 1
-        mock_get_gpio.return_value = mock_gpio
         mock_setOutput.return_value = True
         
         # Capture timer callback
@@ -287,19 +284,17 @@ class TestPaketBox(unittest.TestCase):
         self.assertEqual(pbox_state.right_door, DoorState.ERROR)
         self.assertTrue(pbox_state.is_any_error())
 
-    @patch('handler.get_gpio')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
-    def test_motor_blockage_partial_opening(self, mock_timer, mock_setOutput, mock_get_gpio):
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
+    def test_motor_blockage_partial_opening(self, mock_timer, mock_setOutput, mock_gpio):
         """Test motor blockage: flaps partially open but can't reach full position"""
         # This simulates a scenario where motors run but flaps get stuck halfway
         # In real hardware, this would be detected by position sensors
         
         # Setup GPIO mock
-        mock_gpio = MagicMock()
         mock_gpio.LOW = 0
         mock_gpio.HIGH = 1
-        mock_get_gpio.return_value = mock_gpio
         mock_setOutput.return_value = True
         
         # Capture timer callback
@@ -326,20 +321,18 @@ class TestPaketBox(unittest.TestCase):
         self.assertEqual(pbox_state.right_door, DoorState.ERROR)
         self.assertTrue(pbox_state.is_any_error())
 
-    @patch('handler.get_gpio')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
-    def test_motor_blockage_closing_with_package_obstruction(self, mock_timer, mock_setOutput, mock_get_gpio):
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
+    def test_motor_blockage_closing_with_package_obstruction(self, mock_timer, mock_setOutput, mock_gpio):
         """Test motor blockage during closing: package prevents flap from closing"""
         # Setup initial state with open flaps
         pbox_state.set_left_door(DoorState.OPEN)
         pbox_state.set_right_door(DoorState.OPEN)
         
         # Setup GPIO mock
-        mock_gpio = MagicMock()
         mock_gpio.LOW = 0
         mock_gpio.HIGH = 1
-        mock_get_gpio.return_value = mock_gpio
         mock_setOutput.return_value = True
         
         # Capture timer callback
@@ -367,16 +360,14 @@ class TestPaketBox(unittest.TestCase):
         self.assertEqual(pbox_state.right_door, DoorState.ERROR)
         self.assertTrue(pbox_state.is_any_error())
 
-    @patch('handler.get_gpio')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
-    def test_motor_failure_setOutputWithRuntime_fails(self, mock_timer, mock_setOutput, mock_get_gpio):
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
+    def test_motor_failure_setOutputWithRuntime_fails(self, mock_timer, mock_setOutput, mock_gpio):
         """Test motor failure: setOutputWithRuntime returns None (hardware failure)"""
         # Setup GPIO mock
-        mock_gpio = MagicMock()
         mock_gpio.LOW = 0
         mock_gpio.HIGH = 1
-        mock_get_gpio.return_value = mock_gpio
         
         # Simulate hardware failure - first motor starts, second motor fails
         mock_setOutput.side_effect = [True, None]  # First motor OK, second fails
@@ -390,16 +381,14 @@ class TestPaketBox(unittest.TestCase):
         # Timer should not be started for endlagen_pruefung
         mock_timer.assert_not_called()
 
-    @patch('handler.get_gpio')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
-    def test_motor_failure_one_motor_fails_to_start(self, mock_timer, mock_setOutput, mock_get_gpio):
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
+    def test_motor_failure_one_motor_fails_to_start(self, mock_timer, mock_setOutput, mock_gpio):
         """Test motor failure: one motor fails to start while other succeeds"""
         # Setup GPIO mock
-        mock_gpio = MagicMock()
         mock_gpio.LOW = 0
         mock_gpio.HIGH = 1
-        mock_get_gpio.return_value = mock_gpio
         
         # Simulate both motors failing
         mock_setOutput.side_effect = [None, None]  # Both motors fail
@@ -416,17 +405,15 @@ class TestPaketBox(unittest.TestCase):
         # Timer should not be started for endlagen_pruefung
         mock_timer.assert_not_called()
 
-    @patch('handler.get_gpio')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
-    @patch('handler.Klappen_schliessen')
-    def test_complete_package_delivery_with_motor_blockage_recovery(self, mock_schliessen, mock_timer, mock_setOutput, mock_get_gpio):
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
+    @patch.object(controller, 'Klappen_schliessen')
+    def test_complete_package_delivery_with_motor_blockage_recovery(self, mock_schliessen, mock_timer, mock_setOutput, mock_gpio):
         """Integration test: complete package delivery cycle with motor blockage and recovery"""
         # Setup GPIO mock
-        mock_gpio = MagicMock()
         mock_gpio.LOW = 0
         mock_gpio.HIGH = 1
-        mock_get_gpio.return_value = mock_gpio
         mock_setOutput.return_value = True
         mock_schliessen.return_value = True
         
@@ -478,14 +465,14 @@ class TestPaketBox(unittest.TestCase):
         self.assertFalse(pbox_state.is_any_error())
         mock_schliessen.assert_called_once()  # Auto-close after successful opening
 
-    @patch('paketbox.GPIO')
+    @patch.object(controller, 'gpio')
     def test_unlockDoor(self, mock_gpio):
         """Test door unlocking functionality"""
         mock_gpio.HIGH = 1
         unlockDoor()
         mock_gpio.output.assert_called_with(26, mock_gpio.HIGH)
 
-    @patch('paketbox.GPIO')
+    @patch.object(controller, 'gpio')
     def test_lockDoor(self, mock_gpio):
         """Test door locking functionality"""
         mock_gpio.LOW = 0
@@ -729,9 +716,22 @@ class TestPaketBox(unittest.TestCase):
                 self.assertEqual(actual_state, expected_state, 
                                f"Pin {pin} should set {door_attr} to {expected_state.name}")
 
-    @patch('handler.threading.Timer')
-    @patch('handler.lockDoor')
-    @patch('handler.Klappen_oeffnen')
+    def test_pinChanged_registered_edge_handler(self):
+        """Test that additional handlers can be plugged into the dispatch table"""
+        motion_handler = MagicMock()
+        register_edge_handler(10, EDGE_RISING, motion_handler)
+        try:
+            pinChanged(10, 0, 1)
+            motion_handler.assert_called_once()
+
+            pinChanged(10, 1, 0)
+            motion_handler.assert_called_once()  # falling edge not registered
+        finally:
+            build_edge_dispatch_table()
+
+    @patch('PaketBoxController.Timer')
+    @patch.object(controller, 'lockDoor')
+    @patch.object(controller, 'Klappen_oeffnen')
     def test_Klappen_oeffnen_abbrechen_with_active_timer(self, mock_oeffnen, mock_lock, mock_timer):
         """Test canceling flap opening when timer is active"""
         # Setup mock timer
@@ -760,9 +760,9 @@ class TestPaketBox(unittest.TestCase):
         # Should return False since no timer was active
         self.assertFalse(result)
 
-    @patch('handler.threading.Timer')
-    @patch('handler.lockDoor')
-    @patch('handler.Klappen_oeffnen')
+    @patch('PaketBoxController.Timer')
+    @patch.object(controller, 'lockDoor')
+    @patch.object(controller, 'Klappen_oeffnen')
     def test_Paket_Tuer_Zusteller_geschlossen_cancels_previous_timer(self, mock_oeffnen, mock_lock, mock_timer):
         """Test that starting new closing process cancels previous timer"""
         # Setup mock timers
@@ -781,8 +781,8 @@ class TestPaketBox(unittest.TestCase):
         # Verify second timer was created and started
         mock_timer2.start.assert_called_once()
 
-    @patch('handler.Klappen_oeffnen_abbrechen')
-    @patch('handler.Klappen_schliessen')
+    @patch.object(controller, 'Klappen_oeffnen_abbrechen')
+    @patch.object(controller, 'Klappen_schliessen')
     def test_Paket_Tuer_Zusteller_geoeffnet_calls_abbrechen(self, mock_schliessen, mock_abbrechen):
         """Test that opening door cancels flap opening"""
         # Setup: doors closed
@@ -796,9 +796,9 @@ class TestPaketBox(unittest.TestCase):
         # Verify that abort function was called
         mock_abbrechen.assert_called_once()
 
-    @patch('handler.threading.Timer')
-    @patch('handler.lockDoor')
-    @patch('handler.Klappen_oeffnen')
+    @patch('PaketBoxController.Timer')
+    @patch.object(controller, 'lockDoor')
+    @patch.object(controller, 'Klappen_oeffnen')
     def test_delayed_klappen_oeffnen_executes_when_door_stays_closed(self, mock_oeffnen, mock_lock, mock_timer):
         """Test that delayed flap opening executes when door stays closed"""
         # Setup: door closed
@@ -821,9 +821,9 @@ class TestPaketBox(unittest.TestCase):
         # Verify flap opening was called
         mock_oeffnen.assert_called_once()
 
-    @patch('handler.threading.Timer')
-    @patch('handler.lockDoor')
-    @patch('handler.Klappen_oeffnen')
+    @patch('PaketBoxController.Timer')
+    @patch.object(controller, 'lockDoor')
+    @patch.object(controller, 'Klappen_oeffnen')
     def test_delayed_klappen_oeffnen_aborts_when_door_reopened(self, mock_oeffnen, mock_lock, mock_timer):
         """Test that delayed flap opening aborts when door is reopened"""
         # Setup: door initially closed
@@ -858,9 +858,9 @@ class TestPaketBoxIntegration(unittest.TestCase):
         pbox_state.set_right_door(DoorState.CLOSED)
         pbox_state.set_paket_tuer(DoorState.CLOSED)
 
-    @patch('paketbox.GPIO')
-    @patch('handler.setOutputWithRuntime')
-    @patch('handler.threading.Timer')
+    @patch.object(controller, 'gpio')
+    @patch.object(controller, 'setOutputWithRuntime')
+    @patch('PaketBoxController.Timer')
     def test_error_recovery_scenario(self, mock_timer, mock_setOutput, mock_gpio):
         """Test system behavior during error conditions and recovery"""
         # Setup GPIO mock
@@ -923,7 +923,7 @@ class TestPaketBoxIntegration(unittest.TestCase):
                         self.assertEqual(pbox_state.is_all_closed(), expected_all_closed)
                         self.assertEqual(pbox_state.is_any_error(), expected_any_error)
 
-    @patch('paketbox.GPIO')
+    @patch.object(controller, 'gpio')
     def test_gpio_output_operations(self, mock_gpio):
         """Test GPIO output operations for motor control"""
         # Setup GPIO constants
@@ -967,9 +967,9 @@ class TestPaketBoxIntegration(unittest.TestCase):
         for result in results:
             self.assertIn(result, valid_states)
 
-    @patch('handler.threading.Timer')
-    @patch('handler.lockDoor')
-    @patch('handler.Klappen_oeffnen')
+    @patch('PaketBoxController.Timer')
+    @patch.object(controller, 'lockDoor')
+    @patch.object(controller, 'Klappen_oeffnen')
     def test_complete_door_opening_cancellation_scenario(self, mock_oeffnen, mock_lock, mock_timer):
         """Integration test: Complete scenario of door opening cancellation"""
         # Setup: All doors closed, package door events
@@ -0,0 +1,193 @@
+import unittest
+import threading
+import itertools
+from unittest.mock import patch, MagicMock
+
+from mqtt import Event
+from PaketBoxState import PaketBoxState, StateSnapshot, DoorState, MotorState, ANY_ERROR, IS_OPEN
+
+
+class TestStateSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.state = PaketBoxState()
+
+    def test_snapshot_is_not_changed_by_later_sets(self):
+        before = self.state.snapshot()
+        self.state.set_left_door(DoorState.OPEN)
+        self.assertEqual(before.left_door, DoorState.CLOSED)
+        self.assertEqual(self.state.left_door, DoorState.OPEN)
+        self.assertEqual(self.state.snapshot(), StateSnapshot(left_door=DoorState.OPEN))
+
+    def test_snapshot_fields_are_read_only(self):
+        with self.assertRaises(AttributeError):
+            self.state.snapshot().left_door = DoorState.OPEN
+        with self.assertRaises(AttributeError):
+            self.state.left_motor = MotorState.ERROR
+
+    def test_readers_do_not_take_the_writer_lock(self):
+        """Predicates and __str__ work while a writer holds the lock"""
+        with self.state._lock:
+            self.assertFalse(self.state.is_any_error())
+            self.assertTrue(self.state.is_all_closed())
+            self.assertIn("Motor links: STOPPED", str(self.state))
+
+    def test_readers_see_consistent_state_while_writers_run(self):
+        """Writers always set both motors together; no reader may see a mixed pair"""
+        stop = threading.Event()
+        mixed = []
+
+        def writer(state):
+            while not stop.is_set():
+                with self.state._lock:
+                    self.state._snapshot = StateSnapshot(left_motor=state, right_motor=state)
+
+        def reader():
+            for _ in range(20000):
+                s = self.state.snapshot()
+                if s.left_motor != s.right_motor:
+                    mixed.append(s)
+
+        writers = [threading.Thread(target=writer, args=(m,)) for m in (MotorState.OPENING, MotorState.STOPPED)]
+        for w in writers:
+            w.start()
+        reader()
+        stop.set()
+        for w in writers:
+            w.join()
+        self.assertEqual(mixed, [])
+
+
+
+class TestDerivedFlags(unittest.TestCase):
+    def test_flags_match_field_predicates_for_all_combinations(self):
+        """Each bit-test predicate equals the any()/all() definition over the fields"""
+        state = PaketBoxState()
+        running = (MotorState.OPENING, MotorState.CLOSING)
+        for left, right, paket in itertools.product(DoorState, repeat=3):
+            for left_motor, right_motor in itertools.product(MotorState, repeat=2):
+                state.set_left_door(left)
+                state.set_right_door(right)
+                state.set_paket_tuer(paket)
+                state.set_left_motor(left_motor)
+                state.set_right_motor(right_motor)
+                doors, motors = [left, right], [left_motor, right_motor]
+                self.assertEqual((state.left_door, state.right_door, state.paket_tuer,
+                                  state.left_motor, state.right_motor),
+                                 (left, right, paket, left_motor, right_motor))
+                self.assertEqual(state.is_open(), all(d == DoorState.OPEN for d in doors))
+                self.assertEqual(state.is_any_open(), any(d == DoorState.OPEN for d in doors))
+                self.assertEqual(state.is_all_closed(), all(d == DoorState.CLOSED for d in doors + [paket]))
+                self.assertEqual(state.is_any_error(), DoorState.ERROR in doors + [paket] or MotorState.ERROR in motors)
+                self.assertEqual(state.is_any_motor_running(), any(m in running for m in motors))
+                self.assertEqual(state.is_any_motor_error(), MotorState.ERROR in motors)
+                self.assertEqual(state.are_both_motors_stopped(), all(m == MotorState.STOPPED for m in motors))
+
+
+
+class TestTransition(unittest.TestCase):
+    def setUp(self):
+        self.state = PaketBoxState()
+
+    def test_updates_all_fields_at_once(self):
+        self.assertTrue(self.state.transition(forbid=ANY_ERROR, left_motor=MotorState.OPENING,
+                                              right_motor=MotorState.OPENING))
+        self.assertEqual(self.state.snapshot(), StateSnapshot(left_motor=MotorState.OPENING,
+                                                              right_motor=MotorState.OPENING))
+
+    def test_forbidden_flag_blocks_transition(self):
+        """An emergency stop (motor ERROR) prevents a later motor start"""
+        self.state.transition(left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+        self.assertFalse(self.state.transition(forbid=ANY_ERROR, left_motor=MotorState.OPENING,
+                                               right_motor=MotorState.OPENING))
+        self.assertEqual(self.state.left_motor, MotorState.ERROR)
+        self.assertEqual(self.state.right_motor, MotorState.ERROR)
+
+    def test_required_flag_must_be_set(self):
+        self.state.set_left_door(DoorState.OPEN)
+        self.assertFalse(self.state.transition(require=IS_OPEN, left_motor=MotorState.STOPPED))
+        self.state.set_right_door(DoorState.OPEN)
+        self.assertTrue(self.state.transition(require=IS_OPEN, left_motor=MotorState.CLOSING))
+        self.assertEqual(self.state.left_motor, MotorState.CLOSING)
+
+    def test_start_and_emergency_stop_never_interleave(self):
+        """Concurrent start (forbid=ANY_ERROR) and stop: the stop always wins in the end"""
+        for _ in range(200):
+            state = PaketBoxState()
+            start = threading.Thread(target=state.transition,
+                                     kwargs=dict(forbid=ANY_ERROR, left_motor=MotorState.OPENING,
+                                                 right_motor=MotorState.OPENING))
+            stop = threading.Thread(target=state.transition,
+                                    kwargs=dict(left_motor=MotorState.ERROR, right_motor=MotorState.ERROR))
+            start.start()
+            stop.start()
+            start.join()
+            stop.join()
+            self.assertEqual((state.left_motor, state.right_motor), (MotorState.ERROR, MotorState.ERROR))
+
+
+
+class TestSubscriptions(unittest.TestCase):
+    def setUp(self):
+        self.state = PaketBoxState()
+        self.changes = []
+
+    def test_filter_by_field_and_value(self):
+        self.state.subscribe(self.changes.append, fields='left_door', new=DoorState.OPEN)
+        self.state.set_right_door(DoorState.OPEN)
+        self.state.set_left_door(DoorState.ERROR)
+        self.state.set_left_door(DoorState.OPEN)
+        self.assertTrue(self.state.wait_notified(1))
+        self.assertEqual(len(self.changes), 1)
+        change = self.changes[0]
+        self.assertEqual(change.fields, ('left_door',))
+        self.assertEqual(change.previous.left_door, DoorState.ERROR)
+        self.assertEqual(change.current, self.state.snapshot())
+
+    def test_changes_are_delivered_in_order(self):
+        self.state.subscribe(lambda change: self.changes.append(change.current.left_motor), fields='left_motor')
+        sequence = [MotorState.OPENING, MotorState.STOPPED, MotorState.CLOSING, MotorState.STOPPED] * 50
+        for motor in sequence:
+            self.state.set_left_motor(motor)
+        self.state.wait_notified(1)
+        self.assertEqual(self.changes, sequence)
+
+    def test_transition_is_one_change_and_unchanged_sets_are_silent(self):
+        self.state.subscribe(self.changes.append)
+        self.state.set_left_door(DoorState.CLOSED)
+        self.state.transition(left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+        self.state.wait_notified(1)
+        self.assertEqual([c.fields for c in self.changes], [('left_motor', 'right_motor')])
+
+    def test_failing_callback_does_not_stop_delivery(self):
+        def broken(change):
+            raise RuntimeError("kaputt")
+        self.state.subscribe(broken)
+        subscription = self.state.subscribe(self.changes.append)
+        self.state.set_paket_tuer(DoorState.OPEN)
+        self.state.wait_notified(1)
+        self.state.unsubscribe(subscription)
+        self.state.set_paket_tuer(DoorState.CLOSED)
+        self.state.wait_notified(1)
+        self.assertEqual(len(self.changes), 1)
+
+    def test_error_state_is_published_once_on_entering_and_leaving(self):
+        import paketbox
+        mqtt_mock = MagicMock()
+        with patch.object(paketbox.controller, 'publisher', mqtt_mock):
+            self.state.subscribe(paketbox.fehlerzustand_geaendert, new=paketbox.ERROR_VALUES)
+            self.state.subscribe(paketbox.fehlerzustand_geaendert, old=paketbox.ERROR_VALUES)
+            self.state.transition(left_door=DoorState.ERROR, right_door=DoorState.ERROR,
+                                  left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+            self.state.set_paket_tuer(DoorState.ERROR)
+            self.state.transition(left_door=DoorState.CLOSED, right_door=DoorState.CLOSED,
+                                  paket_tuer=DoorState.CLOSED, left_motor=MotorState.STOPPED,
+                                  right_motor=MotorState.STOPPED)
+            self.state.wait_notified(1)
+        messages = [call.args[1] for call in mqtt_mock.publish.call_args_list if call.args[0] == Event.STATUS]
+        self.assertEqual(len(messages), 2)
+        self.assertIn("FEHLER Paketbox", messages[0])
+        self.assertIn("wieder bereit", messages[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+from unittest.mock import patch
+
+from Clock import VirtualClock
+from TimerManager import Timer, use_clock
+from GpioSimulator import SimulatedGPIO
+from InputEngine import InputEngine, MODE_INTERRUPT
+from PaketBoxState import DoorState, MotorState
+from state import pbox_state
+from config import Config
+import paketbox
+import handler
+
+
+class SimulationHarness:
+    """Runs the real control stack (InputEngine, pinChanged, handler timers) on a
+    SimulatedGPIO in virtual time."""
+
+    def __init__(self, **sim_options):
+        self.clock = VirtualClock()
+        self.previous_clock = use_clock(self.clock)
+        self.gpio = SimulatedGPIO(clock=self.clock, **sim_options)
+        self.gpio_patch = patch.object(paketbox.controller, 'gpio', self.gpio)
+        self.gpio_patch.start()
+        self.engine = InputEngine(self.gpio, Config.INPUTS, paketbox.pinChanged,
+                                  mode=MODE_INTERRUPT, clock=self.clock)
+        levels = paketbox.initialize_door_states()
+        pbox_state.set_left_motor(MotorState.STOPPED)
+        pbox_state.set_right_motor(MotorState.STOPPED)
+        self.engine.start(levels)
+
+    def run(self, seconds):
+        """Main loop for seconds of virtual time"""
+        target = self.clock.now() + seconds
+        while self.clock.now() < target:
+            self.engine.wait(limit=target - self.clock.now())
+            self.engine.sample()
+
+    def at(self, delay, action, *args):
+        """Schedule a physical action (door, fault) delay seconds from now"""
+        Timer(delay, action, args=list(args), scheduler=self.gpio.scheduler).start()
+
+    def close(self):
+        handler.timer_manager.cancel_all_timers()
+        self.gpio_patch.stop()
+        use_clock(self.previous_clock)
+
+    def delivery(self):
+        """Courier opens the door, puts a parcel in and closes it again"""
+        self.gpio.open_courier_door()
+        self.run(30)
+        self.gpio.close_courier_door()
+
+    def cycle_time(self):
+        """Door closed -> delayed open -> opening check -> closing check"""
+        return 10 + 2 * (Config.CLOSURE_TIMER_SECONDS + 1) + 1
+
+
+class TestSimulatedGPIO(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.gpio = SimulatedGPIO(clock=self.clock, travel_time=20)
+        self.left_closed, self.left_open = Config.INPUTS[0], Config.INPUTS[1]
+
+    def test_flap_travels_and_flips_end_switches(self):
+        """Driving the open relay moves the flap and flips both end switches"""
+        self.assertEqual(self.gpio.input(self.left_closed), self.gpio.LOW)
+        self.gpio.output(Config.OUTPUTS[1], self.gpio.LOW)
+        self.assertEqual(self.gpio.input(self.left_closed), self.gpio.HIGH)
+
+        self.clock.advance(19.9)
+        self.assertEqual(self.gpio.input(self.left_open), self.gpio.HIGH)
+        self.clock.advance(0.1)
+        self.assertEqual(self.gpio.input(self.left_open), self.gpio.LOW)
+
+    def test_relay_released_midway_stops_the_flap(self):
+        """Releasing the relay freezes the position; resuming needs only the rest of the way"""
+        self.gpio.output(Config.OUTPUTS[1], self.gpio.LOW)
+        self.clock.advance(5)
+        self.gpio.output(Config.OUTPUTS[1], self.gpio.HIGH)
+        self.clock.advance(60)
+        self.assertAlmostEqual(self.gpio.flaps[0].position, 0.25)
+
+        self.gpio.output(Config.OUTPUTS[1], self.gpio.LOW)
+        self.clock.advance(15)
+        self.assertEqual(self.gpio.input(self.left_open), self.gpio.LOW)
+
+    def test_locked_door_cannot_be_opened(self):
+        """The courier door only opens while the lock relay is released"""
+        self.gpio.output(Config.OUTPUTS[7], self.gpio.LOW)
+        self.assertFalse(self.gpio.open_courier_door())
+        self.gpio.output(Config.OUTPUTS[7], self.gpio.HIGH)
+        self.assertTrue(self.gpio.open_courier_door())
+        self.assertEqual(self.gpio.input(Config.INPUTS[4]), self.gpio.HIGH)
+
+    def test_stuck_input_ignores_physical_changes(self):
+        """A stuck switch keeps reporting its stuck level"""
+        self.gpio.stick_input(0, self.gpio.LOW)
+        self.gpio.output(Config.OUTPUTS[1], self.gpio.LOW)
+        self.clock.advance(20)
+        self.assertEqual(self.gpio.input(self.left_closed), self.gpio.LOW)
+
+
+class TestSimulatedDeliveryCycle(unittest.TestCase):
+    def setUp(self):
+        self.sim = SimulationHarness(travel_time=20)
+
+    def tearDown(self):
+        self.sim.close()
+
+    def test_delivery_cycle_on_simulated_hardware(self):
+        """A full delivery moves the flaps down and up again and unlocks the door"""
+        self.sim.delivery()
+        self.sim.run(10 + Config.CLOSURE_TIMER_SECONDS)
+        self.assertTrue(self.sim.gpio.door_locked())
+        self.assertEqual([flap.position for flap in self.sim.gpio.flaps], [1.0, 1.0])
+        self.sim.run(Config.CLOSURE_TIMER_SECONDS + 3)
+
+        self.assertTrue(pbox_state.is_all_closed())
+        self.assertTrue(pbox_state.are_both_motors_stopped())
+        self.assertFalse(pbox_state.is_any_error())
+        self.assertFalse(self.sim.gpio.door_locked())
+        self.assertEqual([flap.position for flap in self.sim.gpio.flaps], [0.0, 0.0])
+
+    def test_stalled_motor_is_detected(self):
+        """A stalled left motor leads to the ERROR state after the opening check"""
+        self.sim.gpio.stall_motor(0)
+        self.sim.delivery()
+        self.sim.run(self.sim.cycle_time())
+
+        self.assertEqual(pbox_state.left_door, DoorState.ERROR)
+        self.assertTrue(pbox_state.is_any_motor_error())
+
+    def test_bouncing_door_contact_yields_single_event(self):
+        """Contact bounce on the courier door produces exactly one open and one close"""
+        self.sim.close()
+        self.sim = SimulationHarness(travel_time=20, bounce_count=5, bounce_period=0.003)
+        with patch.object(paketbox.controller, 'Paket_Tuer_Zusteller_geoeffnet') as geoeffnet, \
+             patch.object(paketbox.controller, 'Paket_Tuer_Zusteller_geschlossen') as geschlossen:
+            self.sim.delivery()
+            self.sim.run(1)
+        geoeffnet.assert_called_once()
+        geschlossen.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import mqtt
+from mqtt import Event
+from PaketBoxState import PaketBoxState, DoorState, MotorState
+from StateDocument import StateDocument
+from config import Config
+
+
+class TestStateDocument(unittest.TestCase):
+    def setUp(self):
+        self.state = PaketBoxState()
+        self.publisher = MagicMock()
+        patcher = patch.object(mqtt, '_connect_callbacks', [])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.document = StateDocument(self.state, self.publisher)
+        self.document.attach()
+
+    def published(self, event):
+        self.state.wait_notified(1)
+        return [json.loads(c.args[1]) for c in self.publisher.publish.call_args_list if c.args[0] == event]
+
+    def test_document_has_all_fields_in_stable_order(self):
+        document = self.published(Event.STATE)[0]
+        self.assertEqual(list(document), ['boot', 'seq', 'left_door', 'right_door', 'paket_tuer',
+                                          'left_motor', 'right_motor'])
+        self.assertEqual(document['seq'], 0)
+        self.assertEqual(document['left_door'], 'CLOSED')
+
+    def test_deltas_carry_only_changed_fields_and_a_sequence(self):
+        self.state.set_paket_tuer(DoorState.OPEN)
+        self.state.transition(left_door=DoorState.OPEN, left_motor=MotorState.OPENING)
+        self.state.set_paket_tuer(DoorState.OPEN)  # keine Änderung, kein Delta
+        self.assertEqual(self.published(Event.STATE_DELTA),
+                         [{'seq': 1, 'paket_tuer': 'OPEN'},
+                          {'seq': 2, 'left_door': 'OPEN', 'left_motor': 'OPENING'}])
+        document = self.published(Event.STATE)[-1]
+        self.assertEqual((document['seq'], document['left_motor']), (2, 'OPENING'))
+
+    def test_document_is_sent_again_on_reconnect(self):
+        mqtt.mqtt_connect(MagicMock(), None, None, 0)
+        self.assertEqual(len(self.published(Event.STATE)), 2)
+
+
+class TestRetainedTopic(unittest.TestCase):
+    def test_state_topic_is_published_retained(self):
+        client = MagicMock()
+        publisher = mqtt.Publisher()
+        with patch.object(mqtt, 'MQTT_AVAILABLE', True), patch.object(mqtt, '_client', client):
+            publisher.publish(Event.STATE, '{}')
+            publisher.publish(Event.STATE_DELTA, '{}')
+            self.assertTrue(mqtt.flush(1))
+        self.assertEqual([c.kwargs for c in client.publish.call_args_list], [{'retain': True}, {}])
+        self.assertEqual(client.publish.call_args_list[0].args[0], Config.MQTT_TOPIC_STATE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import threading
+import time
+
+from TimerManager import TimerScheduler, Timer, TimerManager
+
+
+class TestTimerScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = TimerScheduler()
+
+    def test_timers_run_in_deadline_order(self):
+        """Timers fire in deadline order, not in scheduling order"""
+        fired = []
+        done = threading.Event()
+        Timer(0.06, lambda: (fired.append('c'), done.set()), scheduler=self.scheduler).start()
+        Timer(0.02, lambda: fired.append('a'), scheduler=self.scheduler).start()
+        Timer(0.04, lambda: fired.append('b'), scheduler=self.scheduler).start()
+
+        self.assertTrue(done.wait(2.0))
+        self.assertEqual(fired, ['a', 'b', 'c'])
+
+    def test_cancelled_timer_does_not_fire(self):
+        """A cancelled timer never runs and reports it was cancelled"""
+        fired = threading.Event()
+        timer = Timer(0.05, fired.set, scheduler=self.scheduler)
+        timer.start()
+        self.assertTrue(timer.cancel())
+        self.assertFalse(fired.wait(0.2))
+        self.assertFalse(timer.is_alive())
+        self.assertFalse(timer.cancel())
+
+    def test_many_timers_share_one_thread(self):
+        """Scheduling many timers does not create a thread per timer"""
+        threads_before = threading.active_count()
+        timers = [Timer(60, lambda: None, scheduler=self.scheduler) for _ in range(100)]
+        for timer in timers:
+            timer.start()
+        self.assertLessEqual(threading.active_count(), threads_before + 1)
+        self.assertEqual(self.scheduler.pending(), 100)
+
+        for timer in timers:
+            timer.cancel()
+        self.assertEqual(self.scheduler.pending(), 0)
+        self.assertLess(len(self.scheduler._heap), 100)  # compacted
+
+    def test_exception_in_callback_keeps_scheduler_running(self):
+        """A failing callback is logged and later timers still fire"""
+        fired = threading.Event()
+        def broken():
+            raise RuntimeError("Hardwarefehler")
+        Timer(0.01, broken, scheduler=self.scheduler).start()
+        Timer(0.03, fired.set, scheduler=self.scheduler).start()
+        with self.assertLogs('TimerManager', level='ERROR'):
+            self.assertTrue(fired.wait(2.0))
+
+
+class TestTimerManager(unittest.TestCase):
+    def test_cancel_all_timers_is_final(self):
+        """After cancel_all_timers() none of the managed timers fires"""
+        scheduler = TimerScheduler()
+        manager = TimerManager()
+        fired = []
+        for timer_id in ('left_motor', 'right_motor', 'left_check'):
+            timer = Timer(0.05, fired.append, args=[timer_id], scheduler=scheduler)
+            timer.start()
+            manager.add_timer(timer_id, timer)
+
+        manager.cancel_all_timers()
+        time.sleep(0.15)
+
+        self.assertEqual(fired, [])
+        self.assertTrue(all(t is None for t in manager.active_timers.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import threading
+import asyncio
+from unittest.mock import MagicMock
+
+from Clock import VirtualClock
+from TimerManager import Timer, TimerScheduler, LoopScheduler
+from TransitionHistory import TransitionHistory, KIND_EDGE, CAUSE_INPUT, CAUSE_TIMER, CAUSE_OTHER
+from PaketBoxState import PaketBoxState, DoorState, MotorState
+from PaketBoxController import PaketBoxController
+
+
+class TestTransitionHistory(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.history = TransitionHistory(8, clock=self.clock)
+        self.state = PaketBoxState()
+        self.state.attach_history(self.history)
+
+    def test_ring_buffer_keeps_the_last_entries_in_constant_memory(self):
+        sizes = len(self.history._time), len(self.history._entry)
+        for i in range(20):
+            self.clock.advance(1)
+            self.history.record_edge(i % 11, 0, 1)
+        self.assertEqual((len(self.history._time), len(self.history._entry)), sizes)
+        self.assertEqual(self.history.count, 20)
+        entries = self.history.entries()
+        self.assertEqual([e[0] for e in entries], list(range(13, 21)))
+        self.assertEqual([e[0] for e in self.history.entries(last=3)], [18, 19, 20])
+        self.assertTrue(all(e[1] == KIND_EDGE for e in entries))
+
+    def test_concurrent_writers_keep_count_and_entries_consistent(self):
+        history = TransitionHistory(64)
+        def write():
+            for i in range(2000):
+                history.record_edge(i % 11, 0, 1)
+        writers = [threading.Thread(target=write) for _ in range(4)]
+        for w in writers:
+            w.start()
+        for w in writers:
+            w.join()
+        self.assertEqual(history.count, 8000)
+        entries = history.entries()
+        self.assertEqual(len(entries), 64)
+        self.assertTrue(all(e[1] == KIND_EDGE and e[5] == CAUSE_INPUT + e[2] for e in entries))
+
+    def test_state_updates_are_decoded_per_field(self):
+        self.state.set_left_door(DoorState.OPEN)
+        self.state.transition(left_motor=MotorState.ERROR, right_motor=MotorState.ERROR)
+        self.state.set_left_door(DoorState.OPEN)  # no change, not recorded
+        self.assertEqual(self.history.count, 2)
+        events = self.history.decode()
+        self.assertEqual([(e['field'], e['old'], e['new']) for e in events],
+                         [('left_door', 'CLOSED', 'OPEN'),
+                          ('left_motor', 'STOPPED', 'ERROR'), ('right_motor', 'STOPPED', 'ERROR')])
+        self.assertEqual({e['cause'] for e in events}, {self.history.cause_name(CAUSE_OTHER)})
+
+    def test_timer_thread_is_recorded_as_cause(self):
+        done = threading.Event()
+        def stop():
+            self.state.set_left_motor(MotorState.STOPPED)
+            done.set()
+        self.state.set_left_motor(MotorState.OPENING)
+        Timer(0.01, stop, scheduler=TimerScheduler()).start()
+        self.assertTrue(done.wait(2))
+        self.assertEqual(self.history.decode()[-1]['cause'], self.history.cause_name(CAUSE_TIMER))
+
+    def test_loop_timer_is_recorded_as_cause(self):
+        """Under the asyncio runtime timers run on the loop thread and still count as timer"""
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        self.state.set_left_motor(MotorState.OPENING)
+        async def scenario():
+            Timer(0.01, self.state.set_left_motor, [MotorState.STOPPED], scheduler=LoopScheduler(loop)).start()
+            await asyncio.sleep(0.05)
+        loop.run_until_complete(scenario())
+        self.assertEqual(self.history.decode()[-1]['cause'], self.history.cause_name(CAUSE_TIMER))
+        self.assertEqual(self.history.current_cause(), CAUSE_OTHER)
+
+    def test_other_threads_are_not_attributed_to_the_dispatched_input(self):
+        self.history.record_edge(4, 0, 1)
+        other = threading.Thread(target=self.state.set_right_door, args=(DoorState.OPEN,))
+        other.start()
+        other.join()
+        self.state.set_left_door(DoorState.OPEN)
+        self.history.dispatch = None
+        self.assertEqual([e['cause'] for e in self.history.decode()[1:]],
+                         [self.history.cause_name(CAUSE_OTHER), self.history.cause_name(CAUSE_INPUT + 4)])
+
+    def test_pinChanged_records_edge_and_attributes_handler_updates(self):
+        controller = PaketBoxController(MagicMock(), state=self.state, history=self.history)
+        controller.pinChanged(0, 1, 0)  # left flap reached closed position
+        controller.pinChanged(1, 1, 0)  # left flap reached open position
+        events = self.history.decode()
+        self.assertEqual(events[0]['field'], 'input0')
+        self.assertEqual(events[-1], {'t': 0.0, 'field': 'left_door', 'old': 'CLOSED', 'new': 'OPEN',
+                                      'cause': self.history.cause_name(CAUSE_INPUT + 1)})
+        self.assertEqual(self.history.current_cause(), CAUSE_OTHER)
+
+
+if __name__ == '__main__':
+    unittest.main()